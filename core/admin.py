@@ -13,6 +13,8 @@ from django.contrib.auth.models import User, Group
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.forms import UserCreationForm
 from django import forms
+from core import metrics
+from core.db_router import read_from_replica, replica
 from core.permissions import CashierPermissions
 import io
 from contextlib import redirect_stdout
@@ -155,6 +157,7 @@ class CashierManagementView(View):
     """Custom admin view for cashier management"""
 
     @method_decorator(staff_member_required)
+    @method_decorator(read_from_replica)
     def get(self, request):
         """Show the cashier management page"""
         # Get cashier statistics
@@ -226,6 +229,7 @@ class QuickCashierCreationView(View):
     """Quick cashier creation view for admin"""
 
     @method_decorator(staff_member_required)
+    @method_decorator(read_from_replica)
     def get(self, request):
         """Show quick cashier creation form"""
         context = {
@@ -282,6 +286,7 @@ class DataResetAdminView(View):
     """Custom admin view for resetting demo data"""
 
     @method_decorator(staff_member_required)
+    @method_decorator(read_from_replica)
     def get(self, request):
         """Show the data reset confirmation page"""
         context = {
@@ -331,20 +336,51 @@ class DataResetAdminView(View):
             return redirect('admin:data_reset')
 
 
+class SlowRoutesAdminView(View):
+    """Admin page listing the slowest routes and WebSocket handlers of this worker"""
+
+    SORT_OPTIONS = [('p95', 'p95 latency'), ('avg', 'Average latency'), ('max', 'Max latency'),
+                    ('total', 'Total time'), ('queries', 'Queries')]
+
+    @method_decorator(staff_member_required)
+    def get(self, request):
+        order = request.GET.get('order', 'p95')
+        routes = metrics.slow_routes(order_by=order)
+        for row in routes:
+            row['avg_kb'] = row['avg_bytes'] / 1024
+        websockets = metrics.websocket_summary()
+        for row in websockets:
+            row['sent_kb'] = row['sent_bytes'] / 1024
+
+        context = {
+            'title': 'Slow Routes',
+            'site_title': admin.site.site_title,
+            'site_header': admin.site.site_header,
+            'has_permission': True,
+            'routes': routes,
+            'websockets': websockets,
+            'order': order,
+            'sort_options': self.SORT_OPTIONS,
+            'slow_ms': 500,
+        }
+        return render(request, 'admin/slow_routes.html', context)
+
+
 class StatsAPIView(View):
     """API view to get quick stats for admin dashboard"""
 
     @method_decorator(staff_member_required)
+    @method_decorator(read_from_replica)
     def get(self, request):
         """Return quick stats as JSON"""
-        from django.utils import timezone
         from vendors.models import Table
+        from orders.business_dates import current_business_date
         from orders.models import Order
 
-        today = timezone.now().date()
+        today = current_business_date()
 
         stats = {
-            'orders_today': Order.objects.filter(created_at__date=today).count(),
+            'orders_today': Order.objects.filter(business_date=today).count(),
             'unpaid_orders': Order.objects.filter(status__in=['delivered', 'ready']).count(),
             'active_tables': Table.objects.filter(
                 orders__status__in=['pending', 'confirmed', 'preparing']
@@ -365,6 +401,7 @@ def get_custom_admin_urls():
         path('cashier-management/', CashierManagementView.as_view(), name='cashier_management'),
         path('quick-cashier/', QuickCashierCreationView.as_view(), name='quick_cashier_creation'),
         path('api/stats/', StatsAPIView.as_view(), name='stats_api'),
+        path('slow-routes/', SlowRoutesAdminView.as_view(), name='slow_routes'),
     ]
     return custom_urls
 
@@ -390,8 +427,8 @@ original_index = admin.site.index
 
 def enhanced_index(request, extra_context=None):
     """Enhanced index method that adds demo data management context"""
-    from django.utils import timezone
     from vendors.models import Table
+    from orders.business_dates import current_business_date
     from orders.models import Order
 
     extra_context = extra_context or {}
@@ -399,21 +436,22 @@ def enhanced_index(request, extra_context=None):
     extra_context['show_cashier_management'] = True
 
     # Add real stats to context
-    today = timezone.now().date()
-
-    # Get cashier statistics
-    cashier_group = Group.objects.filter(name='Cashier').first()
-    total_cashiers = User.objects.filter(groups=cashier_group).count() if cashier_group else 0
-
-    extra_context.update({
-        'orders_today': Order.objects.filter(created_at__date=today).count(),
-        'unpaid_orders': Order.objects.filter(status__in=['delivered', 'ready']).count(),
-        'active_tables': Table.objects.filter(
-            orders__status__in=['pending', 'confirmed', 'preparing']
-        ).distinct().count(),
-        'total_orders': Order.objects.count(),
-        'total_cashiers': total_cashiers,
-    })
+    today = current_business_date()
+
+    with replica():
+        # Get cashier statistics
+        cashier_group = Group.objects.filter(name='Cashier').first()
+        total_cashiers = User.objects.filter(groups=cashier_group).count() if cashier_group else 0
+
+        extra_context.update({
+            'orders_today': Order.objects.filter(business_date=today).count(),
+            'unpaid_orders': Order.objects.filter(status__in=['delivered', 'ready']).count(),
+            'active_tables': Table.objects.filter(
+                orders__status__in=['pending', 'confirmed', 'preparing']
+            ).distinct().count(),
+            'total_orders': Order.objects.count(),
+            'total_cashiers': total_cashiers,
+        })
 
     return original_index(request, extra_context)
 
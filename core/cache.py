@@ -0,0 +1,261 @@
+"""
+Cache tier: Redis with a local-memory fallback, and namespaced, versioned keys.
+
+`FailoverRedisCache` is the CACHES backend. It talks to Redis through
+Django's RedisCache. When a call fails with a connection error, the alias
+serves from a process-local LocMemCache for CACHE_RETRY_INTERVAL seconds and
+then tries Redis again. Redis being down costs a cold cache, never a 500.
+Values written during an outage live only in that process. Values that were
+invalidated during an outage can come back from Redis afterwards until their
+timeout, so keep timeouts on invalidated data short.
+
+An alias with `'FALLBACK': 'miss'` (the sessions cache) has no local copy:
+during an outage reads miss, so cached_db sessions come from the database, and
+writes are dropped. The keys those writes touched are deleted from Redis
+before it is used again, so a session that was changed, cycled or logged out
+meanwhile cannot come back in its old state.
+
+Callers group keys into namespaces:
+
+    payload = cache_utils.get_or_build('menu', ('food',), build, timeout=3600)
+    cache_utils.invalidate('menu')   # after commit: every 'menu' key is retired
+
+Each namespace has a version stored in the cache. Keys embed it, so bumping it
+retires everything in the namespace at once without scanning for keys.
+Hits and misses are counted per namespace label (the part before the first
+":", so 'vendor_report:12' counts as 'vendor_report') and reported by
+`stats()`.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+
+from core.db_router import primary
+
+logger = logging.getLogger(__name__)
+
+_stats_lock = threading.Lock()
+_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+
+class FailoverRedisCache(BaseCache):
+    """RedisCache that degrades to a process-local LocMemCache while Redis is unreachable"""
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+        self._errors = (RedisConnectionError, RedisTimeoutError, ConnectionError, OSError)
+        self._redis = RedisCache(server, params)
+        self.fallback = params.get('FALLBACK', 'local')
+        self._local = None
+        if self.fallback == 'local':
+            self._local = LocMemCache(f'fallback:{server}', {
+                **params,
+                'OPTIONS': params.get('FALLBACK_OPTIONS', {}),
+            })
+        # (key, version) pairs written while Redis was down, in 'miss' mode
+        self._stale = set()
+        self.retry_interval = params.get('RETRY_INTERVAL', getattr(settings, 'CACHE_RETRY_INTERVAL', 30))
+        self._down_until = 0.0
+        self.failures = 0
+        self.last_error = None
+
+    @property
+    def active(self):
+        return self.fallback if time.monotonic() < self._down_until else 'redis'
+
+    def _call(self, method, *args, **kwargs):
+        if time.monotonic() >= self._down_until:
+            try:
+                if self.last_error is not None:
+                    self._recover()
+                return getattr(self._redis, method)(*args, **kwargs)
+            except self._errors as e:
+                self._mark_down(e)
+        if self._local is None:
+            return self._miss(method, *args, **kwargs)
+        return getattr(self._local, method)(*args, **kwargs)
+
+    def _mark_down(self, error):
+        if self.last_error is None:
+            serving = 'using local memory' if self._local is not None else 'treating reads as misses'
+            logger.warning(f"Cache Redis unavailable ({error}) - {serving} for {self.retry_interval}s")
+        self.failures += 1
+        self.last_error = str(error)
+        self._down_until = time.monotonic() + self.retry_interval
+
+    def _recover(self):
+        # Retire what was written during the outage before Redis serves it again
+        stale = set(self._stale)
+        versions = defaultdict(list)
+        for key, version in stale:
+            versions[version].append(key)
+        for version, keys in versions.items():
+            self._redis.delete_many(keys, version=version)
+        self._stale -= stale
+
+        logger.info("Cache Redis reachable again")
+        self.last_error = None
+        if self._local is not None:
+            # Don't let values from this outage resurface during the next one
+            self._local.clear()
+
+    def _miss(self, method, *args, **kwargs):
+        """Answer a call the way an empty cache that keeps nothing would"""
+        version = kwargs.get('version')
+        if method in ('add', 'set', 'touch', 'delete'):
+            self._stale.add((args[0], version))
+        elif method in ('set_many', 'delete_many'):
+            self._stale.update((key, version) for key in args[0])
+
+        if method == 'get':
+            return args[1]
+        if method == 'get_many':
+            return {}
+        if method == 'incr':
+            raise ValueError(f"Key '{args[0]}' not found")
+        if method == 'add':
+            # Report success: failing would make cache-only session stores retry
+            # new keys until they give up with a 500
+            return True
+        if method == 'set_many':
+            return []
+        return False if method in ('touch', 'delete', 'has_key') else None
+
+    def status(self):
+        return {'active': self.active, 'failures': self.failures, 'last_error': self.last_error}
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('add', key, value, timeout, version=version)
+
+    def get(self, key, default=None, version=None):
+        return self._call('get', key, default, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('set', key, value, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('touch', key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        return self._call('delete', key, version=version)
+
+    def get_many(self, keys, version=None):
+        return self._call('get_many', keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self._call('has_key', key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._call('incr', key, delta, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call('set_many', data, timeout, version=version)
+
+    def delete_many(self, keys, version=None):
+        return self._call('delete_many', keys, version=version)
+
+    def clear(self):
+        return self._call('clear')
+
+    def close(self, **kwargs):
+        self._redis.close(**kwargs)
+
+
+# Namespaces
+
+def _version_key(namespace):
+    return f'ns:{namespace}'
+
+
+def version(namespace, cache=default_cache):
+    """Current version of a namespace, created on first use"""
+    current = cache.get(_version_key(namespace))
+    if current is None:
+        cache.add(_version_key(namespace), 1, None)
+        current = cache.get(_version_key(namespace), 1)
+    return current
+
+
+def bump(namespace, cache=default_cache):
+    """Retire every key in the namespace now"""
+    key = _version_key(namespace)
+    if cache.add(key, 2, None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 2, None)
+
+
+def invalidate(*namespaces, cache=default_cache):
+    """Retire the namespaces once the current transaction commits"""
+    if namespaces:
+        transaction.on_commit(lambda: [bump(namespace, cache) for namespace in namespaces])
+
+
+def make_key(namespace, parts=(), versioned=True, cache=default_cache):
+    key = namespace
+    if versioned:
+        key += f':v{version(namespace, cache)}'
+    return ':'.join([key, *map(str, parts)])
+
+
+def _label(namespace):
+    return namespace.split(':', 1)[0]
+
+
+def record(namespace, hit):
+    """Count a hit or miss; for callers that manage their own keys"""
+    with _stats_lock:
+        _stats[_label(namespace)]['hits' if hit else 'misses'] += 1
+
+
+def get(namespace, parts=(), versioned=True, cache=default_cache):
+    """Cached value for `parts` in the namespace, or None"""
+    value = cache.get(make_key(namespace, parts, versioned, cache))
+    record(namespace, value is not None)
+    return value
+
+
+def get_or_build(namespace, parts, build, timeout, versioned=True, cache=default_cache):
+    """
+    Cached value for `parts` in the namespace, calling `build()` and caching
+    its result on a miss. `versioned=False` skips the version lookup for data
+    the namespace's invalidation never needs to reach. `build()` reads from
+    the primary, because its result is shared until the next version bump.
+    """
+    key = make_key(namespace, parts, versioned, cache)
+    value = cache.get(key)
+    record(namespace, value is not None)
+    if value is None:
+        with primary():
+            value = build()
+        cache.set(key, value, timeout)
+    return value
+
+
+def stats():
+    """Hit/miss counters per namespace label, and each cache alias' backend state"""
+    from django.core.cache import caches
+
+    with _stats_lock:
+        namespaces = {
+            label: {**counts, 'hit_rate': round(counts['hits'] / max(1, counts['hits'] + counts['misses']), 3)}
+            for label, counts in sorted(_stats.items())
+        }
+    backends = {}
+    for alias in settings.CACHES:
+        backend = caches[alias]
+        backends[alias] = backend.status() if hasattr(backend, 'status') else {'active': type(backend).__name__}
+    return {'namespaces': namespaces, 'backends': backends}
@@ -0,0 +1,275 @@
+"""
+Channel layer with runtime Redis / in-memory failover.
+
+Settings only describe the layer; nothing connects at import time, so process
+start, management commands and tests never wait on Redis. The first time the
+layer is used, a daemon thread starts pinging Redis every `health_interval`
+seconds:
+
+* mode "auto" uses Redis while it answers and a process-local
+  InMemoryChannelLayer while it does not. A Redis call that fails with a
+  connection error also switches straight away. Switching back needs
+  `recovery_checks` consecutive good pings, so a flapping Redis doesn't
+  bounce every socket.
+* mode "redis" or "memory" sticks to one backend. The health check still
+  runs for "redis" so the status endpoint can report it, and channels_redis
+  reconnects by itself.
+
+Channels and group memberships live in the backend that created them, so a
+switch strands every open consumer. Channel names carry the generation they
+were created in. `receive()` on a stale channel, or one still waiting when the
+switch happens, returns a `channel_layer.switched` event; consumers close with
+1012 (service restart) and the client reconnects and re-subscribes on the new
+backend.
+"""
+import asyncio
+import logging
+import re
+import threading
+import time
+
+from channels.layers import BaseChannelLayer, InMemoryChannelLayer
+
+logger = logging.getLogger(__name__)
+
+REDIS = 'redis'
+MEMORY = 'memory'
+SWITCHED_EVENT = 'channel_layer.switched'
+
+_GENERATION = re.compile(r'^g(\d+)\.')
+
+
+def _connection_errors():
+    errors = (ConnectionError, OSError, asyncio.TimeoutError)
+    try:
+        from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+    except ImportError:
+        return errors
+    return errors + (RedisConnectionError, RedisTimeoutError)
+
+
+def _redis_client(host):
+    """Synchronous client for health checks from a channels_redis `hosts` entry"""
+    import redis
+
+    options = {'socket_timeout': 1, 'socket_connect_timeout': 1}
+    if isinstance(host, dict):
+        host = host.get('address', host)
+    if isinstance(host, str):
+        return redis.Redis.from_url(host, **options)
+    if isinstance(host, (tuple, list)):
+        return redis.Redis(host=host[0], port=host[1], **options)
+    return redis.Redis(**host, **options)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class FailoverChannelLayer(BaseChannelLayer):
+    """Proxy to a Redis or in-memory channel layer, whichever is currently healthy"""
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, mode='auto', redis=None, memory=None, health_interval=5, recovery_checks=3, **kwargs):
+        self.memory_config = memory or {}
+        self.redis_config = redis or {}
+        super().__init__(
+            expiry=self.memory_config.get('expiry', 60),
+            capacity=self.memory_config.get('capacity', 100),
+        )
+        self.mode = mode
+        self.health_interval = health_interval
+        self.recovery_checks = recovery_checks
+
+        self._lock = threading.Lock()
+        self._monitor = None
+        self._redis_layer = None
+        # Per event loop: a future resolved on the next switch, to wake waiting receives
+        self._waiters = {}
+        # Stale channels already told about the switch
+        self._notified = set()
+
+        self.active = MEMORY if mode == MEMORY else REDIS
+        self.backend = None
+        self.generation = 0
+        self.switches = 0
+        self.redis_healthy = None
+        self.good_checks = 0
+        self.last_check = None
+        self.last_error = None
+
+    # Backends
+
+    def _create(self, kind):
+        if kind == REDIS:
+            if self._redis_layer is None:
+                from channels_redis.core import RedisChannelLayer
+                self._redis_layer = RedisChannelLayer(**self.redis_config)
+            return self._redis_layer
+        # A fresh in-memory layer each time, so nothing stale survives a round trip
+        return InMemoryChannelLayer(**self.memory_config)
+
+    def _current(self):
+        """(backend, generation), creating the backend and starting the health check on first use"""
+        backend, generation = self.backend, self.generation
+        if backend is not None:
+            return backend, generation
+
+        with self._lock:
+            if self.backend is None:
+                try:
+                    self.backend = self._create(self.active)
+                except ImportError as e:
+                    logger.warning(f"channels_redis unavailable ({e}) - using InMemoryChannelLayer")
+                    self.mode = self.active = MEMORY
+                    self.backend = self._create(MEMORY)
+                if self.mode != MEMORY and self._monitor is None:
+                    self._monitor = threading.Thread(target=self._run_health_checks, name='channel-layer-health', daemon=True)
+                    self._monitor.start()
+            return self.backend, self.generation
+
+    def _switch(self, kind, reason):
+        """Swap the active backend; caller holds the lock"""
+        self.active = kind
+        self.backend = self._create(kind)
+        self.generation += 1
+        self.switches += 1
+        waiters, self._waiters = self._waiters, {}
+        for loop, future in waiters.items():
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                pass  # That loop has been closed
+        logger.warning(f"Channel layer switched to {kind} ({reason}); open WebSockets will reconnect")
+
+    # Health
+
+    def _run_health_checks(self):
+        hosts = self.redis_config.get('hosts') or [('127.0.0.1', 6379)]
+        try:
+            client = _redis_client(hosts[0])
+        except Exception as e:
+            logger.error(f"Channel layer health check disabled: {e}")
+            return
+
+        while True:
+            try:
+                client.ping()
+                self._record_check(True)
+            except Exception as e:
+                self._record_check(False, e)
+            time.sleep(self.health_interval)
+
+    def _record_check(self, ok, error=None):
+        """Note a health check (or failed call); returns True if the layer switched"""
+        with self._lock:
+            self.last_check = time.time()
+            if ok:
+                self.redis_healthy = True
+                self.good_checks += 1
+                self.last_error = None
+                if self.mode == 'auto' and self.active == MEMORY and self.good_checks >= self.recovery_checks:
+                    self._switch(REDIS, 'Redis is reachable again')
+                    return True
+                return False
+
+            if self.redis_healthy is not False:
+                logger.warning(f"Channel layer Redis unhealthy: {error}")
+            self.redis_healthy = False
+            self.good_checks = 0
+            self.last_error = str(error)
+            if self.mode == 'auto' and self.active == REDIS:
+                self._switch(MEMORY, f'Redis unavailable: {error}')
+                return True
+            return False
+
+    def status(self):
+        return {
+            'mode': self.mode,
+            'active': self.active,
+            'generation': self.generation,
+            'switches': self.switches,
+            'redis_healthy': self.redis_healthy,
+            'last_check': self.last_check,
+            'last_error': self.last_error,
+        }
+
+    # Channel layer API
+
+    def _generation_of(self, channel):
+        match = _GENERATION.match(channel)
+        return int(match.group(1)) if match else None
+
+    def _switch_waiter(self, generation):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if generation != self.generation:
+                future = loop.create_future()
+                future.set_result(None)
+                return future
+            future = self._waiters.get(loop)
+            if future is None or future.done():
+                future = self._waiters[loop] = loop.create_future()
+            return future
+
+    async def _call(self, method, *args):
+        backend, generation = self._current()
+        try:
+            return await getattr(backend, method)(*args)
+        except _connection_errors() as e:
+            # Retry on the new backend, whether this failure or the health check switched it
+            if not self._record_check(False, e) and self.generation == generation:
+                raise
+        backend, _ = self._current()
+        return await getattr(backend, method)(*args)
+
+    async def new_channel(self, prefix='specific'):
+        backend, generation = self._current()
+        return await backend.new_channel(prefix=f"g{generation}.{prefix.rstrip('.')}")
+
+    async def _switched(self, channel):
+        """The switch event once per stale channel, then nothing until the consumer stops"""
+        if channel not in self._notified:
+            self._notified.add(channel)
+            return {'type': SWITCHED_EVENT}
+        try:
+            await asyncio.get_running_loop().create_future()
+        finally:
+            self._notified.discard(channel)
+
+    async def receive(self, channel):
+        backend, generation = self._current()
+        if self._generation_of(channel) not in (None, generation):
+            return await self._switched(channel)
+
+        switched = self._switch_waiter(generation)
+        received = asyncio.ensure_future(backend.receive(channel))
+        try:
+            await asyncio.wait({received, switched}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not received.done():
+                received.cancel()
+
+        if received.done() and not received.cancelled():
+            try:
+                return received.result()
+            except _connection_errors() as e:
+                self._record_check(False, e)
+        return await self._switched(channel)
+
+    async def send(self, channel, message):
+        return await self._call('send', channel, message)
+
+    async def group_add(self, group, channel):
+        return await self._call('group_add', group, channel)
+
+    async def group_discard(self, group, channel):
+        return await self._call('group_discard', group, channel)
+
+    async def group_send(self, group, message):
+        return await self._call('group_send', group, message)
+
+    async def flush(self):
+        return await self._call('flush')
@@ -0,0 +1,50 @@
+"""
+Database connection pool metrics.
+
+With psycopg 3 and psycopg_pool installed, each PostgreSQL alias gets a
+process-wide `ConnectionPool`, configured from the DB_POOL_* settings. Django
+checks a connection out for each request or `database_sync_to_async` call
+and returns it when the call closes its connection, so the number of server
+connections stays bounded by DB_POOL_MAX_SIZE however many threads daphne
+runs. Other setups keep Django's per-thread persistent connections
+(CONN_MAX_AGE with health checks), reported here as such.
+"""
+import logging
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def pool_stats():
+    """Per-alias pool statistics, or the persistent-connection settings when not pooled"""
+    stats = {}
+    for alias in connections:
+        connection = connections[alias]
+        settings_dict = connection.settings_dict
+        if not settings_dict.get('OPTIONS', {}).get('pool'):
+            stats[alias] = {
+                'mode': 'persistent' if settings_dict.get('CONN_MAX_AGE') else 'per-request',
+                'conn_max_age': settings_dict.get('CONN_MAX_AGE'),
+                'health_checks': settings_dict.get('CONN_HEALTH_CHECKS', False),
+            }
+            continue
+
+        try:
+            # Created lazily by the backend on first use
+            pool = connection.pool
+        except Exception as e:
+            logger.error(f"Connection pool for {alias} unavailable: {e}")
+            stats[alias] = {'mode': 'pool', 'error': str(e)}
+            continue
+        stats[alias] = {
+            'mode': 'pool',
+            'min_size': pool.min_size,
+            'max_size': pool.max_size,
+            'timeout': pool.timeout,
+            'max_lifetime': pool.max_lifetime,
+            'max_idle': pool.max_idle,
+            # pool_size, pool_available, requests_waiting, requests_wait_ms, connections_lost, ...
+            **pool.get_stats(),
+        }
+    return stats
@@ -0,0 +1,136 @@
+"""
+Read-replica routing for dashboards and reports.
+
+Everything goes to `default` unless a block of code opts in with
+`read_from_replica` (a view decorator) or `replica()` (a context manager).
+Then reads go to the REPLICA_DATABASE alias when it is configured. Results
+shared through a cache are built inside `primary()` instead, so a lagging
+replica can't park stale data under a freshly bumped cache version. The flags
+live in context variables, so they follow a request through
+`sync_to_async`/`database_sync_to_async` threads and never leak between
+concurrent requests.
+
+Reads stay on the primary when:
+
+* the request has already written (the first write pins the rest of it);
+* they run inside a transaction on the primary;
+* the client wrote within DATABASE_REPLICA_PIN_SECONDS, which is tracked with
+  a short-lived cookie set by `ReplicaPinMiddleware` so a cashier never
+  reloads a report that lags behind their own action.
+
+Locally, point DB_REPLICA_SQLITE at a copy of db.sqlite3 (or run
+`migrate --database=replica`) to exercise the routing.
+"""
+import functools
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA_DATABASE = 'replica'
+PIN_COOKIE = 'primary_pin'
+
+_use_replica = ContextVar('use_replica', default=False)
+_pinned = ContextVar('pinned_to_primary', default=False)
+
+
+def replica_configured():
+    return REPLICA_DATABASE in settings.DATABASES
+
+
+def pin_to_primary():
+    """Keep every further read in this request/task on the primary"""
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+@contextmanager
+def replica():
+    """Route reads inside the block to the replica (unless pinned)"""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def primary():
+    """Route reads inside the block to the primary, even within a replica block"""
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def read_from_replica(view):
+    """View decorator: serve this view's reads from the replica"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with replica():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def read_alias():
+    """Database alias reads would use right now"""
+    if (
+        _use_replica.get()
+        and not _pinned.get()
+        and replica_configured()
+        and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+    ):
+        return REPLICA_DATABASE
+    return DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    """Send opted-in reads to the replica and every write to the primary"""
+
+    def db_for_read(self, model, **hints):
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A real replica gets its schema through replication; migrating it
+        # explicitly (--database=replica) is only for local test copies
+        return None
+
+
+class ReplicaPinMiddleware:
+    """
+    Start every request unpinned, and keep a client that just wrote on the
+    primary for DATABASE_REPLICA_PIN_SECONDS so it reads its own writes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _pinned.set(bool(request.COOKIES.get(PIN_COOKIE)))
+        try:
+            response = self.get_response(request)
+            if _pinned.get() and replica_configured() and not request.COOKIES.get(PIN_COOKIE):
+                response.set_cookie(
+                    PIN_COOKIE, '1',
+                    max_age=getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5),
+                    httponly=True, samesite='Lax',
+                )
+            return response
+        finally:
+            _pinned.reset(token)
@@ -4,10 +4,10 @@ Converts the init_demo_data.py script into a proper Django management command
 """
 
 from django.core.management.base import BaseCommand, CommandError
-from django.utils import timezone
 from django.contrib.auth.models import User
 from vendors.models import Vendor, Category, MenuItem, Table
-from orders.models import Order, OrderItem
+from orders.business_dates import current_business_date
+from orders.models import ArchivedOrder, Order, OrderItem
 from decimal import Decimal
 import random
 
@@ -77,6 +77,8 @@ class Command(BaseCommand):
         # Delete all orders (this will cascade to OrderItems)
         deleted_orders = Order.objects.all().delete()
         self.stdout.write(f"   Deleted {deleted_orders[0]} orders and related items")
+        deleted_archived = ArchivedOrder.objects.all().delete()
+        self.stdout.write(f"   Deleted {deleted_archived[0]} archived orders and related rows")
 
         # Ensure we have standard tables (but no active orders)
         existing_tables = Table.objects.count()
@@ -107,10 +109,10 @@ class Command(BaseCommand):
         """Verify the system is in clean state"""
         self.stdout.write("\n🔍 Verifying clean state...")
 
-        today = timezone.now().date()
+        today = current_business_date()
 
         # Check orders today
-        orders_today = Order.objects.filter(created_at__date=today).count()
+        orders_today = Order.objects.filter(business_date=today).count()
         self.stdout.write(f"📊 Orders Today: {orders_today}")
 
         # Check unpaid orders
@@ -0,0 +1,439 @@
+"""
+Request and WebSocket instrumentation.
+
+`MetricsMiddleware` times every Django request per (method, route pattern).
+It also counts the SQL each request runs, and the time spent in it, through
+`execute_wrapper` on every database alias, and adds up response bytes.
+`WebSocketMetricsMiddleware` wraps the ASGI WebSocket stack. It records how
+long connects take to be accepted, and how many messages and bytes flow each
+way. It also records how long a consumer spends handling each received
+message, which is the time until it asks for the next one.
+
+Everything is kept in process-local histograms and counters. That is one
+`perf_counter()` pair and a locked dict update per request, and one closure
+call per query. `render_prometheus()` serves them in the Prometheus text
+format at /metrics, together with the pool, channel layer, cache and throttle
+state. `slow_routes()` feeds the admin "Slow routes" page. Like the other
+metrics endpoints, figures are per worker process. Scrape each worker, or
+aggregate them in Prometheus.
+
+Streaming responses (CSV exports) are timed until the response starts. Their
+body size, and the queries run while streaming, are not counted.
+"""
+import bisect
+import re
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+# Seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Queries per request
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+UNMATCHED_ROUTE = '<unmatched>'
+# Cap on distinct WebSocket paths, so probing random URLs can't grow the registry
+MAX_WEBSOCKET_ROUTES = 100
+
+_ID_SEGMENT = re.compile(r'/(?:\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(?=/|$)', re.IGNORECASE)
+
+_lock = threading.Lock()
+_routes = {}
+_websockets = {}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'max')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class RouteMetrics:
+    __slots__ = ('latency', 'queries', 'statuses', 'db_time', 'response_bytes')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.statuses = {}
+        self.db_time = 0.0
+        self.response_bytes = 0
+
+
+class WebSocketMetrics:
+    __slots__ = ('connect', 'handle', 'send', 'accepted', 'rejected', 'open', 'received', 'sent',
+                 'received_bytes', 'sent_bytes')
+
+    def __init__(self):
+        self.connect = Histogram(LATENCY_BUCKETS)
+        self.handle = Histogram(LATENCY_BUCKETS)
+        self.send = Histogram(LATENCY_BUCKETS)
+        self.accepted = 0
+        self.rejected = 0
+        self.open = 0
+        self.received = 0
+        self.sent = 0
+        self.received_bytes = 0
+        self.sent_bytes = 0
+
+
+def enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def route_label(request):
+    """URL pattern the request matched, e.g. /api/place-order/<int:table_number>/"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNMATCHED_ROUTE
+    return '/' + (match.route or '')
+
+
+def websocket_route(path):
+    """Path with numeric and UUID segments collapsed, e.g. /ws/orders/table/:id/"""
+    return _ID_SEGMENT.sub('/:id', path)
+
+
+def _message_size(message):
+    if message.get('bytes') is not None:
+        return len(message['bytes'])
+    if message.get('text') is not None:
+        return len(message['text'])
+    return 0
+
+
+class _QueryTimer:
+    """execute_wrapper counting the queries of one request"""
+
+    __slots__ = ('count', 'time')
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - started
+            self.count += 1
+
+
+def record_request(method, route, status, duration, queries, db_time, response_bytes):
+    with _lock:
+        metrics = _routes.get((method, route))
+        if metrics is None:
+            metrics = _routes[(method, route)] = RouteMetrics()
+        metrics.latency.observe(duration)
+        metrics.queries.observe(queries)
+        metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+        metrics.db_time += db_time
+        metrics.response_bytes += response_bytes
+
+
+class MetricsMiddleware:
+    """Per-route latency, SQL count/time and response size for every request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not enabled():
+            return self.get_response(request)
+
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        size = 0 if response.streaming else len(response.content)
+        record_request(request.method, route_label(request), response.status_code,
+                       duration, timer.count, timer.time, size)
+        return response
+
+
+class WebSocketMetricsMiddleware:
+    """ASGI middleware timing WebSocket connects, message handling and sends"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'websocket' or not enabled():
+            return await self.app(scope, receive, send)
+
+        route = websocket_route(scope['path'])
+        with _lock:
+            if route not in _websockets and len(_websockets) >= MAX_WEBSOCKET_ROUTES:
+                route = UNMATCHED_ROUTE
+            metrics = _websockets.get(route)
+            if metrics is None:
+                metrics = _websockets[route] = WebSocketMetrics()
+
+        state = {'connect': None, 'handling': None, 'accepted': False}
+
+        async def metered_receive():
+            handling = state['handling']
+            if handling is not None:
+                # The consumer finished with the last message and is asking for the next
+                with _lock:
+                    metrics.handle.observe(time.perf_counter() - handling)
+                state['handling'] = None
+            message = await receive()
+            if message['type'] == 'websocket.connect':
+                state['connect'] = time.perf_counter()
+            elif message['type'] == 'websocket.receive':
+                state['handling'] = time.perf_counter()
+                with _lock:
+                    metrics.received += 1
+                    metrics.received_bytes += _message_size(message)
+            return message
+
+        async def metered_send(message):
+            started = time.perf_counter()
+            await send(message)
+            kind = message['type']
+            with _lock:
+                if kind == 'websocket.send':
+                    metrics.send.observe(time.perf_counter() - started)
+                    metrics.sent += 1
+                    metrics.sent_bytes += _message_size(message)
+                elif kind == 'websocket.accept':
+                    if state['connect'] is not None:
+                        metrics.connect.observe(started - state['connect'])
+                    metrics.accepted += 1
+                    metrics.open += 1
+                    state['accepted'] = True
+                elif kind == 'websocket.close' and not state['accepted']:
+                    metrics.rejected += 1
+
+        try:
+            return await self.app(scope, metered_receive, metered_send)
+        finally:
+            if state['accepted']:
+                with _lock:
+                    metrics.open -= 1
+
+
+def slow_routes(limit=None, order_by='p95'):
+    """Routes sorted slowest first, with per-request averages"""
+    limit = limit or getattr(settings, 'METRICS_SLOW_ROUTES', 20)
+    with _lock:
+        rows = []
+        for (method, route), metrics in _routes.items():
+            count = metrics.latency.count
+            rows.append({
+                'method': method,
+                'route': route,
+                'count': count,
+                'avg_ms': metrics.latency.sum / count * 1000,
+                'p95_ms': metrics.latency.quantile(0.95) * 1000,
+                'max_ms': metrics.latency.max * 1000,
+                'total_s': metrics.latency.sum,
+                'avg_queries': metrics.queries.sum / count,
+                'max_queries': int(metrics.queries.max),
+                'avg_db_ms': metrics.db_time / count * 1000,
+                'avg_bytes': metrics.response_bytes / count,
+                'errors': sum(n for status, n in metrics.statuses.items() if status >= 500),
+            })
+    key = {'p95': 'p95_ms', 'avg': 'avg_ms', 'max': 'max_ms', 'total': 'total_s', 'queries': 'avg_queries'}
+    rows.sort(key=lambda row: row[key.get(order_by, 'p95_ms')], reverse=True)
+    return rows[:limit]
+
+
+def websocket_summary():
+    """Per-route WebSocket figures, busiest first"""
+    with _lock:
+        rows = [
+            {
+                'route': route,
+                'open': metrics.open,
+                'accepted': metrics.accepted,
+                'rejected': metrics.rejected,
+                'connect_p95_ms': metrics.connect.quantile(0.95) * 1000,
+                'handle_p95_ms': metrics.handle.quantile(0.95) * 1000,
+                'handle_max_ms': metrics.handle.max * 1000,
+                'received': metrics.received,
+                'sent': metrics.sent,
+                'sent_bytes': metrics.sent_bytes,
+            }
+            for route, metrics in _websockets.items()
+        ]
+    rows.sort(key=lambda row: row['received'] + row['sent'], reverse=True)
+    return rows
+
+
+def reset():
+    with _lock:
+        _routes.clear()
+        _websockets.clear()
+
+
+# Prometheus text format
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class _Exposition:
+    def __init__(self):
+        self.lines = []
+        self._declared = set()
+
+    def declare(self, name, kind, help_text):
+        if name not in self._declared:
+            self._declared.add(name)
+            self.lines.append(f'# HELP {name} {help_text}')
+            self.lines.append(f'# TYPE {name} {kind}')
+
+    def sample(self, name, value, **labels):
+        self.lines.append(f'{name}{_labels(**labels)} {value}')
+
+    def histogram(self, name, help_text, histogram, **labels):
+        self.declare(name, 'histogram', help_text)
+        for bound, total in histogram.cumulative():
+            self.sample(f'{name}_bucket', total, **labels, le=bound)
+        self.sample(f'{name}_sum', histogram.sum, **labels)
+        self.sample(f'{name}_count', histogram.count, **labels)
+
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+def _http_metrics(out):
+    items = sorted(_routes.items())
+    for (method, route), metrics in items:
+        out.histogram('http_request_duration_seconds', 'Time to build the response, by route',
+                      metrics.latency, method=method, route=route)
+    for (method, route), metrics in items:
+        out.histogram('http_request_db_queries', 'SQL queries per request, by route',
+                      metrics.queries, method=method, route=route)
+    for (method, route), metrics in items:
+        out.declare('http_requests_total', 'counter', 'Requests by route and status code')
+        for status, count in sorted(metrics.statuses.items()):
+            out.sample('http_requests_total', count, method=method, route=route, status=status)
+    for (method, route), metrics in items:
+        out.declare('http_request_db_seconds_total', 'counter', 'Time spent in SQL, by route')
+        out.sample('http_request_db_seconds_total', metrics.db_time, method=method, route=route)
+    for (method, route), metrics in items:
+        out.declare('http_response_bytes_total', 'counter', 'Response body bytes (non-streaming), by route')
+        out.sample('http_response_bytes_total', metrics.response_bytes, method=method, route=route)
+
+
+def _websocket_metrics(out):
+    items = sorted(_websockets.items())
+    histograms = (
+        ('websocket_connect_duration_seconds', 'connect', 'Time from connect to accept'),
+        ('websocket_receive_handling_seconds', 'handle', 'Time a consumer spends on each received message'),
+        ('websocket_send_duration_seconds', 'send', 'Time to hand a message to the server'),
+    )
+    for name, attr, help_text in histograms:
+        for route, metrics in items:
+            out.histogram(name, help_text, getattr(metrics, attr), route=route)
+    counters = (
+        ('websocket_connections_total', 'accepted', 'Accepted connections'),
+        ('websocket_rejected_total', 'rejected', 'Connections closed before being accepted'),
+        ('websocket_messages_received_total', 'received', 'Messages received from clients'),
+        ('websocket_messages_sent_total', 'sent', 'Messages sent to clients'),
+        ('websocket_received_bytes_total', 'received_bytes', 'Bytes received from clients'),
+        ('websocket_sent_bytes_total', 'sent_bytes', 'Bytes sent to clients'),
+    )
+    for name, attr, help_text in counters:
+        for route, metrics in items:
+            out.declare(name, 'counter', help_text)
+            out.sample(name, getattr(metrics, attr), route=route)
+    for route, metrics in items:
+        out.declare('websocket_open_connections', 'gauge', 'Currently open connections')
+        out.sample('websocket_open_connections', metrics.open, route=route)
+
+
+def _component_metrics(out):
+    """Pool, channel layer, cache and throttle state from their own modules"""
+    from channels.layers import get_channel_layer
+
+    from core import cache as cache_utils
+    from core.db_pool import pool_stats
+    from core.throttling import throttle_stats
+
+    pools = sorted(pool_stats().items())
+    for field in ('pool_size', 'pool_available', 'requests_waiting', 'connections_lost'):
+        for alias, stats in pools:
+            if field in stats:
+                out.declare(f'db_{field}', 'gauge', f'psycopg pool {field.replace("_", " ")}')
+                out.sample(f'db_{field}', stats[field], database=alias)
+
+    layer = get_channel_layer()
+    if hasattr(layer, 'status'):
+        status = layer.status()
+        out.declare('channel_layer_active', 'gauge', 'Backend currently serving the channel layer')
+        for backend in ('redis', 'memory'):
+            out.sample('channel_layer_active', int(status['active'] == backend), backend=backend)
+        out.declare('channel_layer_switches_total', 'counter', 'Channel layer failovers')
+        out.sample('channel_layer_switches_total', status['switches'])
+
+    cache_stats = cache_utils.stats()
+    for namespace, counts in cache_stats['namespaces'].items():
+        out.declare('cache_requests_total', 'counter', 'Cache lookups by namespace and result')
+        out.sample('cache_requests_total', counts['hits'], namespace=namespace, result='hit')
+        out.sample('cache_requests_total', counts['misses'], namespace=namespace, result='miss')
+    for alias, status in cache_stats['backends'].items():
+        if 'failures' in status:
+            out.declare('cache_redis_failures_total', 'counter', 'Cache calls that found Redis unreachable')
+            out.sample('cache_redis_failures_total', status['failures'], cache=alias)
+
+    for scope, count in sorted(throttle_stats().items()):
+        out.declare('throttled_requests_total', 'counter', 'Requests answered 429, by scope')
+        out.sample('throttled_requests_total', count, scope=scope)
+
+
+def render_prometheus():
+    out = _Exposition()
+    with _lock:
+        _http_metrics(out)
+        _websocket_metrics(out)
+    _component_metrics(out)
+    return out.render()
@@ -0,0 +1,66 @@
+"""
+Shared, lazily connected Redis client.
+
+Nothing here talks to Redis at import time. The first caller pays for a short
+connection probe; if Redis is down we remember that for REDIS_RETRY_INTERVAL
+seconds so hot paths don't keep waiting on connect timeouts, and callers fall
+back to their in-process implementation.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_client = None
+_retry_at = 0.0
+
+
+def get_redis():
+    """Return a connected redis client, or None if Redis is unavailable"""
+    global _client, _retry_at
+
+    if _client is not None:
+        return _client
+    if time.monotonic() < _retry_at:
+        return None
+
+    with _lock:
+        if _client is not None:
+            return _client
+        if time.monotonic() < _retry_at:
+            return None
+
+        url = getattr(settings, 'REDIS_URL', None)
+        if not url:
+            _retry_at = float('inf')
+            return None
+
+        try:
+            import redis
+            client = redis.Redis.from_url(
+                url,
+                socket_timeout=getattr(settings, 'REDIS_SOCKET_TIMEOUT', 0.5),
+                socket_connect_timeout=getattr(settings, 'REDIS_SOCKET_TIMEOUT', 0.5),
+            )
+            client.ping()
+        except Exception as e:
+            logger.warning(f"Redis unavailable at {url} ({e}) - using in-process fallback")
+            _retry_at = time.monotonic() + getattr(settings, 'REDIS_RETRY_INTERVAL', 30)
+            return None
+
+        _client = client
+        return _client
+
+
+def reset_redis(error=None):
+    """Forget the current client after a failed command so the next call re-probes"""
+    global _client, _retry_at
+    with _lock:
+        if error is not None:
+            logger.warning(f"Redis command failed ({error}) - falling back until reconnect")
+        _client = None
+        _retry_at = time.monotonic() + getattr(settings, 'REDIS_RETRY_INTERVAL', 30)
@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import importlib.util
+import json
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -59,55 +61,163 @@ TAILWIND_CLI_DIST_CSS = "tailwind.css"
 # Channels
 ASGI_APPLICATION = 'core.asgi.application'
 
-# Channel layer configuration
-import redis
-import logging
-
-logger = logging.getLogger(__name__)
-
-def get_channel_layers_config():
-    """
-    Smart channel layer configuration with Redis fallback
-    Automatically detects if Redis is available and falls back to in-memory if not
-    """
-    try:
-        # Test Redis connection
-        r = redis.Redis(host='127.0.0.1', port=6379, db=0, socket_timeout=2)
-        r.ping()
-        logger.info("✅ Redis detected - using RedisChannelLayer for optimal performance")
-
-        return {
-            'default': {
-                'BACKEND': 'channels_redis.core.RedisChannelLayer',
-                'CONFIG': {
-                    "hosts": [('127.0.0.1', 6379)],
-                    "capacity": 1500,  # Maximum messages to store
-                    "expiry": 60,      # Message expiry in seconds
-                },
+# Shared Redis used for cross-process counters and presence (probed lazily)
+REDIS_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/0')
+
+# Channel layer (see core.channel_layers). CHANNEL_LAYER_MODE is "auto" (Redis,
+# failing over to in-memory while Redis is unreachable), "redis" or "memory".
+# Nothing connects at import time; Redis is health-checked in the background
+# every CHANNEL_LAYER_HEALTH_INTERVAL seconds and only switched back to after
+# CHANNEL_LAYER_RECOVERY_CHECKS consecutive good checks.
+CHANNEL_LAYER_MODE = os.getenv('CHANNEL_LAYER_MODE', 'auto')
+CHANNEL_REDIS_URL = os.getenv('CHANNEL_REDIS_URL', REDIS_URL)
+CHANNEL_LAYER_HEALTH_INTERVAL = float(os.getenv('CHANNEL_LAYER_HEALTH_INTERVAL', '5'))
+CHANNEL_LAYER_RECOVERY_CHECKS = int(os.getenv('CHANNEL_LAYER_RECOVERY_CHECKS', '3'))
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'core.channel_layers.FailoverChannelLayer',
+        'CONFIG': {
+            'mode': CHANNEL_LAYER_MODE,
+            'redis': {
+                'hosts': [CHANNEL_REDIS_URL],
+                'capacity': 1500,  # Maximum messages to store
+                'expiry': 60,      # Message expiry in seconds
             },
-        }
-    except (redis.ConnectionError, redis.TimeoutError, ImportError) as e:
-        logger.warning(f"⚠️  Redis not available ({e}) - using InMemoryChannelLayer (development only)")
-        logger.warning("📝 For production, install and start Redis: sudo apt-get install redis-server")
-
-        return {
-            'default': {
-                'BACKEND': 'channels.layers.InMemoryChannelLayer',
-                'CONFIG': {
-                    "capacity": 300,  # Lower capacity for in-memory
-                    "expiry": 60,
-                },
-            }
-        }
+            'memory': {
+                'capacity': 300,  # Lower capacity for in-memory
+                'expiry': 60,
+            },
+            'health_interval': CHANNEL_LAYER_HEALTH_INTERVAL,
+            'recovery_checks': CHANNEL_LAYER_RECOVERY_CHECKS,
+        },
+    },
+}
 
-# Apply the smart configuration
-CHANNEL_LAYERS = get_channel_layers_config()
+# Cache tier (see core.cache): Redis, served from local memory for
+# CACHE_RETRY_INTERVAL seconds after a connection error. Point CACHE_REDIS_URL
+# at its own database if anything might call cache.clear(), which flushes it.
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', REDIS_URL)
+CACHE_RETRY_INTERVAL = int(os.getenv('CACHE_RETRY_INTERVAL', '30'))
+CACHE_SOCKET_TIMEOUT = float(os.getenv('CACHE_SOCKET_TIMEOUT', '0.5'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.FailoverRedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+        'KEY_PREFIX': 'cache',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'socket_timeout': CACHE_SOCKET_TIMEOUT,
+            'socket_connect_timeout': CACHE_SOCKET_TIMEOUT,
+        },
+        'FALLBACK_OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    # Separate alias so hot cache churn never evicts a session. No local copy
+    # during an outage: sessions fall through to the database instead, and
+    # keys changed meanwhile are purged from Redis when it comes back
+    'sessions': {
+        'BACKEND': 'core.cache.FailoverRedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+        'KEY_PREFIX': 'session',
+        'OPTIONS': {
+            'socket_timeout': CACHE_SOCKET_TIMEOUT,
+            'socket_connect_timeout': CACHE_SOCKET_TIMEOUT,
+        },
+        'FALLBACK': 'miss',
+    },
+}
+
+# Sessions are read from the "sessions" cache. SESSION_STORE=cached_db (the
+# default) still writes each change through to django_session, so logins and
+# carts survive a Redis flush or outage; SESSION_STORE=cache drops those
+# database writes entirely, and with them every session written while Redis
+# is down. Either way a session is only saved when a value actually changes.
+SESSION_STORE = os.getenv('SESSION_STORE', 'cached_db')
+SESSION_ENGINE = f'django.contrib.sessions.backends.{SESSION_STORE}'
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Token-bucket limits for the customer cart/order APIs (see core.throttling),
+# as "N/period" per session and per client IP. The IP limits allow for a
+# whole room of diners behind one NAT. Override any scope with a JSON
+# THROTTLE_RATES, e.g. '{"place_order": {"session": "5/min", "ip": "100/min"}}'.
+# THROTTLE_PROXY_COUNT is the number of trusted proxies adding X-Forwarded-For.
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', 'True').lower() == 'true'
+THROTTLE_PROXY_COUNT = int(os.getenv('THROTTLE_PROXY_COUNT', '0'))
+THROTTLE_RATES = {
+    'add_to_cart': {'session': '60/min', 'ip': '600/min'},
+    'update_cart_item': {'session': '120/min', 'ip': '1200/min'},
+    'items_status': {'session': '60/min', 'ip': '900/min'},
+    'place_order': {'session': '10/min', 'ip': '120/min'},
+    **json.loads(os.getenv('THROTTLE_RATES', '{}')),
+}
+
+# Request/WebSocket instrumentation (see core.metrics): /metrics serves it in
+# the Prometheus text format to staff and to a scraper sending
+# "Authorization: Bearer $METRICS_TOKEN". METRICS_ALLOWED_IPS is an opt-in
+# allowlist, empty by default: behind a same-host proxy every request looks
+# local unless THROTTLE_PROXY_COUNT is set. The admin "Slow routes" page lists
+# the METRICS_SLOW_ROUTES slowest
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip]
+METRICS_SLOW_ROUTES = int(os.getenv('METRICS_SLOW_ROUTES', '20'))
+
+# Seconds between reconciliations of the live cashier counters against the DB
+CASHIER_STATS_RECONCILE_INTERVAL = int(os.getenv('CASHIER_STATS_RECONCILE_INTERVAL', '300'))
+
+# How long (seconds) the cashier dashboard's per-vendor revenue breakdown is cached
+CASHIER_VENDOR_BREAKDOWN_TTL = int(os.getenv('CASHIER_VENDOR_BREAKDOWN_TTL', '30'))
+
+# How long (seconds) exact order-list counts are cached where no planner estimate is available
+ORDER_COUNT_CACHE_TTL = int(os.getenv('ORDER_COUNT_CACHE_TTL', '60'))
+
+# Vendor payment report cache (seconds): ranges including today are also
+# invalidated on change; fully historical ranges only expire
+VENDOR_REPORT_TTL = int(os.getenv('VENDOR_REPORT_TTL', '300'))
+VENDOR_REPORT_HISTORY_TTL = int(os.getenv('VENDOR_REPORT_HISTORY_TTL', '3600'))
+
+# Raw data exports: rows fetched per database round trip, and the widest date range allowed over HTTP
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+EXPORT_MAX_DAYS = int(os.getenv('EXPORT_MAX_DAYS', '366'))
+
+# Ready-time estimates: minutes added per extra unit of an order's lines at a
+# vendor, seconds between full queue rebuilds from the DB, and the smallest
+# change (seconds) worth writing and pushing to a table
+ETA_EXTRA_UNIT_MINUTES = float(os.getenv('ETA_EXTRA_UNIT_MINUTES', '1'))
+ETA_QUEUE_REBUILD_INTERVAL = int(os.getenv('ETA_QUEUE_REBUILD_INTERVAL', '300'))
+ETA_UPDATE_THRESHOLD = int(os.getenv('ETA_UPDATE_THRESHOLD', '30'))
+
+# Local time at which a new trading day starts, e.g. "04:00" so late-night
+# orders count towards the evening before (see orders.business_dates)
+BUSINESS_DAY_ROLLOVER = os.getenv('BUSINESS_DAY_ROLLOVER', '00:00')
+
+# Cached customer menu payload lifetime (seconds; retired early on every menu
+# version bump) and the most items one bulk menu edit may touch
+MENU_CACHE_TTL = int(os.getenv('MENU_CACHE_TTL', '3600'))
+MENU_BULK_UPDATE_LIMIT = int(os.getenv('MENU_BULK_UPDATE_LIMIT', '500'))
+
+# Closed (paid/cancelled) orders older than this many business days are moved
+# to the archive tables by `manage.py archive_orders`, this many orders per
+# transaction (see orders.archive)
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '30'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '500'))
+
+# How long (seconds) a WebSocket snapshot is shared between reconnecting clients
+WEBSOCKET_SNAPSHOT_TTL = float(os.getenv('WEBSOCKET_SNAPSHOT_TTL', '2'))
+
+# Per-connection outbound queue: max queued messages, and max age (seconds)
+# before a lagging client's backlog is dropped and replaced with a resync
+WEBSOCKET_SEND_QUEUE_SIZE = int(os.getenv('WEBSOCKET_SEND_QUEUE_SIZE', '100'))
+WEBSOCKET_SEND_MAX_AGE = float(os.getenv('WEBSOCKET_SEND_MAX_AGE', '10'))
 
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.metrics.MetricsMiddleware',
     'core.middleware.error_handling.BrokenPipeErrorMiddleware',
+    'core.db_router.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -167,6 +277,67 @@ if not all([os.getenv('DB_NAME'), os.getenv('DB_USER'), os.getenv('DB_PASSWORD')
         }
     }
 
+# Optional read replica for dashboards, reports and exports (see core.db_router):
+# DB_REPLICA_HOST (and DB_REPLICA_PORT/DB_REPLICA_NAME) for a PostgreSQL standby,
+# or DB_REPLICA_SQLITE for a second SQLite file when testing locally
+if os.getenv('DB_REPLICA_HOST') and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'NAME': os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'TEST': {'MIRROR': 'default'},
+    }
+elif os.getenv('DB_REPLICA_SQLITE'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('DB_REPLICA_SQLITE'),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Threads daphne runs sync views and database_sync_to_async calls in (the
+# server reads the same variable); database pools are sized from it
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', str(min(32, (os.cpu_count() or 1) + 4))))
+
+# PostgreSQL connection pooling with psycopg 3 + psycopg_pool (see core.db_pool):
+# at most DB_POOL_MAX_SIZE connections per process, checked before use and
+# recycled after DB_POOL_MAX_LIFETIME / DB_POOL_MAX_IDLE seconds. Threads wait
+# up to DB_POOL_TIMEOUT seconds for a free connection instead of opening more.
+# Without psycopg_pool (or with DB_POOL=false) connections are kept open for
+# DB_CONN_MAX_AGE seconds per thread with health checks instead.
+DB_POOL = os.getenv('DB_POOL', 'true').lower() == 'true'
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', str(ASGI_THREADS)))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '1800'))
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', '300'))
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+
+for database in DATABASES.values():
+    if database['ENGINE'] != 'django.db.backends.postgresql':
+        continue
+    # Pooled connections are checked on checkout, persistent ones before reuse
+    database['CONN_HEALTH_CHECKS'] = True
+    if DB_POOL and importlib.util.find_spec('psycopg') and importlib.util.find_spec('psycopg_pool'):
+        database['OPTIONS'] = {
+            **database.get('OPTIONS', {}),
+            'pool': {
+                'min_size': min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+                'max_size': DB_POOL_MAX_SIZE,
+                'timeout': DB_POOL_TIMEOUT,
+                'max_lifetime': DB_POOL_MAX_LIFETIME,
+                'max_idle': DB_POOL_MAX_IDLE,
+            },
+        }
+        database['CONN_MAX_AGE'] = 0
+    else:
+        database['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+
+# Seconds a client stays on the primary after writing, so it reads its own writes
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv('DATABASE_REPLICA_PIN_SECONDS', '5'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
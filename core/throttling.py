@@ -0,0 +1,221 @@
+"""
+Token-bucket throttling for the customer cart and order APIs.
+
+Each throttled view names a scope from THROTTLE_RATES, e.g.
+
+    @throttle('add_to_cart')
+    def add_to_cart(request): ...
+
+A request draws one token from two buckets: one for the customer's session
+and one for the client IP. The IP bucket is set much larger, because a whole
+room of diners may share the venue's wifi. A bucket holds a full period's
+allowance ("60/min" holds 60 tokens) and refills evenly, so a burst is fine
+but a stuck retry loop settles at the sustained rate. Both buckets are
+checked and charged together or not at all. A rejected request gets
+`429 Too Many Requests` with `Retry-After`.
+
+Buckets live in Redis and are updated by one Lua script, so every worker
+shares them. While Redis is unavailable each process keeps its own buckets.
+Staff, cashiers and vendor owners are never throttled.
+"""
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, namedtuple
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from core.redis_utils import get_redis, reset_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'throttle'
+
+Rate = namedtuple('Rate', ['capacity', 'per_second'])
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600}
+
+# KEYS: bucket hashes; ARGV: capacity and refill per second for each key in turn.
+# Takes one token from every bucket if all have one; otherwise takes nothing
+# and returns how long until they would.
+TAKE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    local tokens = levels[i]
+    if wait == 0 then
+        tokens = tokens - 1
+    end
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000) + 1000)
+end
+return tostring(wait)
+"""
+
+
+def parse_rate(value):
+    """'60/min' -> Rate(capacity=60, per_second=1.0)"""
+    count, _, period = value.partition('/')
+    count = int(count)
+    seconds = PERIODS[period.strip().lower() or 's']
+    return Rate(count, count / seconds)
+
+
+def _rates(scope):
+    rates = getattr(settings, 'THROTTLE_RATES', {}).get(scope)
+    if not rates:
+        return None
+    return {kind: parse_rate(value) for kind, value in rates.items()}
+
+
+class LocalBuckets:
+    """Per-process token buckets, used while Redis is unavailable"""
+
+    MAX_BUCKETS = 10000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, buckets):
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for key, rate in buckets:
+                tokens, ts = self._buckets.get(key, (rate.capacity, now))
+                tokens = min(rate.capacity, tokens + (now - ts) * rate.per_second)
+                levels.append(tokens)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate.per_second)
+            for (key, rate), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+            if len(self._buckets) > self.MAX_BUCKETS:
+                self._prune(now)
+            return wait
+
+    def _prune(self, now):
+        # Buckets idle for an hour are full again for any sane rate; forget them
+        self._buckets = {key: value for key, value in self._buckets.items() if now - value[1] < 3600}
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+_local = LocalBuckets()
+_script = None
+_script_client_id = None
+
+_stats_lock = threading.Lock()
+_throttled = defaultdict(int)
+
+
+def _redis_script():
+    global _script, _script_client_id
+
+    client = get_redis()
+    if client is None:
+        return None
+    if id(client) != _script_client_id:
+        _script = client.register_script(TAKE_SCRIPT)
+        _script_client_id = id(client)
+    return _script
+
+
+def take(buckets):
+    """Take a token from each (key, Rate) bucket; returns 0 if allowed, else seconds to wait"""
+    script = _redis_script()
+    if script is not None:
+        try:
+            args = [value for _, rate in buckets for value in rate]
+            return float(script(keys=[key for key, _ in buckets], args=args))
+        except Exception as e:
+            reset_redis(e)
+    return _local.take(buckets)
+
+
+def client_ip(request):
+    """Client address, taking THROTTLE_PROXY_COUNT trusted proxies' X-Forwarded-For into account"""
+    proxies = getattr(settings, 'THROTTLE_PROXY_COUNT', 0)
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(',') if hop.strip()]
+        if hops:
+            return hops[max(0, len(hops) - proxies)]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def is_exempt(user):
+    """Staff, cashiers and vendor owners"""
+    if not user.is_authenticated:
+        return False
+    from core.permissions import CashierPermissions
+
+    return user.is_staff or CashierPermissions.is_cashier(user) or user.owned_vendors.exists()
+
+
+def check(request, scope):
+    """Seconds the request must wait before `scope` allows it, or 0"""
+    if not getattr(settings, 'THROTTLE_ENABLED', True):
+        return 0
+    rates = _rates(scope)
+    if not rates or is_exempt(request.user):
+        return 0
+
+    buckets = []
+    session_key = request.session.session_key if hasattr(request, 'session') else None
+    if session_key and 'session' in rates:
+        buckets.append((f'{KEY_PREFIX}:{scope}:session:{session_key}', rates['session']))
+    if 'ip' in rates:
+        buckets.append((f'{KEY_PREFIX}:{scope}:ip:{client_ip(request)}', rates['ip']))
+    if not buckets:
+        return 0
+    return take(buckets)
+
+
+def throttle(scope):
+    """View decorator: answer 429 with Retry-After once the scope's buckets run dry"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            wait = check(request, scope)
+            if wait:
+                retry_after = max(1, math.ceil(wait))
+                with _stats_lock:
+                    _throttled[scope] += 1
+                logger.info(f"Throttled {scope} for {client_ip(request)} (retry in {retry_after}s)")
+                response = JsonResponse(
+                    {'error': 'Too many requests, please slow down', 'retry_after': retry_after},
+                    status=429,
+                )
+                response['Retry-After'] = str(retry_after)
+                return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def throttle_stats():
+    """Requests rejected per scope by this worker process"""
+    with _stats_lock:
+        return dict(_throttled)
@@ -27,8 +27,8 @@ django.setup()
 from django.core.management import call_command
 from django.test import Client
 from django.contrib.auth.models import User
-from django.utils import timezone
 from vendors.models import Vendor, Table
+from orders.business_dates import current_business_date
 from orders.models import Order
 
 
@@ -41,10 +41,10 @@ def print_header(title):
 
 def print_stats():
     """Print current system statistics"""
-    today = timezone.now().date()
+    today = current_business_date()
 
     stats = {
-        'orders_today': Order.objects.filter(created_at__date=today).count(),
+        'orders_today': Order.objects.filter(business_date=today).count(),
         'unpaid_orders': Order.objects.filter(status__in=['delivered', 'ready']).count(),
         'active_tables': Table.objects.filter(
             orders__status__in=['pending', 'confirmed', 'preparing']
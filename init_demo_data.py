@@ -19,9 +19,9 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 django.setup()
 
-from django.utils import timezone
 from django.contrib.auth.models import User
 from vendors.models import Vendor, Category, MenuItem, Table
+from orders.business_dates import current_business_date
 from orders.models import Order, OrderItem
 
 def clear_all_data():
@@ -84,10 +84,10 @@ def verify_clean_state():
     """Verify the system is in clean state"""
     print("\n🔍 Verifying clean state...")
 
-    today = timezone.now().date()
+    today = current_business_date()
 
     # Check orders today
-    orders_today = Order.objects.filter(created_at__date=today).count()
+    orders_today = Order.objects.filter(business_date=today).count()
     print(f"📊 Orders Today: {orders_today}")
 
     # Check unpaid orders
@@ -5,7 +5,8 @@ from django.utils.safestring import mark_safe
 from django.contrib import messages
 from django.http import HttpResponseRedirect
 from django.core.management import call_command
-from .models import Order, OrderItem, OrderStatusHistory, Cart, CartItem
+from .models import Order, OrderItem, OrderStatusHistory, Cart, CartItem, Payment, ArchivedOrder, ArchivedOrderItem
+from . import archive
 
 def reset_demo_data_action(modeladmin, request, queryset):
     """Admin action to reset demo data"""
@@ -78,8 +79,8 @@ class OrderItemInline(admin.TabularInline):
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
     list_display = ('order', 'menu_item', 'quantity', 'unit_price', 'subtotal')
-    list_filter = ('menu_item__category__vendor', 'created_at')
-    search_fields = ('order__id', 'menu_item__name', 'menu_item__category__vendor__name')
+    list_filter = ('vendor', 'created_at')
+    search_fields = ('order__id', 'menu_item__name', 'vendor__name')
     readonly_fields = ('subtotal', 'created_at', 'updated_at')
 
     fieldsets = (
@@ -102,6 +103,14 @@ class OrderStatusHistoryAdmin(admin.ModelAdmin):
     search_fields = ('order__id', 'changed_by__username')
     readonly_fields = ('timestamp',)
 
+@admin.register(Payment)
+class PaymentAdmin(admin.ModelAdmin):
+    list_display = ('order', 'method', 'amount', 'received_by', 'settlement_id', 'created_at')
+    list_filter = ('method', 'created_at')
+    search_fields = ('order__id', 'settlement_id')
+    readonly_fields = ('created_at',)
+    raw_id_fields = ('order',)
+
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ('cart_id', 'table', 'item_count', 'total_amount', 'created_at', 'updated_at')
@@ -145,6 +154,46 @@ class CartItemAdmin(admin.ModelAdmin):
         }),
     )
 
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    can_delete = False
+    fields = ('menu_item', 'vendor', 'quantity', 'unit_price', 'subtotal', 'special_instructions')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    """Read-only view of archived orders; restore moves them back to the live tables"""
+    list_display = ('order_id_short', 'table', 'customer_name', 'status', 'total_amount', 'business_date', 'archived_at')
+    list_filter = ('status', 'business_date')
+    search_fields = ('id', 'customer_name', 'customer_phone')
+    date_hierarchy = 'business_date'
+    ordering = ('-created_at',)
+    actions = ['restore_orders']
+    inlines = [ArchivedOrderItemInline]
+
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def order_id_short(self, obj):
+        return str(obj.id)[:8]
+    order_id_short.short_description = 'Order ID'
+
+    def restore_orders(self, request, queryset):
+        """Move the selected orders back into the live order tables"""
+        totals = archive.restore_orders(queryset.values_list('id', flat=True))
+        messages.success(request, f"Restored {totals['order']} orders with {totals['item']} items")
+    restore_orders.short_description = "Restore selected orders to live tables"
+
 # Add inlines to the main models
 OrderAdmin.inlines = [OrderItemInline]
 CartAdmin.inlines = [CartItemInline]
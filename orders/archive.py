@@ -0,0 +1,168 @@
+"""
+Hot/cold archival of closed orders.
+
+Paid and cancelled orders older than ARCHIVE_AFTER_DAYS business days are
+moved into the Archived* tables together with their items, status history and
+payments. Each batch of ARCHIVE_BATCH_SIZE orders is one transaction: an
+`INSERT ... SELECT` per table, then a plain DELETE from the hot tables. That
+leaves the hot tables, and the indexes every dashboard query walks, holding
+little beyond the current day's service.
+
+Archiving is bookkeeping, not a business event. Rows are never deleted
+through the ORM collector, so the delete signals that take paid orders out of
+the sales rollups, live stats and ETA queues never fire. Paid revenue keeps
+coming from the rollups. Readers that need the raw rows (exports, the cashier
+day report, vendor paid history and the rollup backfill) read both sets of
+tables through `tables()`. `restore_orders` moves orders back unchanged, with
+the same primary keys.
+
+Run `manage.py archive_orders` from cron, e.g. nightly after closing.
+"""
+import logging
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .business_dates import current_business_date
+
+logger = logging.getLogger(__name__)
+
+CLOSED_STATUSES = ('paid', 'cancelled')
+
+Tables = namedtuple('Tables', ['order', 'item', 'history', 'payment'])
+
+
+def tables(archived=False):
+    """Order, item, status history and payment models of the hot or archive tables"""
+    from . import models
+
+    if archived:
+        return Tables(models.ArchivedOrder, models.ArchivedOrderItem,
+                      models.ArchivedOrderStatusHistory, models.ArchivedPayment)
+    return Tables(models.Order, models.OrderItem, models.OrderStatusHistory, models.Payment)
+
+
+def cutoff_date(days=None):
+    """Closed orders on business dates before this one are due for archiving"""
+    if days is None:
+        days = getattr(settings, 'ARCHIVE_AFTER_DAYS', 30)
+    return current_business_date() - timedelta(days=days)
+
+
+def due_for_archive(cutoff):
+    from .models import Order
+    return Order.objects.filter(status__in=CLOSED_STATUSES, business_date__lt=cutoff)
+
+
+def _columns(model):
+    # archived_at is filled in by its database default
+    return [field.attname for field in model._meta.concrete_fields if field.attname != 'archived_at']
+
+
+def _copy_rows(source, target, queryset):
+    """INSERT INTO target SELECT ... FROM source, without loading the rows"""
+    columns = _columns(target)
+    sql, params = queryset.order_by().values(*columns).query.sql_with_params()
+    connection = connections[queryset.db]
+    target_columns = ', '.join(
+        connection.ops.quote_name(target._meta.get_field(column).column) for column in columns
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {connection.ops.quote_name(target._meta.db_table)} ({target_columns}) {sql}', params)
+        return cursor.rowcount
+
+
+def _move(order_ids, to_archive):
+    """Copy a batch of orders and their rows across, then delete the originals"""
+    source, target = (tables(), tables(archived=True)) if to_archive else (tables(archived=True), tables())
+    selections = [
+        source.order.objects.filter(pk__in=order_ids),
+        source.item.objects.filter(order_id__in=order_ids),
+        source.history.objects.filter(order_id__in=order_ids),
+        source.payment.objects.filter(order_id__in=order_ids),
+    ]
+
+    counts = {}
+    for name, model, queryset in zip(Tables._fields, target, selections):
+        counts[name] = _copy_rows(queryset.model, model, queryset)
+
+    # Children first; _raw_delete skips the collector and with it the delete signals
+    for queryset in reversed(selections):
+        queryset._raw_delete(queryset.db)
+    return counts
+
+
+def archive_batch(cutoff, batch_size=None):
+    """Archive up to `batch_size` closed orders from before `cutoff`; returns per-table row counts"""
+    from .models import TableState
+
+    batch_size = batch_size or getattr(settings, 'ARCHIVE_BATCH_SIZE', 500)
+    with transaction.atomic():
+        order_ids = list(
+            due_for_archive(cutoff).select_for_update(skip_locked=True)
+            .order_by('business_date').values_list('id', flat=True)[:batch_size]
+        )
+        if not order_ids:
+            return None
+        TableState.objects.filter(latest_order_id__in=order_ids).update(latest_order=None)
+        return _move(order_ids, to_archive=True)
+
+
+def archive_orders(days=None, batch_size=None, max_batches=None, pause=0):
+    """
+    Archive every closed order older than `days` business days in batches.
+
+    `pause` seconds between batches leaves room for live traffic on a busy
+    database. Returns the total rows moved per table.
+    """
+    cutoff = cutoff_date(days)
+    totals = dict.fromkeys(Tables._fields, 0)
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        counts = archive_batch(cutoff, batch_size)
+        if counts is None:
+            break
+        batches += 1
+        for name, count in counts.items():
+            totals[name] += count
+        logger.info(f"Archived batch {batches}: {counts}")
+        if pause:
+            time.sleep(pause)
+
+    logger.info(f"Archived {totals['order']} orders before {cutoff} in {batches} batches")
+    return totals
+
+
+def restore_orders(order_ids, batch_size=None):
+    """Move archived orders (and their rows) back into the hot tables"""
+    from .models import ArchivedOrder
+
+    batch_size = batch_size or getattr(settings, 'ARCHIVE_BATCH_SIZE', 500)
+    order_ids = list(order_ids)
+    totals = dict.fromkeys(Tables._fields, 0)
+    for start in range(0, len(order_ids), batch_size):
+        with transaction.atomic():
+            batch = list(
+                ArchivedOrder.objects.select_for_update()
+                .filter(pk__in=order_ids[start:start + batch_size]).values_list('id', flat=True)
+            )
+            if not batch:
+                continue
+            for name, count in _move(batch, to_archive=False).items():
+                totals[name] += count
+
+    logger.info(f"Restored {totals['order']} archived orders")
+    return totals
+
+
+def restore_dates(start_date, end_date, batch_size=None):
+    """Restore every archived order on business dates start_date..end_date (inclusive)"""
+    from .models import ArchivedOrder
+
+    order_ids = ArchivedOrder.objects.filter(
+        business_date__range=(start_date, end_date)
+    ).values_list('id', flat=True)
+    return restore_orders(order_ids, batch_size)
@@ -7,14 +7,23 @@ from django.urls import reverse
 
 from functools import wraps
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Q, Count, Sum
 from django.utils import timezone
-from django.core.paginator import Paginator
-from .models import Order, OrderItem, OrderStatus
+from .models import ArchivedOrder, Order, OrderItem, OrderStatus, Payment, SalesRollup
 from vendors.models import Table, Vendor
+from . import live_stats
+from . import rollups
+from . import settlement as settlement_service
+from . import exports
+from . import business_dates
+from .table_state import serialize_table_state
+from .pagination import keyset_paginate, estimated_count
+from core.db_router import read_from_replica
 from core.permissions import CashierPermissions, cashier_required, cashier_permission_required
 import json
-from datetime import datetime, timedelta
+from datetime import timedelta
+from decimal import Decimal
 import logging
 
 logger = logging.getLogger(__name__)
@@ -93,6 +102,45 @@ def cashier_logout(request):
     messages.success(request, 'You have been logged out successfully.')
     return redirect('orders:cashier_login')
 
+CASHIER_PAGE_SIZE = 20
+
+def filter_cashier_orders(status_filter, table_filter, date_filter):
+    """Cashier order list queryset for the dashboard filters"""
+    orders = Order.objects.select_related('table').prefetch_related('items__menu_item')
+
+    # Apply status filter
+    if status_filter == 'unpaid':
+        orders = orders.filter(status__in=['delivered', 'ready'])
+    elif status_filter == 'paid':
+        orders = orders.filter(status='paid')
+    elif status_filter:
+        orders = orders.filter(status=status_filter)
+
+    # Apply table filter
+    if table_filter:
+        orders = orders.filter(table__number=table_filter)
+
+    # Apply date filter on the stored business date
+    today = business_dates.current_business_date()
+    if date_filter == 'today':
+        orders = orders.filter(**business_dates.on_dates(today))
+    elif date_filter == 'yesterday':
+        orders = orders.filter(**business_dates.on_dates(today - timedelta(days=1)))
+    elif date_filter == 'week':
+        orders = orders.filter(**business_dates.on_dates(today - timedelta(days=7), today))
+
+    return orders
+
+def filter_query(request):
+    """Current filters as a query string, without the pagination cursor"""
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params.pop('page', None)
+    return params.urlencode()
+
+def order_count_cache_key(status_filter, table_filter, date_filter):
+    return f'cashier_orders_count:{business_dates.current_business_date()}:{status_filter}:{table_filter}:{date_filter}'
+
 @cashier_login_required
 def cashier_dashboard(request):
     """Main cashier dashboard showing orders ready for payment"""
@@ -115,52 +163,14 @@ def cashier_dashboard(request):
         messages.error(request, "You don't have permission to view orders.")
         return redirect('orders:cashier_login')
 
-    orders = Order.objects.select_related('table').prefetch_related('items__menu_item')
-
-    # Apply status filter
-    if status_filter == 'unpaid':
-        orders = orders.filter(status__in=['delivered', 'ready'])
-    elif status_filter == 'paid':
-        orders = orders.filter(status='paid')
-    elif status_filter:
-        orders = orders.filter(status=status_filter)
+    orders = filter_cashier_orders(status_filter, table_filter, date_filter)
 
-    # Apply table filter
-    if table_filter:
-        orders = orders.filter(table__number=table_filter)
+    # Keyset pagination over (created_at, id) - no COUNT(*) or OFFSET per page
+    page_obj = keyset_paginate(orders, request.GET.get('cursor'), CASHIER_PAGE_SIZE)
+    orders_count = estimated_count(orders, order_count_cache_key(status_filter, table_filter, date_filter))
 
-    # Apply date filter
-    today = timezone.now().date()
-    if date_filter == 'today':
-        orders = orders.filter(created_at__date=today)
-    elif date_filter == 'yesterday':
-        yesterday = today - timedelta(days=1)
-        orders = orders.filter(created_at__date=yesterday)
-    elif date_filter == 'week':
-        week_ago = today - timedelta(days=7)
-        orders = orders.filter(created_at__date__gte=week_ago)
-
-    # Order by most recent
-    orders = orders.order_by('-created_at')
-
-    # Pagination
-    paginator = Paginator(orders, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    # Calculate statistics
-    stats = {
-        'total_orders_today': Order.objects.filter(created_at__date=today).count(),
-        'unpaid_orders': Order.objects.filter(status__in=['delivered', 'ready']).count(),
-        'paid_orders_today': Order.objects.filter(status='paid', created_at__date=today).count(),
-        'total_revenue_today': Order.objects.filter(
-            status='paid',
-            created_at__date=today
-        ).aggregate(total=Sum('total_amount'))['total'] or 0,
-        'active_tables': Table.objects.filter(
-            orders__status__in=['pending', 'confirmed', 'preparing', 'ready', 'delivered']
-        ).distinct().count()
-    }
+    # Statistics come from the incrementally maintained counters
+    stats = live_stats.get_cashier_stats()
 
     # Add user permission info to context
     context = {
@@ -177,36 +187,13 @@ def cashier_dashboard(request):
     # Get all active tables for filter dropdown
     active_tables = Table.objects.filter(is_active=True).order_by('number')
 
-    # Get vendor payment breakdown
-    vendor_breakdown = []
-    from vendors.models import Vendor
-    for vendor in Vendor.objects.all():
-        # Calculate vendor-specific revenue for today
-        vendor_paid_items = OrderItem.objects.filter(
-            menu_item__category__vendor=vendor,
-            order__status='paid',
-            order__created_at__date=today
-        )
-        vendor_unpaid_items = OrderItem.objects.filter(
-            menu_item__category__vendor=vendor,
-            order__status__in=['delivered', 'ready']
-        )
-
-        paid_revenue = sum(float(item.subtotal) for item in vendor_paid_items)
-        unpaid_revenue = sum(float(item.subtotal) for item in vendor_unpaid_items)
-
-        if paid_revenue > 0 or unpaid_revenue > 0:
-            vendor_breakdown.append({
-                'vendor': vendor,
-                'paid_revenue': round(paid_revenue, 2),
-                'unpaid_revenue': round(unpaid_revenue, 2),
-                'total_revenue': round(paid_revenue + unpaid_revenue, 2),
-                'paid_orders': len(set(item.order.id for item in vendor_paid_items)),
-                'unpaid_orders': len(set(item.order.id for item in vendor_unpaid_items))
-            })
+    # Per-vendor paid/unpaid revenue, from one cached grouped query
+    vendor_breakdown = live_stats.get_vendor_breakdown()
 
     context = {
         'page_obj': page_obj,
+        'orders_count': orders_count,
+        'filter_query': filter_query(request),
         'stats': stats,
         'active_tables': active_tables,
         'vendor_breakdown': vendor_breakdown,
@@ -220,6 +207,24 @@ def cashier_dashboard(request):
 
     return render(request, 'orders/cashier_dashboard.html', context)
 
+@cashier_login_required
+def cashier_order_rows(request):
+    """HTMX fragment: the next page of dashboard order rows after `cursor`"""
+    if not request.user.has_perm('orders.view_order'):
+        return JsonResponse({'error': "You don't have permission to view orders"}, status=403)
+
+    orders = filter_cashier_orders(
+        request.GET.get('status', 'delivered'),
+        request.GET.get('table', ''),
+        request.GET.get('date', 'today'),
+    )
+    page_obj = keyset_paginate(orders, request.GET.get('cursor'), CASHIER_PAGE_SIZE)
+
+    return render(request, 'orders/partials/cashier_order_rows.html', {
+        'page_obj': page_obj,
+        'filter_query': filter_query(request),
+    })
+
 @cashier_login_required
 @require_http_methods(["POST"])
 def mark_order_paid(request, order_id):
@@ -271,7 +276,15 @@ def mark_order_paid(request, order_id):
         else:
             order.notes += f"\n[PAYMENT] Method: {payment_method.upper()}"
 
-        order.save()
+        with transaction.atomic():
+            order.save()
+            Payment.objects.create(
+                order=order,
+                method=settlement_service.normalize_payment_method(payment_method),
+                amount=order.total_amount,
+                received_by=request.user,
+                notes=notes
+            )
 
         return JsonResponse({
             'success': True,
@@ -302,55 +315,77 @@ def reset_table(request, table_number):
 
         table = get_object_or_404(Table, number=table_number, is_active=True)
 
-        # Find unpaid orders for this table
-        unpaid_orders = Order.objects.filter(
-            table=table,
-            status__in=['pending', 'confirmed', 'preparing', 'ready', 'delivered']
-        )
+        # Get cancellation reason
+        data = json.loads(request.body) if request.body else {}
+        reason = data.get('reason', 'Table reset by cashier')
+
+        # Cancel every active order in one set-based operation
+        reset = settlement_service.reset_table(table, reason=reason, user=request.user)
 
-        if not unpaid_orders.exists():
+        if reset is None:
             logger.info(f"Table {table_number} already clear - no orders to cancel")
             return JsonResponse({
                 'message': f'Table {table_number} is already clear',
                 'orders_cancelled': 0
             })
 
-        # Get cancellation reason
-        data = json.loads(request.body) if request.body else {}
-        reason = data.get('reason', 'Table reset by cashier')
+        logger.info(f"Table {table_number} successfully reset by {request.user.username} - {reset['orders_cancelled']} orders cancelled in {reset['timing']['total_ms']}ms")
 
-        # Cancel all unpaid orders
-        cancelled_count = 0
-        cancelled_orders = []
+        return JsonResponse({
+            'success': True,
+            'message': f'Table {table_number} has been reset',
+            'orders_cancelled': reset['orders_cancelled'],
+            'cancelled_orders': reset['cancelled_orders'],
+            'table_number': table_number,
+            'timing': reset['timing']
+        })
 
-        for order in unpaid_orders:
-            old_status = order.status
-            order.status = OrderStatus.CANCELLED
-            order.notes += f"\n[CANCELLED] {reason} - by {request.user.username}"
-            order.save()
+    except Exception as e:
+        logger.error(f"Error resetting table {table_number}: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
 
-            # Log the cancellation
-            logger.info(f"Order {order.id} cancelled by {request.user.username} during table {table_number} reset")
+@cashier_login_required
+@require_http_methods(["POST"])
+def settle_table(request, table_number):
+    """Pay every ready/delivered order on a table in one operation"""
+    logger.info(f"Cashier {request.user.username} attempting to settle table {table_number}")
 
-            cancelled_count += 1
-            cancelled_orders.append({
-                'id': str(order.id)[:8],
-                'old_status': old_status,
-                'total_amount': str(order.total_amount)
-            })
+    try:
+        if not request.user.has_perm('orders.change_order'):
+            logger.error(f"User {request.user.username} lacks permission to settle tables")
+            return JsonResponse({
+                'error': 'You do not have permission to mark orders as paid'
+            }, status=403)
 
-        logger.info(f"Table {table_number} successfully reset by {request.user.username} - {cancelled_count} orders cancelled")
+        table = get_object_or_404(Table, number=table_number, is_active=True)
+        data = json.loads(request.body) if request.body else {}
 
+        try:
+            settlement = settlement_service.settle_table(
+                table,
+                payment_method=data.get('payment_method', 'cash'),
+                user=request.user,
+                payment_amount=data.get('payment_amount'),
+                notes=data.get('notes', '')
+            )
+        except settlement_service.SettlementError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        if settlement is None:
+            return JsonResponse({
+                'message': f'Table {table_number} has no orders awaiting payment',
+                'orders_paid': 0
+            })
+
+        logger.info(f"Table {table_number} settled by {request.user.username} - {settlement['orders_paid']} orders")
         return JsonResponse({
             'success': True,
-            'message': f'Table {table_number} has been reset',
-            'orders_cancelled': cancelled_count,
-            'cancelled_orders': cancelled_orders,
-            'table_number': table_number
+            'message': f"Table {table_number} settled via {settlement['payment_method']}",
+            **settlement
         })
 
     except Exception as e:
-        logger.error(f"Error resetting table {table_number}: {str(e)}")
+        logger.error(f"Error settling table {table_number}: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
 @cashier_login_required
@@ -361,7 +396,7 @@ def order_details(request, order_id):
 
         # Serialize order data
         items_data = []
-        for item in order.items.all():
+        for item in order.items.select_related('menu_item__category', 'vendor'):
             items_data.append({
                 'id': item.id,
                 'name': item.menu_item.name,
@@ -369,7 +404,7 @@ def order_details(request, order_id):
                 'unit_price': str(item.unit_price),
                 'subtotal': str(item.subtotal),
                 'special_instructions': item.special_instructions,
-                'vendor': item.menu_item.category.vendor.name,
+                'vendor': item.vendor.name,
                 'category': item.menu_item.category.name
             })
 
@@ -401,46 +436,9 @@ def order_details(request, order_id):
 def table_status_overview(request):
     """Get overview of all table statuses"""
     try:
-        tables_data = []
-
-        for table in Table.objects.filter(is_active=True).order_by('number'):
-            # Get current orders for this table
-            current_orders = Order.objects.filter(
-                table=table,
-                status__in=['pending', 'confirmed', 'preparing', 'ready', 'delivered']
-            ).order_by('-created_at')
-
-            # Calculate table status
-            if not current_orders.exists():
-                table_status = 'available'
-                latest_order = None
-            else:
-                latest_order = current_orders.first()
-                if current_orders.filter(status__in=['delivered', 'ready']).exists():
-                    table_status = 'ready_for_payment'
-                elif current_orders.filter(status__in=['preparing', 'confirmed']).exists():
-                    table_status = 'occupied'
-                else:
-                    table_status = 'pending'
-
-            # Calculate total unpaid amount
-            unpaid_total = current_orders.aggregate(
-                total=Sum('total_amount')
-            )['total'] or 0
-
-            tables_data.append({
-                'number': table.number,
-                'seats': table.seats,
-                'status': table_status,
-                'orders_count': current_orders.count(),
-                'unpaid_total': str(unpaid_total),
-                'latest_order': {
-                    'id': str(latest_order.id)[:8] if latest_order else None,
-                    'status': latest_order.status if latest_order else None,
-                    'created_at': latest_order.created_at.isoformat() if latest_order else None,
-                    'customer_name': latest_order.customer_name if latest_order else None
-                } if latest_order else None
-            })
+        # One query over the materialized table state instead of several per table
+        tables = Table.objects.filter(is_active=True).select_related('state__latest_order').order_by('number')
+        tables_data = [serialize_table_state(table) for table in tables]
 
         return JsonResponse({
             'tables': tables_data,
@@ -456,76 +454,67 @@ def table_status_overview(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 @cashier_login_required
+@read_from_replica
 def daily_sales_report(request):
     """Generate daily sales report for cashier"""
     try:
         # Get date from request or use today
-        date_str = request.GET.get('date')
-        if date_str:
-            report_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        else:
-            report_date = timezone.now().date()
-
-        # Get orders for the specified date
-        orders = Order.objects.filter(
-            created_at__date=report_date
-        ).select_related('table').prefetch_related('items__menu_item')
-
-        # Calculate statistics
-        total_orders = orders.count()
-        paid_orders = orders.filter(status='paid')
-        pending_payment = orders.filter(status__in=['delivered', 'ready'])
-        cancelled_orders = orders.filter(status='cancelled')
-
-        total_revenue = paid_orders.aggregate(total=Sum('total_amount'))['total'] or 0
-        pending_amount = pending_payment.aggregate(total=Sum('total_amount'))['total'] or 0
-
-        # Payment method breakdown (from order notes)
-        payment_methods = {}
-        for order in paid_orders:
-            if 'PAYMENT' in order.notes:
-                if 'cash' in order.notes.lower():
-                    payment_methods['cash'] = payment_methods.get('cash', 0) + float(order.total_amount)
-                elif 'card' in order.notes.lower():
-                    payment_methods['card'] = payment_methods.get('card', 0) + float(order.total_amount)
-                else:
-                    payment_methods['other'] = payment_methods.get('other', 0) + float(order.total_amount)
-
-        # Top selling items
-        from collections import defaultdict
-        item_sales = defaultdict(lambda: {'quantity': 0, 'revenue': 0})
-
-        for order in paid_orders:
-            for item in order.items.all():
-                key = item.menu_item.name
-                item_sales[key]['quantity'] += item.quantity
-                item_sales[key]['revenue'] += float(item.subtotal)
+        report_date = business_dates.parse_date(request.GET.get('date')) or business_dates.current_business_date()
+
+        # Order counts for the day in one aggregate; paid sales come from the rollups
+        totals = Order.objects.filter(**business_dates.on_dates(report_date)).aggregate(
+            total_orders=Count('id'),
+            pending_payment=Count('id', filter=Q(status__in=['delivered', 'ready'])),
+            cancelled_orders=Count('id', filter=Q(status='cancelled')),
+            pending_amount=Sum('total_amount', filter=Q(status__in=['delivered', 'ready'])),
+        )
+        # Closed orders of older days may have moved to the archive tables
+        archived = ArchivedOrder.objects.filter(
+            **business_dates.on_dates(report_date)
+        ).aggregate(
+            total_orders=Count('id'),
+            cancelled_orders=Count('id', filter=Q(status='cancelled')),
+        )
+        totals['total_orders'] += archived['total_orders']
+        totals['cancelled_orders'] += archived['cancelled_orders']
+
+        day_rollups = SalesRollup.objects.filter(business_date=report_date)
+        site_rollups = day_rollups.filter(vendor__isnull=True, menu_item__isnull=True)
+        paid = site_rollups.aggregate(revenue=Sum('revenue'), orders=Sum('order_count'))
+        total_revenue = Decimal(paid['revenue'] or 0).quantize(Decimal('0.01'))
+        paid_count = paid['orders'] or 0
+        pending_amount = totals['pending_amount'] or 0
+
+        payment_methods = {
+            method: float(amount)
+            for method, amount in rollups.payment_method_totals(site_rollups).items()
+        }
 
         top_items = sorted(
-            item_sales.items(),
-            key=lambda x: x[1]['quantity'],
+            rollups.item_totals(day_rollups),
+            key=lambda x: x['quantity'],
             reverse=True
         )[:10]
 
         report_data = {
             'date': report_date.isoformat(),
             'summary': {
-                'total_orders': total_orders,
-                'paid_orders': paid_orders.count(),
-                'pending_payment': pending_payment.count(),
-                'cancelled_orders': cancelled_orders.count(),
+                'total_orders': totals['total_orders'],
+                'paid_orders': paid_count,
+                'pending_payment': totals['pending_payment'],
+                'cancelled_orders': totals['cancelled_orders'],
                 'total_revenue': str(total_revenue),
                 'pending_amount': str(pending_amount),
-                'average_order_value': str(total_revenue / paid_orders.count() if paid_orders.count() > 0 else 0)
+                'average_order_value': str((total_revenue / paid_count).quantize(Decimal('0.01')) if paid_count > 0 else 0)
             },
             'payment_methods': payment_methods,
             'top_items': [
                 {
-                    'name': name,
-                    'quantity': data['quantity'],
-                    'revenue': str(data['revenue'])
+                    'name': item['name'],
+                    'quantity': item['quantity'],
+                    'revenue': str(item['revenue'])
                 }
-                for name, data in top_items
+                for item in top_items
             ]
         }
 
@@ -533,3 +522,26 @@ def daily_sales_report(request):
 
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
+
+@cashier_login_required
+@cashier_permission_required('orders.view_order')
+@read_from_replica
+def export_data(request, dataset):
+    """Stream raw orders, order items or payments for accounting as CSV (or XLSX)"""
+    try:
+        if dataset not in exports.DATASETS:
+            return JsonResponse({'error': f'Unknown dataset. Choose one of {list(exports.DATASETS)}'}, status=400)
+
+        try:
+            start_date, end_date, export_format = exports.parse_export_request(request.GET)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        vendor_id = request.GET.get('vendor')
+        if vendor_id:
+            vendor_id = get_object_or_404(Vendor, id=vendor_id).id
+
+        return exports.export_response(dataset, start_date, end_date, vendor_id, export_format)
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
@@ -4,11 +4,21 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import User
 from .models import Order, OrderItem, OrderStatus
+from .outbox import BufferedSendMixin
+from . import presence
+from .snapshots import snapshot_coalescer, table_snapshot_key, vendor_snapshot_key, cashier_snapshot_key
+from . import live_stats
+from .settlement import settle_table, SettlementError
 from vendors.models import Vendor, Table
+from vendors.menu import MENU_GROUP
 
 logger = logging.getLogger(__name__)
 
-class OrderConsumer(AsyncWebsocketConsumer):
+def serialize_cashier_stats(stats):
+    """Make live cashier stats JSON-friendly"""
+    return dict(stats, total_revenue_today=float(stats['total_revenue_today']))
+
+class OrderConsumer(BufferedSendMixin, AsyncWebsocketConsumer):
     """WebSocket consumer for real-time order updates"""
 
     async def connect(self):
@@ -20,24 +30,35 @@ class OrderConsumer(AsyncWebsocketConsumer):
             self.table_group_name,
             self.channel_name
         )
+        await presence.ajoin(self.table_group_name, self.channel_name)
+
+        # Menu edits are broadcast once to every customer connection
+        await self.channel_layer.group_add(MENU_GROUP, self.channel_name)
+        await presence.ajoin(MENU_GROUP, self.channel_name)
 
         await self.accept()
+        self.start_outbox()
 
         # Send current orders for this table
-        orders = await self.get_table_orders()
-        await self.send(text_data=json.dumps({
+        orders = await self.load_table_orders()
+        await self.send_event({
             'type': 'order_list',
             'orders': orders
-        }))
+        }, coalesce_key=('order_list',))
 
         logger.info(f"Customer connected to table {self.table_number}")
 
     async def disconnect(self, close_code):
+        await self.stop_outbox()
+
         # Leave table group
+        await presence.aleave(self.table_group_name, self.channel_name)
         await self.channel_layer.group_discard(
             self.table_group_name,
             self.channel_name
         )
+        await presence.aleave(MENU_GROUP, self.channel_name)
+        await self.channel_layer.group_discard(MENU_GROUP, self.channel_name)
         logger.info(f"Customer disconnected from table {self.table_number}")
 
     async def receive(self, text_data):
@@ -46,45 +67,95 @@ class OrderConsumer(AsyncWebsocketConsumer):
             message_type = data.get('type')
 
             if message_type == 'ping':
-                await self.send(text_data=json.dumps({'type': 'pong'}))
+                await self.send_event({'type': 'pong'})
 
             elif message_type == 'get_orders':
-                orders = await self.get_table_orders()
-                await self.send(text_data=json.dumps({
+                orders = await self.load_table_orders()
+                await self.send_event({
                     'type': 'order_list',
                     'orders': orders
-                }))
+                }, coalesce_key=('order_list',))
 
         except Exception as e:
             logger.error(f"Error in OrderConsumer.receive: {e}")
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'error',
                 'message': 'An error occurred'
-            }))
+            })
 
     async def order_update(self, event):
         """Handle order update from group"""
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'order_update',
             'order': event['order']
-        }))
+        }, coalesce_key=('order_update', event['order']['id']))
 
     async def order_status_change(self, event):
         """Handle order status change from group"""
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'order_status_change',
             'order_id': event['order_id'],
             'status': event['status'],
             'message': event.get('message', '')
-        }))
+        }, coalesce_key=('order_status_change', event['order_id']))
+
+    async def table_settled(self, event):
+        """Handle every payable order on this table being paid at once"""
+        # One event per group on the wire; the page gets its usual per-order frames
+        for order in event['settlement']['orders']:
+            await self.order_status_change({
+                'order_id': order['id'],
+                'status': 'paid',
+                'message': 'Your order has been paid'
+            })
+
+    async def table_reset(self, event):
+        """Handle this table's active orders being cancelled by a cashier"""
+        for order_id in event['reset']['order_ids']:
+            await self.order_status_change({
+                'order_id': order_id,
+                'status': 'cancelled',
+                'message': 'Your order has been cancelled'
+            })
+
+    async def eta_update(self, event):
+        """Handle revised ready-time estimates for this table's orders"""
+        await self.send_event({
+            'type': 'eta_update',
+            'estimates': event['estimates']
+        })
+
+    async def menu_update(self, event):
+        """Handle one batch of menu item changes"""
+        await self.send_event({
+            'type': 'menu_update',
+            'version': event['version'],
+            'vendor_id': event['vendor_id'],
+            'items': event['items']
+        })
 
     async def new_order(self, event):
         """Handle new order notification"""
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'new_order',
             'order': event['order']
+        })
+
+    async def resync(self):
+        """Replace a discarded backlog with a fresh order list"""
+        orders = await self.load_table_orders()
+        await self.send(text_data=json.dumps({
+            'type': 'order_list',
+            'orders': orders
         }))
 
+    async def load_table_orders(self):
+        """Load the table snapshot, sharing the query with concurrent reconnects"""
+        return await snapshot_coalescer.get(
+            table_snapshot_key(self.table_number),
+            self.get_table_orders
+        )
+
     @database_sync_to_async
     def get_table_orders(self):
         """Get current orders for the table"""
@@ -93,7 +164,7 @@ class OrderConsumer(AsyncWebsocketConsumer):
             orders = Order.objects.filter(
                 table=table,
                 status__in=['pending', 'confirmed', 'preparing', 'ready']
-            ).order_by('-created_at')
+            ).prefetch_related('items__menu_item', 'items__vendor').order_by('-created_at')
 
             orders_data = []
             for order in orders:
@@ -125,7 +196,7 @@ class OrderConsumer(AsyncWebsocketConsumer):
             return []
 
 
-class VendorConsumer(AsyncWebsocketConsumer):
+class VendorConsumer(BufferedSendMixin, AsyncWebsocketConsumer):
     """WebSocket consumer for vendor dashboard"""
 
     async def connect(self):
@@ -150,24 +221,29 @@ class VendorConsumer(AsyncWebsocketConsumer):
             self.vendor_group_name,
             self.channel_name
         )
+        await presence.ajoin(self.vendor_group_name, self.channel_name)
         logger.info(f"VendorConsumer: Successfully joined group {self.vendor_group_name}")
 
         await self.accept()
+        self.start_outbox()
         logger.info(f"VendorConsumer: Connection accepted for vendor {self.vendor_id}")
 
         # Send current orders for this vendor
-        orders = await self.get_vendor_orders()
+        orders = await self.load_vendor_orders()
         logger.info(f"VendorConsumer: Sending {len(orders)} orders to vendor {self.vendor_id}")
 
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'order_list',
             'orders': orders
-        }))
+        }, coalesce_key=('order_list',))
 
         logger.info(f"Vendor {self.vendor_id} connected successfully")
 
     async def disconnect(self, close_code):
+        await self.stop_outbox()
+
         # Leave vendor group
+        await presence.aleave(self.vendor_group_name, self.channel_name)
         await self.channel_layer.group_discard(
             self.vendor_group_name,
             self.channel_name
@@ -182,24 +258,24 @@ class VendorConsumer(AsyncWebsocketConsumer):
             logger.info(f"VendorConsumer: Received message type: {message_type}")
 
             if message_type == 'ping':
-                await self.send(text_data=json.dumps({'type': 'pong'}))
+                await self.send_event({'type': 'pong'})
 
             elif message_type == 'update_order_status':
                 await self.update_order_status(data)
 
             elif message_type == 'get_orders':
-                orders = await self.get_vendor_orders()
-                await self.send(text_data=json.dumps({
+                orders = await self.load_vendor_orders()
+                await self.send_event({
                     'type': 'order_list',
                     'orders': orders
-                }))
+                }, coalesce_key=('order_list',))
 
         except Exception as e:
             logger.error(f"Error in VendorConsumer.receive: {e}", exc_info=True)
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'error',
                 'message': 'An error occurred'
-            }))
+            })
 
     async def update_order_status(self, data):
         """Update order status"""
@@ -207,34 +283,36 @@ class VendorConsumer(AsyncWebsocketConsumer):
         new_status = data.get('status')
 
         if not order_id or not new_status:
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'error',
                 'message': 'Missing order_id or status'
-            }))
+            })
             return
 
         success = await self.set_order_status(order_id, new_status)
         if success:
             # Send confirmation back to vendor
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'order_status_change',
                 'order_id': order_id,
                 'status': new_status,
                 'message': f'Order status updated to {new_status}'
-            }))
+            })
 
             # Notify the table about status change
             order = await self.get_order_details(order_id)
             if order:
-                await self.channel_layer.group_send(
-                    f'table_{order["table_number"]}',
-                    {
-                        'type': 'order_status_change',
-                        'order_id': order_id,
-                        'status': new_status,
-                        'message': f'Order status updated to {new_status}'
-                    }
-                )
+                table_group = f'table_{order["table_number"]}'
+                if await presence.alistening(table_group):
+                    await self.channel_layer.group_send(
+                        table_group,
+                        {
+                            'type': 'order_status_change',
+                            'order_id': order_id,
+                            'status': new_status,
+                            'message': f'Order status updated to {new_status}'
+                        }
+                    )
 
                 # Also notify other vendors if needed
                 await self.channel_layer.group_send(
@@ -246,11 +324,11 @@ class VendorConsumer(AsyncWebsocketConsumer):
                 )
 
                 # Notify cashier dashboard about status change
-                if new_status in ['ready', 'delivered']:
+                if new_status in ['ready', 'delivered'] and await presence.alistening('cashier_dashboard'):
                     # Get updated statistics
-                    cashier_consumer = CashierConsumer()
-                    cashier_consumer.scope = {'user': self.scope['user']}
-                    stats = await cashier_consumer.get_cashier_stats()
+                    stats = serialize_cashier_stats(
+                        await database_sync_to_async(live_stats.get_cashier_stats)()
+                    )
 
                     await self.channel_layer.group_send(
                         'cashier_dashboard',
@@ -263,10 +341,10 @@ class VendorConsumer(AsyncWebsocketConsumer):
                         }
                     )
         else:
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'error',
                 'message': 'Failed to update order status'
-            }))
+            })
 
 
     async def order_update(self, event):
@@ -274,10 +352,30 @@ class VendorConsumer(AsyncWebsocketConsumer):
         logger.info(f"VendorConsumer.order_update: Received for vendor {self.vendor_id}")
         # Don't send to self if we initiated the update
         if event.get('sender_channel_name') != self.channel_name:
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'order_update',
                 'order': event['order']
-            }))
+            }, coalesce_key=('order_update', (event['order'] or {}).get('id')))
+
+    async def table_settled(self, event):
+        """Handle a table settlement that paid some of this vendor's orders"""
+        for order in event['settlement']['orders']:
+            await self.send_event({
+                'type': 'order_status_change',
+                'order_id': order['id'],
+                'status': 'paid',
+                'message': f"Table {event['settlement']['table_number']} has been settled"
+            }, coalesce_key=('order_status_change', order['id']))
+
+    async def table_reset(self, event):
+        """Handle a table reset that cancelled some of this vendor's orders"""
+        for order_id in event['reset']['order_ids']:
+            await self.send_event({
+                'type': 'order_status_change',
+                'order_id': order_id,
+                'status': 'cancelled',
+                'message': f"Table {event['reset']['table_number']} has been reset"
+            }, coalesce_key=('order_status_change', order_id))
 
     async def new_order_for_vendor(self, event):
         """Handle new order notification for vendor"""
@@ -316,14 +414,22 @@ class VendorConsumer(AsyncWebsocketConsumer):
         # Only send if vendor has items in this order
         if vendor_items:
             logger.info(f"VendorConsumer: Sending new_order_for_vendor to vendor {self.vendor_id} with {len(vendor_items)} items")
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'new_order_for_vendor',
                 'order': formatted_order
-            }))
+            })
             logger.info(f"VendorConsumer: new_order_for_vendor sent successfully to vendor {self.vendor_id}")
         else:
             logger.info(f"VendorConsumer: No items for vendor {self.vendor_id} in this order, not sending")
 
+    async def resync(self):
+        """Replace a discarded backlog with a fresh order list"""
+        orders = await self.load_vendor_orders()
+        await self.send(text_data=json.dumps({
+            'type': 'order_list',
+            'orders': orders
+        }))
+
     @database_sync_to_async
     def check_vendor_permission(self):
         """Check if user has permission to access vendor dashboard"""
@@ -349,6 +455,13 @@ class VendorConsumer(AsyncWebsocketConsumer):
             logger.error(f"VendorConsumer.check_vendor_permission: Vendor {self.vendor_id} does not exist")
             return False
 
+    async def load_vendor_orders(self):
+        """Load the vendor snapshot, sharing the query with concurrent reconnects"""
+        return await snapshot_coalescer.get(
+            vendor_snapshot_key(self.vendor_id),
+            self.get_vendor_orders
+        )
+
     @database_sync_to_async
     def get_vendor_orders(self):
         """Get current orders for the vendor"""
@@ -357,9 +470,9 @@ class VendorConsumer(AsyncWebsocketConsumer):
 
             # Get orders that contain items from this vendor
             order_items = OrderItem.objects.filter(
-                menu_item__category__vendor=vendor,
+                vendor=vendor,
                 order__status__in=['pending', 'confirmed', 'preparing', 'ready']
-            ).select_related('order', 'menu_item').order_by('-order__created_at')
+            ).select_related('order__table', 'menu_item').order_by('-order__created_at')
 
             orders_data = {}
             for item in order_items:
@@ -433,12 +546,12 @@ class VendorConsumer(AsyncWebsocketConsumer):
     def get_order_for_cashier_sync(self, order_id):
         """Synchronous version of get_order_for_cashier"""
         try:
-            order = Order.objects.select_related('table').prefetch_related('items__menu_item__category__vendor').get(id=order_id)
+            order = Order.objects.select_related('table').prefetch_related('items__menu_item', 'items__vendor').get(id=order_id)
 
             # Group items by vendor
             vendor_items = {}
             for item in order.items.all():
-                vendor_name = item.menu_item.category.vendor.name
+                vendor_name = item.vendor.name
                 if vendor_name not in vendor_items:
                     vendor_items[vendor_name] = []
 
@@ -484,7 +597,7 @@ class VendorConsumer(AsyncWebsocketConsumer):
 
             # Get all items for this order
             items = []
-            for order_item in order.items.all():
+            for order_item in order.items.select_related('menu_item', 'vendor'):
                 items.append({
                     'id': order_item.id,
                     'name': order_item.menu_item.name,
@@ -505,12 +618,12 @@ class VendorConsumer(AsyncWebsocketConsumer):
     def get_order_for_cashier(self, order_id):
         """Get order details formatted for cashier dashboard"""
         try:
-            order = Order.objects.select_related('table').prefetch_related('items__menu_item__category__vendor').get(id=order_id)
+            order = Order.objects.select_related('table').prefetch_related('items__menu_item', 'items__vendor').get(id=order_id)
 
             # Group items by vendor
             vendor_items = {}
             for item in order.items.all():
-                vendor_name = item.menu_item.category.vendor.name
+                vendor_name = item.vendor.name
                 if vendor_name not in vendor_items:
                     vendor_items[vendor_name] = []
 
@@ -551,7 +664,7 @@ class VendorConsumer(AsyncWebsocketConsumer):
 
 
 
-class CashierConsumer(AsyncWebsocketConsumer):
+class CashierConsumer(BufferedSendMixin, AsyncWebsocketConsumer):
     """WebSocket consumer for cashier dashboard - real-time payment updates"""
 
     async def connect(self):
@@ -570,25 +683,30 @@ class CashierConsumer(AsyncWebsocketConsumer):
             self.cashier_group_name,
             self.channel_name
         )
+        await presence.ajoin(self.cashier_group_name, self.channel_name)
         logger.info(f"CashierConsumer: Successfully joined group {self.cashier_group_name}")
 
         await self.accept()
+        self.start_outbox()
 
         # Send current unpaid orders
-        orders = await self.get_unpaid_orders()
+        orders = await self.load_unpaid_orders()
         stats = await self.get_cashier_stats()
         logger.info(f"CashierConsumer: Sending initial data - {len(orders)} unpaid orders")
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'order_list',
             'orders': orders,
             'stats': stats
-        }))
+        }, coalesce_key=('order_list',))
 
         logger.info(f"CashierConsumer: Cashier {self.scope['user'].username} connected to dashboard")
 
     async def disconnect(self, close_code):
+        await self.stop_outbox()
+
         # Leave cashier group
         logger.info(f"CashierConsumer: Disconnecting from group {self.cashier_group_name}")
+        await presence.aleave(self.cashier_group_name, self.channel_name)
         await self.channel_layer.group_discard(
             self.cashier_group_name,
             self.channel_name
@@ -604,53 +722,86 @@ class CashierConsumer(AsyncWebsocketConsumer):
             logger.info(f"CashierConsumer: Received message type: {message_type}")
 
             if message_type == 'ping':
-                await self.send(text_data=json.dumps({'type': 'pong'}))
+                await self.send_event({'type': 'pong'})
 
             elif message_type == 'get_orders':
-                orders = await self.get_unpaid_orders()
+                orders = await self.load_unpaid_orders()
                 stats = await self.get_cashier_stats()
-                await self.send(text_data=json.dumps({
+                await self.send_event({
                     'type': 'order_list',
                     'orders': orders,
                     'stats': stats
-                }))
+                }, coalesce_key=('order_list',))
 
             elif message_type == 'mark_paid':
                 await self.mark_order_paid(data)
 
+            elif message_type == 'settle_table':
+                await self.send_event(await self.settle_table(data))
+
         except Exception as e:
             logger.error(f"Error in CashierConsumer.receive: {e}", exc_info=True)
-            await self.send(text_data=json.dumps({
+            await self.send_event({
                 'type': 'error',
                 'message': 'An error occurred'
-            }))
+            })
 
     async def order_ready_for_payment(self, event):
         """Handle new order ready for payment"""
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'new_order_ready',
             'order': event['order']
-        }))
+        }, coalesce_key=('new_order_ready', event['order']['id']))
 
     async def order_payment_update(self, event):
         """Handle order payment update broadcast"""
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'order_payment_update',
             'order_id': event['order_id'],
-            'status': event['status']
-        }))
+            'status': event['status'],
+            'stats': event.get('stats')
+        }, coalesce_key=('order_payment_update', event['order_id']))
+
+    async def table_settled(self, event):
+        """Handle a whole table being paid in one settlement"""
+        for order in event['settlement']['orders']:
+            await self.order_payment_update({
+                'order_id': order['id'],
+                'status': 'paid',
+                'stats': event.get('stats')
+            })
+
+    async def table_reset(self, event):
+        """Handle a table's active orders being cancelled"""
+        # Cancelled orders leave the payment queue just like paid ones
+        for order_id in event['reset']['order_ids']:
+            await self.order_payment_update({
+                'order_id': order_id,
+                'status': 'cancelled',
+                'stats': event.get('stats')
+            })
 
     async def order_status_update(self, event):
         """Handle order status update from vendors"""
         logger.info(f"CashierConsumer.order_status_update: Received status update for order {event['order_id']} - status: {event['status']}")
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'order_status_update',
             'order_id': event['order_id'],
             'status': event['status'],
             'stats': event.get('stats', {}),
             'order': event.get('order')
+        }, coalesce_key=('order_status_update', event['order_id']))
+        logger.info(f"CashierConsumer.order_status_update: Queued update for cashier dashboard")
+
+    async def resync(self):
+        """Replace a discarded backlog with fresh unpaid orders and stats"""
+        orders = await self.load_unpaid_orders()
+        stats = await self.get_cashier_stats()
+        await self.send(text_data=json.dumps({
+            'type': 'order_list',
+            'orders': orders,
+            'stats': stats
         }))
-        logger.info(f"CashierConsumer.order_status_update: Sent update to cashier dashboard")
 
     @database_sync_to_async
     def check_cashier_permission(self):
@@ -664,6 +815,13 @@ class CashierConsumer(AsyncWebsocketConsumer):
                 user.has_perm('orders.change_order') or
                 user.is_staff)
 
+    async def load_unpaid_orders(self):
+        """Load the unpaid-orders snapshot, sharing the query with concurrent reconnects"""
+        return await snapshot_coalescer.get(
+            cashier_snapshot_key('unpaid'),
+            self.get_unpaid_orders
+        )
+
     @database_sync_to_async
     def get_unpaid_orders(self):
         """Get all unpaid orders ready for payment"""
@@ -671,14 +829,14 @@ class CashierConsumer(AsyncWebsocketConsumer):
 
         orders = Order.objects.filter(
             status__in=['delivered', 'ready']
-        ).select_related('table').prefetch_related('items__menu_item__category__vendor').order_by('-created_at')
+        ).select_related('table').prefetch_related('items__menu_item', 'items__vendor').order_by('-created_at')
 
         orders_data = []
         for order in orders:
             # Group items by vendor
             vendor_items = {}
             for item in order.items.all():
-                vendor_name = item.menu_item.category.vendor.name
+                vendor_name = item.vendor.name
                 if vendor_name not in vendor_items:
                     vendor_items[vendor_name] = []
 
@@ -705,26 +863,7 @@ class CashierConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def get_cashier_stats(self):
         """Get current statistics for cashier dashboard"""
-        from django.utils import timezone
-        from django.db.models import Sum
-        from vendors.models import Table
-
-        today = timezone.now().date()
-
-        stats = {
-            'total_orders_today': Order.objects.filter(created_at__date=today).count(),
-            'unpaid_orders': Order.objects.filter(status__in=['delivered', 'ready']).count(),
-            'paid_orders_today': Order.objects.filter(status='paid', created_at__date=today).count(),
-            'total_revenue_today': float(Order.objects.filter(
-                status='paid',
-                created_at__date=today
-            ).aggregate(total=Sum('total_amount'))['total'] or 0),
-            'active_tables': Table.objects.filter(
-                orders__status__in=['pending', 'confirmed', 'preparing', 'ready', 'delivered']
-            ).distinct().count()
-        }
-
-        return stats
+        return serialize_cashier_stats(live_stats.get_cashier_stats())
 
     @database_sync_to_async
     def mark_order_paid(self, data):
@@ -770,6 +909,32 @@ class CashierConsumer(AsyncWebsocketConsumer):
         except Order.DoesNotExist:
             return False
 
+    @database_sync_to_async
+    def settle_table(self, data):
+        """Pay every ready/delivered order on a table in one operation"""
+        user = self.scope.get('user')
+        if not user.has_perm('orders.change_order'):
+            return {'type': 'error', 'message': 'You do not have permission to mark orders as paid'}
+
+        try:
+            table = Table.objects.get(number=data.get('table_number'), is_active=True)
+            settlement = settle_table(
+                table,
+                payment_method=data.get('payment_method', 'cash'),
+                user=user,
+                payment_amount=data.get('payment_amount'),
+                notes=data.get('notes', '')
+            )
+        except Table.DoesNotExist:
+            return {'type': 'error', 'message': 'Table not found'}
+        except SettlementError as e:
+            return {'type': 'error', 'message': str(e)}
+
+        if settlement is None:
+            return {'type': 'settle_table_result', 'success': True, 'orders_paid': 0,
+                    'table_number': table.number}
+        return {'type': 'settle_table_result', 'success': True, **settlement}
+
     def get_time_elapsed(self, created_at):
         """Get human-readable time elapsed"""
         from django.utils import timezone
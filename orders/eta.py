@@ -0,0 +1,395 @@
+"""
+Queue-aware ready-time estimates.
+
+Each vendor works through its active orders (pending, confirmed, preparing)
+first come, first served, with up to `Vendor.parallel_capacity` orders on the
+go at once. An order's work at a vendor is the longest preparation time among
+its lines there, plus ETA_EXTRA_UNIT_MINUTES for every additional unit.
+Scheduling the queue onto that many slots gives every order a finish time per
+vendor, and the order is ready when its last vendor finishes.
+
+Queues live in the cache and are changed incrementally from the order signals:
+an order joins its vendors' queues when its items are saved, starts its clock
+when it moves to preparing and leaves when it is ready, cancelled, paid or
+deleted. Only the touched queues are rescheduled, in memory. Orders whose
+estimate moved get `estimated_ready_time` written in one bulk update and an
+`eta_update` event pushed to their table.
+
+A queue missing from the cache, or older than ETA_QUEUE_REBUILD_INTERVAL, is
+rebuilt from the database once, which also heals any update lost to two
+workers (or two threads of one worker) writing the same queue at the same
+moment. Every update reschedules its own copy of the queues, so no lock is
+held across the database and cache round-trips.
+"""
+import heapq
+import logging
+import threading
+import time
+import weakref
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Sum
+
+from . import presence
+
+logger = logging.getLogger(__name__)
+
+QUEUE_STATUSES = ('pending', 'confirmed', 'preparing')
+
+KEY_PREFIX = 'eta'
+
+
+class _Pending(threading.local):
+    # on_commit callbacks run on the thread that owns the connection
+    def __init__(self):
+        self.changed = weakref.WeakValueDictionary()
+
+
+_pending = _Pending()
+
+
+def _queue_key(vendor_id):
+    return f'{KEY_PREFIX}:queue:{vendor_id}'
+
+
+def _order_key(order_id):
+    return f'{KEY_PREFIX}:order:{order_id}'
+
+
+def _ttl():
+    return getattr(settings, 'ETA_CACHE_TTL', 60 * 60 * 12)
+
+
+def _job_minutes(longest, units):
+    extra = getattr(settings, 'ETA_EXTRA_UNIT_MINUTES', 1)
+    return (longest or 15) + max((units or 1) - 1, 0) * extra
+
+
+def _timestamp(value):
+    return value.timestamp() if value else None
+
+
+def schedule(jobs, capacity, now):
+    """
+    Assign queued jobs to `capacity` parallel slots in arrival order.
+
+    Returns {order_id: (finish_timestamp, queue_position)}; position 0 means
+    the order is being prepared now.
+    """
+    slots = [now] * max(capacity, 1)
+    result = {}
+
+    # Orders already being prepared hold a slot until they finish
+    started = sorted(
+        (job for job in jobs.items() if job[1]['started_at'] is not None),
+        key=lambda job: job[1]['started_at']
+    )
+    for order_id, job in started:
+        finish = max(job['started_at'] + job['minutes'] * 60, now)
+        free_at = heapq.heappop(slots)
+        heapq.heappush(slots, max(free_at, finish))
+        result[order_id] = (finish, 0)
+
+    waiting = sorted(
+        (job for job in jobs.items() if job[1]['started_at'] is None),
+        key=lambda job: job[1]['queued_at']
+    )
+    for position, (order_id, job) in enumerate(waiting, start=1):
+        free_at = heapq.heappop(slots)
+        finish = free_at + job['minutes'] * 60
+        heapq.heappush(slots, finish)
+        result[order_id] = (finish, position)
+
+    return result
+
+
+def _build_queue(vendor_id):
+    """Load one vendor's active queue from the database"""
+    from vendors.models import Vendor
+    from .models import OrderItem, OrderStatusHistory
+
+    capacity = Vendor.objects.filter(pk=vendor_id).values_list('parallel_capacity', flat=True).first() or 1
+    lines = (
+        OrderItem.objects
+        .filter(vendor_id=vendor_id, order__status__in=QUEUE_STATUSES)
+        .values('order_id', 'order__table__number', 'order__created_at', 'order__status', 'order__confirmed_at')
+        .annotate(longest=Max('menu_item__preparation_time'), units=Sum('quantity'))
+    )
+    lines = list(lines)
+
+    preparing = [line['order_id'] for line in lines if line['order__status'] == 'preparing']
+    started = dict(
+        OrderStatusHistory.objects
+        .filter(order_id__in=preparing, status='preparing')
+        .values('order_id')
+        .annotate(at=Max('timestamp'))
+        .values_list('order_id', 'at')
+    ) if preparing else {}
+
+    jobs = {}
+    for line in lines:
+        started_at = None
+        if line['order__status'] == 'preparing':
+            started_at = started.get(line['order_id']) or line['order__confirmed_at'] or line['order__created_at']
+        jobs[str(line['order_id'])] = {
+            'table': line['order__table__number'],
+            'queued_at': _timestamp(line['order__created_at']),
+            'started_at': _timestamp(started_at),
+            'minutes': _job_minutes(line['longest'], line['units']),
+        }
+
+    return {'built_at': time.time(), 'capacity': capacity, 'jobs': jobs}
+
+
+def _load_queues(vendor_ids):
+    """Cached queues for `vendor_ids`, rebuilding any that are missing or stale"""
+    keys = {vendor_id: _queue_key(vendor_id) for vendor_id in vendor_ids}
+    cached = cache.get_many(list(keys.values()))
+    max_age = getattr(settings, 'ETA_QUEUE_REBUILD_INTERVAL', 300)
+
+    queues = {}
+    for vendor_id, key in keys.items():
+        queue = cached.get(key)
+        if queue is None or time.time() - queue['built_at'] > max_age:
+            queue = _build_queue(vendor_id)
+        queues[vendor_id] = queue
+    return queues
+
+
+def _apply(vendor_ids, change, force=()):
+    """
+    Load the queues of `vendor_ids`, let `change(vendor_id, jobs)` edit their
+    jobs in place, reschedule them and publish the estimates that moved.
+
+    Orders in `force` are published even if unchanged: the save that triggered
+    the update may have written a stale estimate from the instance over ours.
+    """
+    vendor_ids = [vendor_id for vendor_id in set(vendor_ids) if vendor_id is not None]
+    if not vendor_ids:
+        return
+
+    now = time.time()
+    threshold = getattr(settings, 'ETA_UPDATE_THRESHOLD', 30)
+    queues = _load_queues(vendor_ids)
+
+    finishes = {}
+    tables = {}
+    touched = set()
+    for vendor_id, queue in queues.items():
+        before = set(queue['jobs'])
+        change(vendor_id, queue['jobs'])
+        # Orders that left this queue still need their record updated
+        touched.update(before - set(queue['jobs']))
+        for order_id, (finish, position) in schedule(queue['jobs'], queue['capacity'], now).items():
+            finishes.setdefault(order_id, {})[vendor_id] = (finish, position)
+            tables[order_id] = queue['jobs'][order_id]['table']
+    touched.update(finishes)
+
+    # Each order's record holds its finish time at every vendor it is queued at
+    order_keys = {order_id: _order_key(order_id) for order_id in touched}
+    records = cache.get_many(list(order_keys.values()))
+
+    updated_records = {}
+    removed_keys = []
+    estimates = {}
+    for order_id, key in order_keys.items():
+        record = dict(records.get(key) or {})
+        before = max((finish for finish, _ in record.values()), default=None)
+        for vendor_id in vendor_ids:
+            record.pop(vendor_id, None)
+        record.update(finishes.get(order_id, {}))
+
+        if not record:
+            removed_keys.append(key)
+            continue
+        updated_records[key] = record
+
+        after = max(finish for finish, _ in record.values())
+        if before is None or order_id in force or abs(after - before) >= threshold:
+            estimates[order_id] = {
+                'estimated_ready_time': after,
+                'queue_position': max(position for _, position in record.values()),
+                'table_number': tables.get(order_id),
+            }
+
+    cache.set_many({_queue_key(vendor_id): queue for vendor_id, queue in queues.items()}, _ttl())
+    if updated_records:
+        cache.set_many(updated_records, _ttl())
+    if removed_keys:
+        cache.delete_many(removed_keys)
+
+    if estimates:
+        _publish(estimates)
+
+
+def _publish(estimates):
+    """Write the moved estimates to the orders and push them to their tables"""
+    from .models import Order
+
+    orders = []
+    for order_id, estimate in estimates.items():
+        estimate['estimated_ready_time'] = datetime.fromtimestamp(estimate['estimated_ready_time'], tz=dt_timezone.utc)
+        orders.append(Order(id=order_id, estimated_ready_time=estimate['estimated_ready_time']))
+    # bulk_update skips the save signals, so this never re-enters the engine
+    Order.objects.bulk_update(orders, ['estimated_ready_time'])
+
+    by_table = {}
+    for order_id, estimate in estimates.items():
+        if estimate['table_number'] is None:
+            continue
+        by_table.setdefault(estimate['table_number'], []).append({
+            'order_id': order_id,
+            'estimated_ready_time': estimate['estimated_ready_time'].isoformat(),
+            'queue_position': estimate['queue_position'],
+        })
+    notify_eta_updates(by_table)
+
+
+def notify_eta_updates(by_table):
+    """Send each listening table one eta_update event with its revised estimates"""
+    groups = presence.listening(*[f'table_{number}' for number in by_table])
+    if not groups:
+        return
+
+    channel_layer = get_channel_layer()
+    try:
+        for group in groups:
+            number = int(group.split('_', 1)[1])
+            async_to_sync(channel_layer.group_send)(group, {
+                'type': 'eta_update',
+                'estimates': by_table[number],
+            })
+    except Exception as e:
+        logger.error(f"Error sending eta_update notification: {e}", exc_info=True)
+
+
+def _safely(func, *args):
+    try:
+        func(*args)
+    except Exception as e:
+        logger.error(f"ETA update failed: {e}", exc_info=True)
+
+
+def _order_lines(order):
+    """This order's work per vendor: {vendor_id: minutes}"""
+    from .models import OrderItem
+
+    return {
+        line['vendor_id']: _job_minutes(line['longest'], line['units'])
+        for line in (
+            OrderItem.objects.filter(order_id=order.pk)
+            .values('vendor_id')
+            .annotate(longest=Max('menu_item__preparation_time'), units=Sum('quantity'))
+        )
+    }
+
+
+def _enqueue(order):
+    """Add or refresh the order's jobs at every vendor it has items from"""
+    lines = _order_lines(order)
+    order_id = str(order.pk)
+    job = {
+        'table': order.table.number,
+        'queued_at': _timestamp(order.created_at),
+        'started_at': time.time() if order.status == 'preparing' else None,
+    }
+
+    def change(vendor_id, jobs):
+        if vendor_id not in lines:
+            jobs.pop(order_id, None)
+            return
+        started_at = jobs.get(order_id, job)['started_at']
+        jobs[order_id] = {**job, 'started_at': started_at, 'minutes': lines[vendor_id]}
+
+    # Include vendors it was queued at before, in case a line was removed
+    record = cache.get(_order_key(order_id)) or {}
+    _apply(set(lines) | set(record), change, force=[order_id])
+
+
+def _start(order_id, vendor_ids):
+    """The order moved to preparing: its clock starts now"""
+    now = time.time()
+
+    def change(vendor_id, jobs):
+        if order_id in jobs and jobs[order_id]['started_at'] is None:
+            jobs[order_id]['started_at'] = now
+
+    _apply(vendor_ids, change, force=[order_id])
+
+
+def _remove(vendor_orders):
+    """Take orders out of their vendors' queues: {vendor_id: order ids}"""
+    def change(vendor_id, jobs):
+        for order_id in vendor_orders.get(vendor_id, ()):
+            jobs.pop(str(order_id), None)
+
+    _apply(vendor_orders, change)
+
+
+def _rebuild(vendor_id):
+    cache.delete(_queue_key(vendor_id))
+    _apply([vendor_id], lambda vendor_id, jobs: None)
+
+
+def record_items_changed(order):
+    """
+    An order's lines were added or changed: (re)queue it once the transaction commits.
+
+    Placing an order saves every line in turn. Each save registers a callback,
+    but only the one holding the latest instance of the order queues it, and it
+    takes the order off the pending map so the rest of that commit skips it.
+    """
+    if order.status not in QUEUE_STATUSES:
+        return
+
+    if not transaction.get_connection().in_atomic_block:
+        _safely(_enqueue, order)
+        return
+
+    # Weak values: a rollback discards the callbacks, and with them the entries
+    _pending.changed[order.pk] = order
+    transaction.on_commit(lambda: _enqueue_changed(order))
+
+
+def _enqueue_changed(order):
+    if _pending.changed.get(order.pk) is not order:
+        return
+    del _pending.changed[order.pk]
+    _safely(_enqueue, order)
+
+
+def record_status_change(order, old_status, new_status, vendor_ids):
+    """Move an order through its vendors' queues on a status transition"""
+    if old_status == new_status:
+        return
+
+    order_id = str(order.pk)
+    vendor_ids = set(vendor_ids)
+    if new_status in QUEUE_STATUSES and old_status not in QUEUE_STATUSES:
+        transaction.on_commit(lambda: _safely(_enqueue, order))
+    elif new_status == 'preparing':
+        transaction.on_commit(lambda: _safely(_start, order_id, vendor_ids))
+    elif old_status in QUEUE_STATUSES and new_status not in QUEUE_STATUSES:
+        transaction.on_commit(lambda: _safely(_remove, {vendor_id: [order_id] for vendor_id in vendor_ids}))
+
+
+def record_order_deleted(order, vendor_ids):
+    if order.status in QUEUE_STATUSES:
+        order_id = str(order.pk)
+        transaction.on_commit(lambda: _safely(_remove, {vendor_id: [order_id] for vendor_id in vendor_ids}))
+
+
+def record_orders_removed(vendor_orders):
+    """Orders left the queues in bulk (e.g. a table reset): {vendor_id: order ids}"""
+    transaction.on_commit(lambda: _safely(_remove, vendor_orders))
+
+
+def record_vendor_changed(vendor_id):
+    """Capacity may have changed: rebuild the vendor's queue and republish its estimates"""
+    transaction.on_commit(lambda: _safely(_rebuild, vendor_id))
+
@@ -0,0 +1,259 @@
+"""
+Streaming raw-data exports for accounting.
+
+Each dataset is a `values_list` projection read with `.iterator(chunk_size=...)`
+and written row by row, so memory stays flat however many rows are exported.
+CSV is streamed straight into a `StreamingHttpResponse` (or a file, for the
+`export_data` management command); the response gets an async iterator that
+builds each chunk of lines in a worker thread, because under ASGI Django would
+otherwise read a sync iterator to the end before sending anything.
+
+XLSX is available when openpyxl is installed; it uses a write-only workbook
+spooled to a temporary file, since a zip container cannot be streamed before
+it is finished.
+"""
+import csv
+import logging
+import tempfile
+from itertools import islice
+from datetime import datetime
+from decimal import Decimal
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import router
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from . import archive, business_dates
+
+try:
+    import openpyxl
+except ImportError:  # pragma: no cover - optional dependency
+    openpyxl = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'xlsx')
+
+
+def _orders(tables, vendor_id=None):
+    queryset = tables.order.objects.all()
+    if vendor_id:
+        queryset = queryset.filter(
+            id__in=tables.item.objects.filter(vendor_id=vendor_id).values('order_id')
+        )
+    return queryset
+
+
+def _order_items(tables, vendor_id=None):
+    queryset = tables.item.objects.all()
+    if vendor_id:
+        queryset = queryset.filter(vendor_id=vendor_id)
+    return queryset
+
+
+def _payments(tables, vendor_id=None):
+    queryset = tables.payment.objects.all()
+    if vendor_id:
+        queryset = queryset.filter(
+            order_id__in=tables.item.objects.filter(vendor_id=vendor_id).values('order_id')
+        )
+    return queryset
+
+
+# dataset -> (queryset factory, ordering field, [(column header, values_list path)])
+DATASETS = {
+    'orders': (_orders, 'created_at', [
+        ('order_id', 'id'),
+        ('created_at', 'created_at'),
+        ('business_date', 'business_date'),
+        ('table_number', 'table__number'),
+        ('customer_name', 'customer_name'),
+        ('status', 'status'),
+        ('total_amount', 'total_amount'),
+        ('paid_at', 'paid_at'),
+    ]),
+    'order_items': (_order_items, 'order__created_at', [
+        ('order_id', 'order_id'),
+        ('order_created_at', 'order__created_at'),
+        ('order_business_date', 'order__business_date'),
+        ('order_status', 'order__status'),
+        ('vendor_id', 'vendor_id'),
+        ('vendor_name', 'vendor__name'),
+        ('menu_item_id', 'menu_item_id'),
+        ('menu_item_name', 'menu_item__name'),
+        ('quantity', 'quantity'),
+        ('unit_price', 'unit_price'),
+        ('subtotal', 'subtotal'),
+    ]),
+    'payments': (_payments, 'created_at', [
+        ('payment_id', 'id'),
+        ('order_id', 'order_id'),
+        ('created_at', 'created_at'),
+        ('method', 'method'),
+        ('amount', 'amount'),
+        ('received_by', 'received_by__username'),
+        ('settlement_id', 'settlement_id'),
+    ]),
+}
+
+# Datasets selected by their order's stored business date; the rest by created_at
+BUSINESS_DATE_PREFIX = {'orders': '', 'order_items': 'order__'}
+
+
+def available_formats():
+    return FORMATS if openpyxl is not None else ('csv',)
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
+
+
+def header(dataset):
+    return [column for column, _ in DATASETS[dataset][2]]
+
+
+def iter_rows(dataset, start_date, end_date, vendor_id=None, using=None):
+    """
+    Yield formatted rows for `dataset` on business dates start_date..end_date
+    (inclusive): archived rows first, then the ones still in the hot tables.
+    `using` fixes the database alias, for generators consumed after the view returns.
+    """
+    factory, date_field, columns = DATASETS[dataset]
+    if dataset in BUSINESS_DATE_PREFIX:
+        date_filter = business_dates.on_dates(start_date, end_date, prefix=BUSINESS_DATE_PREFIX[dataset])
+    else:
+        start, end = business_dates.datetime_range(start_date, end_date)
+        date_filter = {f'{date_field}__gte': start, f'{date_field}__lt': end}
+
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    for tables in (archive.tables(archived=True), archive.tables()):
+        queryset = factory(tables, vendor_id).filter(**date_filter).order_by(date_field).values_list(
+            *[path for _, path in columns]
+        )
+        if using:
+            queryset = queryset.using(using)
+        for row in queryset.iterator(chunk_size=chunk_size):
+            yield [_cell(value) for value in row]
+
+
+class Echo:
+    """File-like object that returns what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(dataset, start_date, end_date, vendor_id=None, using=None):
+    """Yield the export as CSV text, one line at a time"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(header(dataset))
+    for row in iter_rows(dataset, start_date, end_date, vendor_id, using):
+        yield writer.writerow(row)
+
+
+def _next_chunk(lines, size):
+    return ''.join(islice(lines, size))
+
+
+async def astream_csv(dataset, start_date, end_date, vendor_id=None, using=None):
+    """Yield the export as CSV text in chunks of EXPORT_CHUNK_SIZE lines, for ASGI responses"""
+    lines = stream_csv(dataset, start_date, end_date, vendor_id, using)
+    size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    # thread_sensitive keeps every step of the database cursor on one thread and connection
+    next_chunk = sync_to_async(_next_chunk, thread_sensitive=True)
+    try:
+        while chunk := await next_chunk(lines, size):
+            yield chunk
+    finally:
+        await sync_to_async(lines.close, thread_sensitive=True)()
+
+
+def write_csv(fileobj, dataset, start_date, end_date, vendor_id=None):
+    """Write the export to an open text file; returns the number of data rows"""
+    writer = csv.writer(fileobj)
+    writer.writerow(header(dataset))
+    count = 0
+    for row in iter_rows(dataset, start_date, end_date, vendor_id):
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_xlsx(fileobj, dataset, start_date, end_date, vendor_id=None):
+    """Write the export as XLSX using a write-only workbook; returns the number of data rows"""
+    if openpyxl is None:
+        raise RuntimeError('XLSX export requires openpyxl to be installed')
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=dataset)
+    sheet.append(header(dataset))
+    count = 0
+    for row in iter_rows(dataset, start_date, end_date, vendor_id):
+        sheet.append(row)
+        count += 1
+    workbook.save(fileobj)
+    return count
+
+
+def spool_xlsx(dataset, start_date, end_date, vendor_id=None):
+    """Build an XLSX export in a temporary file, rewound and ready to stream"""
+    spool = tempfile.TemporaryFile()
+    write_xlsx(spool, dataset, start_date, end_date, vendor_id)
+    spool.seek(0)
+    return spool
+
+
+def filename(dataset, start_date, end_date, vendor_id=None, export_format='csv'):
+    vendor_part = f'_vendor{vendor_id}' if vendor_id else ''
+    return f'{dataset}{vendor_part}_{start_date.isoformat()}_{end_date.isoformat()}.{export_format}'
+
+
+def export_response(dataset, start_date, end_date, vendor_id=None, export_format='csv'):
+    """HTTP response streaming the export; callers validate dataset and format first"""
+    name = filename(dataset, start_date, end_date, vendor_id, export_format)
+    logger.info(f"Exporting {dataset} {start_date}..{end_date} vendor={vendor_id} as {export_format}")
+
+    if export_format == 'xlsx':
+        return FileResponse(
+            spool_xlsx(dataset, start_date, end_date, vendor_id),
+            as_attachment=True,
+            filename=name,
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+
+    # The CSV is generated after the view has returned, so resolve the
+    # (possibly replica) read database now while the view's routing applies
+    using = router.db_for_read(archive.tables().order)
+    response = StreamingHttpResponse(
+        astream_csv(dataset, start_date, end_date, vendor_id, using),
+        content_type='text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{name}"'
+    return response
+
+
+def parse_export_request(params, default_days=1):
+    """
+    Read start_date/end_date/format from query params.
+
+    Returns (start_date, end_date, export_format); raises ValueError with a
+    message fit for the client.
+    """
+    start_date, end_date = business_dates.parse_date_range(
+        params, default_days, max_days=getattr(settings, 'EXPORT_MAX_DAYS', 366)
+    )
+
+    export_format = params.get('format', 'csv')
+    if export_format not in available_formats():
+        raise ValueError(f'format must be one of {list(available_formats())}')
+
+    return start_date, end_date, export_format
@@ -0,0 +1,372 @@
+"""
+Incrementally maintained counters for the cashier dashboard.
+
+The cashier statistics used to be five aggregate queries (including a
+DISTINCT join over tables) run on every page view and every ready/delivered
+transition. Instead, order signals apply small deltas to a counter store as
+orders are created, change status or are deleted, and reads are O(1).
+
+Counters live in Redis hashes when Redis is reachable (shared by every worker)
+and in an in-process store otherwise. Both are periodically reconciled against
+the database: reads trigger a reconcile once CASHIER_STATS_RECONCILE_INTERVAL
+has elapsed, and `manage.py reconcile_cashier_stats` can be run from cron.
+
+The per-vendor revenue breakdown is a single grouped query cached for
+CASHIER_VENDOR_BREAKDOWN_TTL seconds and dropped whenever an order enters or
+leaves a paid or payable status.
+"""
+import logging
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from core import cache as cache_utils
+from core.db_router import primary
+from core.redis_utils import get_redis, reset_redis
+
+from .business_dates import current_business_date, on_dates
+
+logger = logging.getLogger(__name__)
+
+UNPAID_STATUSES = ('ready', 'delivered')
+ACTIVE_STATUSES = ('pending', 'confirmed', 'preparing', 'ready', 'delivered')
+
+BREAKDOWN_STATUSES = UNPAID_STATUSES + ('paid',)
+
+KEY_PREFIX = 'cashier_stats'
+
+
+def _order_date(order):
+    return order.business_date
+
+
+def _cents(amount):
+    return int((Decimal(amount or 0) * 100).quantize(Decimal('1')))
+
+
+class LocalCounterStore:
+    """Thread-safe in-process counter store"""
+
+    kind = 'local'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._days = {}
+            self._unpaid = 0
+            self._tables = {}
+            self._reconciled_at = None
+
+    def apply(self, delta):
+        with self._lock:
+            for day, fields in delta['days'].items():
+                counters = self._days.setdefault(day, {'orders': 0, 'paid': 0, 'revenue_cents': 0})
+                for field, value in fields.items():
+                    counters[field] += value
+            self._unpaid += delta['unpaid']
+            for table_id, value in delta['tables'].items():
+                count = self._tables.get(table_id, 0) + value
+                if count > 0:
+                    self._tables[table_id] = count
+                else:
+                    self._tables.pop(table_id, None)
+
+    def read(self, day):
+        with self._lock:
+            counters = self._days.get(day, {'orders': 0, 'paid': 0, 'revenue_cents': 0})
+            return {
+                'orders': counters['orders'],
+                'paid': counters['paid'],
+                'revenue_cents': counters['revenue_cents'],
+                'unpaid': self._unpaid,
+                'active_tables': len(self._tables),
+            }
+
+    def replace(self, day, snapshot, tables):
+        with self._lock:
+            self._days = {day: {
+                'orders': snapshot['orders'],
+                'paid': snapshot['paid'],
+                'revenue_cents': snapshot['revenue_cents'],
+            }}
+            self._unpaid = snapshot['unpaid']
+            self._tables = dict(tables)
+            self._reconciled_at = time.time()
+
+    def reconciled_at(self):
+        return self._reconciled_at
+
+
+class RedisCounterStore:
+    """Counter store backed by Redis hashes, shared by every worker process"""
+
+    kind = 'redis'
+    DAY_TTL = 60 * 60 * 48
+
+    def __init__(self, client):
+        self.client = client
+
+    def _day_key(self, day):
+        return f'{KEY_PREFIX}:day:{day.isoformat()}'
+
+    def apply(self, delta):
+        pipe = self.client.pipeline(transaction=True)
+        for day, fields in delta['days'].items():
+            key = self._day_key(day)
+            for field, value in fields.items():
+                if value:
+                    pipe.hincrby(key, field, value)
+            pipe.expire(key, self.DAY_TTL)
+        if delta['unpaid']:
+            pipe.hincrby(f'{KEY_PREFIX}:global', 'unpaid', delta['unpaid'])
+        for table_id, value in delta['tables'].items():
+            if value:
+                pipe.hincrby(f'{KEY_PREFIX}:tables', str(table_id), value)
+        pipe.execute()
+
+    def read(self, day):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hgetall(self._day_key(day))
+        pipe.hget(f'{KEY_PREFIX}:global', 'unpaid')
+        pipe.hvals(f'{KEY_PREFIX}:tables')
+        day_counters, unpaid, table_counts = pipe.execute()
+        return {
+            'orders': int(day_counters.get(b'orders', 0)),
+            'paid': int(day_counters.get(b'paid', 0)),
+            'revenue_cents': int(day_counters.get(b'revenue_cents', 0)),
+            'unpaid': int(unpaid or 0),
+            'active_tables': sum(1 for count in table_counts if int(count) > 0),
+        }
+
+    def replace(self, day, snapshot, tables):
+        pipe = self.client.pipeline(transaction=True)
+        day_key = self._day_key(day)
+        pipe.delete(day_key, f'{KEY_PREFIX}:tables')
+        pipe.hset(day_key, mapping={
+            'orders': snapshot['orders'],
+            'paid': snapshot['paid'],
+            'revenue_cents': snapshot['revenue_cents'],
+        })
+        pipe.expire(day_key, self.DAY_TTL)
+        pipe.hset(f'{KEY_PREFIX}:global', mapping={'unpaid': snapshot['unpaid'], 'reconciled_at': time.time()})
+        if tables:
+            pipe.hset(f'{KEY_PREFIX}:tables', mapping={str(k): v for k, v in tables.items()})
+        pipe.execute()
+
+    def reconciled_at(self):
+        value = self.client.hget(f'{KEY_PREFIX}:global', 'reconciled_at')
+        return float(value) if value else None
+
+
+_local_store = LocalCounterStore()
+_last_store_kind = None
+
+
+def get_store():
+    """Return the Redis store if Redis is reachable, otherwise the local one"""
+    global _last_store_kind
+
+    client = get_redis()
+    store = RedisCounterStore(client) if client is not None else _local_store
+    if _last_store_kind is not None and _last_store_kind != store.kind:
+        # Deltas applied to the other store while we were switched over are lost
+        logger.warning(f"Cashier stats store switched from {_last_store_kind} to {store.kind}")
+        _local_store.reset()
+        if store.kind == 'redis':
+            _mark_stale(store)
+    _last_store_kind = store.kind
+    return store
+
+
+def _mark_stale(store):
+    try:
+        store.client.hdel(f'{KEY_PREFIX}:global', 'reconciled_at')
+    except Exception as e:
+        reset_redis(e)
+
+
+def _empty_delta():
+    return {'days': {}, 'unpaid': 0, 'tables': {}}
+
+
+def _add(delta, order, sign, status):
+    """Add (sign=1) or remove (sign=-1) an order in a given status from the counters"""
+    day = delta['days'].setdefault(_order_date(order), {'orders': 0, 'paid': 0, 'revenue_cents': 0})
+    if status in UNPAID_STATUSES:
+        delta['unpaid'] += sign
+    if status in ACTIVE_STATUSES:
+        delta['tables'][order.table_id] = delta['tables'].get(order.table_id, 0) + sign
+    if status == 'paid':
+        day['paid'] += sign
+        day['revenue_cents'] += sign * _cents(order.total_amount)
+
+
+def _apply(delta):
+    def commit():
+        try:
+            get_store().apply(delta)
+        except Exception as e:
+            reset_redis(e)
+    transaction.on_commit(commit)
+
+
+def record_order_created(order):
+    delta = _empty_delta()
+    delta['days'][_order_date(order)] = {'orders': 1, 'paid': 0, 'revenue_cents': 0}
+    _add(delta, order, 1, order.status)
+    _apply(delta)
+
+
+def record_status_change(order, old_status, new_status):
+    if old_status == new_status:
+        return
+    delta = _empty_delta()
+    _add(delta, order, -1, old_status)
+    _add(delta, order, 1, new_status)
+    _apply(delta)
+    if old_status in BREAKDOWN_STATUSES or new_status in BREAKDOWN_STATUSES:
+        invalidate_vendor_breakdown()
+
+
+def record_status_changes(changes):
+    """Apply many (order, old_status, new_status) transitions as one delta"""
+    delta = _empty_delta()
+    touches_breakdown = False
+    for order, old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        _add(delta, order, -1, old_status)
+        _add(delta, order, 1, new_status)
+        touches_breakdown = touches_breakdown or old_status in BREAKDOWN_STATUSES or new_status in BREAKDOWN_STATUSES
+    _apply(delta)
+    if touches_breakdown:
+        invalidate_vendor_breakdown()
+
+
+def record_order_deleted(order):
+    delta = _empty_delta()
+    delta['days'][_order_date(order)] = {'orders': -1, 'paid': 0, 'revenue_cents': 0}
+    _add(delta, order, -1, order.status)
+    _apply(delta)
+    if order.status in BREAKDOWN_STATUSES:
+        invalidate_vendor_breakdown()
+
+
+def reconcile(store=None):
+    """Recompute every counter from the database and overwrite the store"""
+    from .models import Order
+
+    store = store or get_store()
+    today = current_business_date()
+
+    today_totals = Order.objects.filter(**on_dates(today)).aggregate(
+        orders=Count('id'),
+        paid=Count('id', filter=Q(status='paid')),
+        revenue=Sum('total_amount', filter=Q(status='paid')),
+    )
+    unpaid = Order.objects.filter(status__in=UNPAID_STATUSES).count()
+    tables = dict(
+        Order.objects.filter(status__in=ACTIVE_STATUSES)
+        .values_list('table_id')
+        .annotate(count=Count('id'))
+    )
+
+    snapshot = {
+        'orders': today_totals['orders'],
+        'paid': today_totals['paid'],
+        'revenue_cents': _cents(today_totals['revenue']),
+        'unpaid': unpaid,
+    }
+    store.replace(today, snapshot, tables)
+    logger.info(f"Cashier stats reconciled ({store.kind}): {snapshot}, {len(tables)} active tables")
+    return snapshot
+
+
+def get_cashier_stats():
+    """Current cashier statistics, reconciling first if the store is stale"""
+    interval = getattr(settings, 'CASHIER_STATS_RECONCILE_INTERVAL', 300)
+    try:
+        store = get_store()
+        reconciled_at = store.reconciled_at()
+        if reconciled_at is None or time.time() - reconciled_at > interval:
+            reconcile(store)
+        counters = store.read(current_business_date())
+    except Exception as e:
+        # Never let a counter-store hiccup break the dashboard
+        reset_redis(e)
+        reconcile(_local_store)
+        counters = _local_store.read(current_business_date())
+
+    return {
+        'total_orders_today': counters['orders'],
+        'unpaid_orders': counters['unpaid'],
+        'paid_orders_today': counters['paid'],
+        'total_revenue_today': (Decimal(counters['revenue_cents']) / 100).quantize(Decimal('0.01')),
+        'active_tables': counters['active_tables'],
+    }
+
+
+def _breakdown_key(day):
+    return f'{KEY_PREFIX}:vendor_breakdown:{day.isoformat()}'
+
+
+def invalidate_vendor_breakdown():
+    transaction.on_commit(lambda: cache.delete(_breakdown_key(current_business_date())))
+
+
+def get_vendor_breakdown():
+    """Paid (today) and unpaid revenue per vendor, from one grouped query"""
+    from vendors.models import Vendor
+    from .models import OrderItem
+
+    today = current_business_date()
+    key = _breakdown_key(today)
+    breakdown = cache.get(key)
+    cache_utils.record('cashier_breakdown', breakdown is not None)
+    if breakdown is not None:
+        return breakdown
+
+    paid = Q(order__status='paid', **on_dates(today, prefix='order__'))
+    unpaid = Q(order__status__in=UNPAID_STATUSES)
+    # Shared by every cashier until invalidated, so never built from a lagging replica
+    with primary():
+        rows = (
+            OrderItem.objects.filter(paid | unpaid)
+            .values('vendor')
+            .annotate(
+                paid_revenue=Sum('subtotal', filter=paid),
+                unpaid_revenue=Sum('subtotal', filter=unpaid),
+                paid_orders=Count('order', filter=paid, distinct=True),
+                unpaid_orders=Count('order', filter=unpaid, distinct=True),
+            )
+        )
+        totals = {row['vendor']: row for row in rows}
+        vendors = list(Vendor.objects.filter(pk__in=totals))
+
+    cent = Decimal('0.01')
+    breakdown = []
+    for vendor in vendors:
+        row = totals[vendor.pk]
+        paid_revenue = (row['paid_revenue'] or Decimal('0')).quantize(cent)
+        unpaid_revenue = (row['unpaid_revenue'] or Decimal('0')).quantize(cent)
+        if not paid_revenue and not unpaid_revenue:
+            continue
+        breakdown.append({
+            'vendor': vendor,
+            'paid_revenue': paid_revenue,
+            'unpaid_revenue': unpaid_revenue,
+            'total_revenue': paid_revenue + unpaid_revenue,
+            'paid_orders': row['paid_orders'],
+            'unpaid_orders': row['unpaid_orders'],
+        })
+
+    cache.set(key, breakdown, getattr(settings, 'CASHIER_VENDOR_BREAKDOWN_TTL', 30))
+    return breakdown
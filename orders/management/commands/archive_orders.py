@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from orders import archive
+
+class Command(BaseCommand):
+    help = 'Move paid and cancelled orders older than ARCHIVE_AFTER_DAYS into the archive tables (run nightly from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Archive closed orders older than this many business days (default: ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, help='Orders moved per transaction (default: ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many orders are due')
+
+    def handle(self, *args, **options):
+        cutoff = archive.cutoff_date(options['days'])
+
+        if options['dry_run']:
+            due = archive.due_for_archive(cutoff).count()
+            self.stdout.write(f'{due} closed orders from before {cutoff} are due for archiving')
+            return
+
+        totals = archive.archive_orders(
+            days=options['days'],
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {totals['order']} orders from before {cutoff} "
+            f"({totals['item']} items, {totals['history']} status changes, {totals['payment']} payments)"
+        ))
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from orders.business_dates import current_business_date
+from orders import rollups
+
+class Command(BaseCommand):
+    help = 'Rebuild the hourly sales rollups from paid orders in a date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help='First day to rebuild (YYYY-MM-DD, default: 90 days ago)')
+        parser.add_argument('--end-date', help='Last day to rebuild (YYYY-MM-DD, default: today)')
+
+    def handle(self, *args, **options):
+        try:
+            end_date = self.parse_date(options['end_date']) or current_business_date()
+            start_date = self.parse_date(options['start_date']) or end_date - timedelta(days=90)
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+
+        if start_date > end_date:
+            raise CommandError('--start-date must not be after --end-date')
+
+        count = rollups.backfill(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt sales rollups for {count} paid orders from {start_date} to {end_date}'
+        ))
+
+    def parse_date(self, value):
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
@@ -0,0 +1,50 @@
+import os
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from orders.business_dates import current_business_date
+from orders import exports
+
+class Command(BaseCommand):
+    help = 'Write a raw data export (orders, order items or payments) to disk, e.g. from a nightly cron job'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(exports.DATASETS), help='What to export')
+        parser.add_argument('--start-date', help='First day to export (YYYY-MM-DD, default: yesterday)')
+        parser.add_argument('--end-date', help='Last day to export (YYYY-MM-DD, default: same as start date)')
+        parser.add_argument('--vendor', type=int, help='Only rows belonging to this vendor id')
+        parser.add_argument('--format', dest='export_format', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--output-dir', default='exports', help='Directory to write the file into (default: exports/)')
+
+    def handle(self, *args, **options):
+        try:
+            start_date = self.parse_date(options['start_date']) or current_business_date() - timedelta(days=1)
+            end_date = self.parse_date(options['end_date']) or start_date
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+
+        if start_date > end_date:
+            raise CommandError('--start-date must not be after --end-date')
+
+        export_format = options['export_format']
+        if export_format not in exports.available_formats():
+            raise CommandError('XLSX export requires openpyxl to be installed')
+
+        dataset = options['dataset']
+        vendor_id = options['vendor']
+        os.makedirs(options['output_dir'], exist_ok=True)
+        path = os.path.join(
+            options['output_dir'],
+            exports.filename(dataset, start_date, end_date, vendor_id, export_format)
+        )
+
+        if export_format == 'xlsx':
+            with open(path, 'wb') as fileobj:
+                count = exports.write_xlsx(fileobj, dataset, start_date, end_date, vendor_id)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as fileobj:
+                count = exports.write_csv(fileobj, dataset, start_date, end_date, vendor_id)
+
+        self.stdout.write(self.style.SUCCESS(f'Exported {count} {dataset} rows to {path}'))
+
+    def parse_date(self, value):
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from orders.table_state import rebuild_table_states
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized table state (status, order count, unpaid total) for every table'
+
+    def handle(self, *args, **options):
+        count = rebuild_table_states()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt table state for {count} tables'))
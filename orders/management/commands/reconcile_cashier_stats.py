@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from orders import live_stats
+
+class Command(BaseCommand):
+    help = 'Reconcile the live cashier counters against the database (run periodically from cron)'
+
+    def handle(self, *args, **options):
+        store = live_stats.get_store()
+        snapshot = live_stats.reconcile(store)
+
+        self.stdout.write(self.style.SUCCESS(f'Cashier stats reconciled ({store.kind} store)'))
+        self.stdout.write(f"Orders today: {snapshot['orders']}")
+        self.stdout.write(f"Paid today: {snapshot['paid']}")
+        self.stdout.write(f"Unpaid orders: {snapshot['unpaid']}")
+        self.stdout.write(f"Revenue today: {snapshot['revenue_cents'] / 100:.2f}")
@@ -0,0 +1,35 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from orders import archive
+
+class Command(BaseCommand):
+    help = 'Move archived orders back into the live order tables, by id or by business date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('order_ids', nargs='*', help='Archived order ids to restore')
+        parser.add_argument('--start-date', help='Restore every archived order from this business date (YYYY-MM-DD)')
+        parser.add_argument('--end-date', help='... up to and including this one (default: same as start date)')
+        parser.add_argument('--batch-size', type=int, help='Orders moved per transaction (default: ARCHIVE_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        if options['order_ids']:
+            totals = archive.restore_orders(options['order_ids'], options['batch_size'])
+        elif options['start_date']:
+            try:
+                start_date = self.parse_date(options['start_date'])
+                end_date = self.parse_date(options['end_date']) or start_date
+            except ValueError as e:
+                raise CommandError(f'Invalid date: {e}')
+            if start_date > end_date:
+                raise CommandError('--start-date must not be after --end-date')
+            totals = archive.restore_dates(start_date, end_date, options['batch_size'])
+        else:
+            raise CommandError('Give order ids or --start-date')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Restored {totals['order']} orders "
+            f"({totals['item']} items, {totals['history']} status changes, {totals['payment']} payments)"
+        ))
+
+    def parse_date(self, value):
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:07
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def populate_table_states(apps, schema_editor):
+    Table = apps.get_model('vendors', 'Table')
+    Order = apps.get_model('orders', 'Order')
+    TableState = apps.get_model('orders', 'TableState')
+
+    states = []
+    for table in Table.objects.all():
+        active = Order.objects.filter(
+            table=table, status__in=['pending', 'confirmed', 'preparing', 'ready', 'delivered']
+        ).order_by('-created_at')
+        statuses = set(active.values_list('status', flat=True))
+        if not statuses:
+            status = 'available'
+        elif statuses & {'ready', 'delivered'}:
+            status = 'ready_for_payment'
+        elif statuses & {'confirmed', 'preparing'}:
+            status = 'occupied'
+        else:
+            status = 'pending'
+        states.append(TableState(
+            table=table,
+            status=status,
+            orders_count=active.count(),
+            kitchen_count=active.filter(status__in=['pending', 'confirmed', 'preparing']).count(),
+            unpaid_total=active.aggregate(total=models.Sum('total_amount'))['total'] or Decimal('0.00'),
+            latest_order=active.first(),
+        ))
+    TableState.objects.bulk_create(states)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_paid_at_alter_order_status_and_more'),
+        ('vendors', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableState',
+            fields=[
+                ('table', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='state', serialize=False, to='vendors.table')),
+                ('status', models.CharField(choices=[('available', 'Available'), ('pending', 'Pending'), ('occupied', 'Occupied'), ('ready_for_payment', 'Ready for Payment')], default='available', max_length=20)),
+                ('orders_count', models.PositiveIntegerField(default=0)),
+                ('kitchen_count', models.PositiveIntegerField(default=0, help_text='Active orders still pending, confirmed or preparing')),
+                ('unpaid_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('latest_order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='orders.order')),
+            ],
+        ),
+        migrations.RunPython(populate_table_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def backfill_vendor(apps, schema_editor):
+    """Copy each item's vendor from its menu item's category, in primary key batches"""
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    MenuItem = apps.get_model('vendors', 'MenuItem')
+
+    vendor_of_menu_item = Subquery(
+        MenuItem.objects.filter(pk=OuterRef('menu_item_id')).values('category__vendor_id')[:1]
+    )
+    last_id = OrderItem.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    for start in range(0, last_id + 1, BATCH_SIZE):
+        OrderItem.objects.filter(
+            pk__gte=start, pk__lt=start + BATCH_SIZE, vendor__isnull=True
+        ).update(vendor_id=vendor_of_menu_item)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_payment'),
+        ('vendors', '0002_vendor_parallel_capacity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='vendor',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='vendors.vendor'),
+        ),
+        migrations.RunPython(backfill_vendor, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='vendor',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='vendors.vendor'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['vendor', 'order'], name='orders_item_vendor_order'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='orders_order_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['table', 'status'], name='orders_order_table_status'),
+        ),
+    ]
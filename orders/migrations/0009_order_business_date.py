@@ -0,0 +1,57 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:40
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def backfill_business_dates(apps, schema_editor):
+    """Derive business_date/business_hour from created_at with the current rollover setting"""
+    from orders.business_dates import business_date_for, business_hour_for
+
+    Order = apps.get_model('orders', 'Order')
+    batch = []
+    for order in Order.objects.only('id', 'created_at').iterator(chunk_size=BATCH_SIZE):
+        order.business_date = business_date_for(order.created_at)
+        order.business_hour = business_hour_for(order.created_at)
+        batch.append(order)
+        if len(batch) >= BATCH_SIZE:
+            Order.objects.bulk_update(batch, ['business_date', 'business_hour'])
+            batch = []
+    if batch:
+        Order.objects.bulk_update(batch, ['business_date', 'business_hour'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_orderitem_vendor_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='business_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='business_hour',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_business_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='business_date',
+            field=models.DateField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='business_hour',
+            field=models.PositiveSmallIntegerField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['business_date', 'status'], name='orders_order_bizdate_status'),
+        ),
+    ]
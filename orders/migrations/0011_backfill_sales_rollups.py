@@ -0,0 +1,54 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+
+def backfill_sales_rollups(apps, schema_editor):
+    """Fold every paid order, live and archived, into the sales rollups"""
+    from orders.rollups import payment_method_for, rollup_deltas
+
+    SalesRollup = apps.get_model('orders', 'SalesRollup')
+    totals = defaultdict(lambda: {'quantity': 0, 'revenue': Decimal('0.00'), 'order_count': 0})
+    for model_name in ('Order', 'ArchivedOrder'):
+        Order = apps.get_model('orders', model_name)
+        orders = Order.objects.filter(status='paid').only(
+            'id', 'notes', 'total_amount', 'business_date', 'business_hour'
+        )
+        for order in orders.iterator(chunk_size=BATCH_SIZE):
+            bucket = (order.business_date, order.business_hour, payment_method_for(order))
+            for (vendor_id, menu_item_id), values in rollup_deltas(order).items():
+                row = totals[bucket + (vendor_id, menu_item_id)]
+                row['quantity'] += values['quantity']
+                row['revenue'] += values['revenue']
+                row['order_count'] += 1
+
+    # A full rebuild, so rows written by orders paid since 0005 are not counted twice
+    SalesRollup.objects.all().delete()
+    SalesRollup.objects.bulk_create(
+        [
+            SalesRollup(
+                business_date=business_date,
+                hour=hour,
+                payment_method=payment_method,
+                vendor_id=vendor_id,
+                menu_item_id=menu_item_id,
+                **values,
+            )
+            for (business_date, hour, payment_method, vendor_id, menu_item_id), values in totals.items()
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_order_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_sales_rollups, migrations.RunPython.noop),
+    ]
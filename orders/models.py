@@ -1,9 +1,11 @@
 from django.db import models
+from django.db.models.functions import Now
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 from decimal import Decimal
 from vendors.models import MenuItem, Table, Vendor
+from .business_dates import business_date_for, business_hour_for
 import uuid
 
 class OrderStatus(models.TextChoices):
@@ -30,9 +32,21 @@ class Order(models.Model):
     delivered_at = models.DateTimeField(null=True, blank=True)
     paid_at = models.DateTimeField(null=True, blank=True)
     estimated_ready_time = models.DateTimeField(null=True, blank=True)
+    # Trading day and local hour the order was placed in (see orders.business_dates)
+    business_date = models.DateField(editable=False)
+    business_hour = models.PositiveSmallIntegerField(editable=False)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of order lists (see orders.pagination)
+            models.Index(fields=['-created_at', '-id'], name='orders_order_created_id'),
+            # Dashboard filters: status lists over a day, and a table's active orders
+            models.Index(fields=['status', 'created_at'], name='orders_order_status_created'),
+            models.Index(fields=['table', 'status'], name='orders_order_table_status'),
+            # Per-day stats and reports
+            models.Index(fields=['business_date', 'status'], name='orders_order_bizdate_status'),
+        ]
 
     def __str__(self):
         return f"Order #{str(self.id)[:8]} - Table {self.table.number}"
@@ -46,10 +60,7 @@ class Order(models.Model):
     def get_vendors(self):
         """Get all vendors involved in this order"""
         from vendors.models import Vendor
-        vendor_ids = set()
-        for item in self.items.all():
-            vendor_ids.add(item.menu_item.category.vendor.id)
-        return Vendor.objects.filter(id__in=vendor_ids)
+        return Vendor.objects.filter(id__in=self.items.values('vendor_id'))
 
     def get_preparation_time(self):
         """Get estimated preparation time based on longest item prep time"""
@@ -60,6 +71,11 @@ class Order(models.Model):
 
     def save(self, *args, **kwargs):
         """Override save to update timestamps"""
+        if self.business_date is None:
+            placed_at = self.created_at or timezone.now()
+            self.business_date = business_date_for(placed_at)
+            self.business_hour = business_hour_for(placed_at)
+
         super().save(*args, **kwargs)
 
         # Update timestamps
@@ -79,6 +95,9 @@ class Order(models.Model):
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    # Copied from menu_item.category.vendor on creation so vendor queries skip two joins;
+    # indexed through orders_item_vendor_order below
+    vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, related_name='order_items', db_index=False)
     quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
@@ -88,6 +107,9 @@ class OrderItem(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['vendor', 'order'], name='orders_item_vendor_order'),
+        ]
 
     def __str__(self):
         return f"{self.quantity}x {self.menu_item.name}"
@@ -97,6 +119,10 @@ class OrderItem(models.Model):
         if not self.unit_price:
             self.unit_price = self.menu_item.price
 
+        # Denormalized vendor, fixed when the item is first saved
+        if not self.vendor_id:
+            self.vendor_id = self.menu_item.category.vendor_id
+
         # Calculate subtotal
         self.subtotal = self.unit_price * self.quantity
 
@@ -106,10 +132,6 @@ class OrderItem(models.Model):
         self.order.calculate_total()
         self.order.save()
 
-    @property
-    def vendor(self):
-        return self.menu_item.vendor
-
 class OrderStatusHistory(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_history')
     status = models.CharField(max_length=20, choices=OrderStatus.choices)
@@ -161,3 +183,147 @@ class CartItem(models.Model):
             self.unit_price = self.menu_item.price
         self.subtotal = self.unit_price * self.quantity
         super().save(*args, **kwargs)
+
+class TableStatus(models.TextChoices):
+    AVAILABLE = 'available', 'Available'
+    PENDING = 'pending', 'Pending'
+    OCCUPIED = 'occupied', 'Occupied'
+    READY_FOR_PAYMENT = 'ready_for_payment', 'Ready for Payment'
+
+class TableState(models.Model):
+    """Per-table projection of its active orders, maintained by orders.table_state"""
+    table = models.OneToOneField(Table, on_delete=models.CASCADE, primary_key=True, related_name='state')
+    status = models.CharField(max_length=20, choices=TableStatus.choices, default=TableStatus.AVAILABLE)
+    orders_count = models.PositiveIntegerField(default=0)
+    kitchen_count = models.PositiveIntegerField(default=0, help_text="Active orders still pending, confirmed or preparing")
+    unpaid_total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    latest_order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Table {self.table_id} - {self.get_status_display()}"
+
+class SalesRollup(models.Model):
+    """Paid sales bucketed by hour, maintained incrementally by orders.rollups.
+
+    Rows with a menu item are per-item totals; rows with a vendor but no menu
+    item are that vendor's totals; rows with neither are site-wide totals.
+    """
+    business_date = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, null=True, blank=True, related_name='sales_rollups')
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, null=True, blank=True, related_name='sales_rollups')
+    payment_method = models.CharField(max_length=20, default='other')
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['business_date', 'vendor', 'menu_item'], name='orders_rollup_date_vendor'),
+            models.Index(fields=['vendor', 'business_date'], name='orders_rollup_vendor_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.business_date} {self.hour:02d}:00 - {self.revenue}"
+
+class PaymentMethod(models.TextChoices):
+    CASH = 'cash', 'Cash'
+    CARD = 'card', 'Card'
+    MOBILE = 'mobile', 'Mobile'
+    OTHER = 'other', 'Other'
+
+class Payment(models.Model):
+    """A payment taken by a cashier for one order"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payments')
+    method = models.CharField(max_length=20, choices=PaymentMethod.choices, default=PaymentMethod.CASH)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    received_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    settlement_id = models.UUIDField(null=True, blank=True, db_index=True, help_text="Shared by payments taken together in one table settlement")
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_method_display()} {self.amount} for Order #{str(self.order_id)[:8]}"
+
+# Cold storage for closed orders, maintained by orders.archive. Columns mirror
+# the hot tables (same primary keys) so rows can be copied back on restore.
+
+class ArchivedOrder(models.Model):
+    """A paid or cancelled order moved out of the hot orders table"""
+    id = models.UUIDField(primary_key=True, editable=False)
+    table = models.ForeignKey(Table, on_delete=models.CASCADE, related_name='archived_orders')
+    customer_name = models.CharField(max_length=100, blank=True)
+    customer_phone = models.CharField(max_length=20, blank=True)
+    status = models.CharField(max_length=20, choices=OrderStatus.choices)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    confirmed_at = models.DateTimeField(null=True, blank=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+    estimated_ready_time = models.DateTimeField(null=True, blank=True)
+    business_date = models.DateField()
+    business_hour = models.PositiveSmallIntegerField()
+    archived_at = models.DateTimeField(db_default=Now())
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['business_date', 'status'], name='orders_arch_bizdate_status'),
+            models.Index(fields=['-created_at', '-id'], name='orders_arch_created_id'),
+        ]
+
+    def __str__(self):
+        return f"Archived order #{str(self.id)[:8]} - Table {self.table_id}"
+
+class ArchivedOrderItem(models.Model):
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='+')
+    vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, related_name='archived_order_items', db_index=False)
+    quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    special_instructions = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['vendor', 'order'], name='orders_arch_item_vendor_order'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity}x {self.menu_item_id} (archived)"
+
+class ArchivedOrderStatusHistory(models.Model):
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='status_history')
+    status = models.CharField(max_length=20, choices=OrderStatus.choices)
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    notes = models.TextField(blank=True)
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-timestamp']
+        verbose_name_plural = 'Archived Order Status Histories'
+
+class ArchivedPayment(models.Model):
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='payments')
+    method = models.CharField(max_length=20, choices=PaymentMethod.choices, default=PaymentMethod.CASH)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    received_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    settlement_id = models.UUIDField(null=True, blank=True)
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_method_display()} {self.amount} for archived order #{str(self.order_id)[:8]}"
@@ -0,0 +1,204 @@
+"""
+Per-connection bounded send queues for the WebSocket consumers.
+
+Group events used to be written straight to the socket from the handler, so a
+slow tablet held up its consumer, its channel-layer inbox filled up and the
+layer started silently dropping messages. Each connection now owns a small
+outbox drained by a dedicated writer task:
+
+* updates for the same order (and message type) are coalesced into the latest,
+* a backlog older than WEBSOCKET_SEND_MAX_AGE is discarded as stale,
+* overflowing WEBSOCKET_SEND_QUEUE_SIZE discards the backlog,
+
+and in the last two cases the client is sent a fresh snapshot instead.
+"""
+import abc
+import asyncio
+import json
+import logging
+import time
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# channel_name -> ConnectionOutbox, for lag metrics
+_registry = weakref.WeakValueDictionary()
+
+
+class ConnectionOutbox:
+    """Bounded, coalescing queue of outgoing text frames for one connection"""
+
+    def __init__(self, channel_name, label, maxsize=None, max_age=None):
+        self.channel_name = channel_name
+        self.label = label
+        self.maxsize = maxsize or getattr(settings, 'WEBSOCKET_SEND_QUEUE_SIZE', 100)
+        self.max_age = max_age or getattr(settings, 'WEBSOCKET_SEND_MAX_AGE', 10.0)
+        self.connected_at = time.time()
+        self._queue = OrderedDict()
+        self._sequence = 0
+        self._ready = asyncio.Event()
+        self.needs_resync = False
+
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.resyncs = 0
+        self.max_depth = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, text, coalesce_key=None):
+        if coalesce_key is not None and coalesce_key in self._queue:
+            # The latest update goes out after everything queued before it, but
+            # keeps the original enqueue time so lag reflects how long the order waited
+            enqueued_at, _ = self._queue[coalesce_key]
+            self._queue[coalesce_key] = (enqueued_at, text)
+            self._queue.move_to_end(coalesce_key)
+            self.coalesced += 1
+            return
+
+        if len(self._queue) >= self.maxsize:
+            logger.warning(f"Outbox overflow for {self.label} ({len(self._queue)} queued) - forcing resync")
+            self.discard_backlog()
+            return
+
+        if coalesce_key is None:
+            self._sequence += 1
+            coalesce_key = ('seq', self._sequence)
+        self._queue[coalesce_key] = (time.monotonic(), text)
+        self.max_depth = max(self.max_depth, len(self._queue))
+        self._ready.set()
+
+    def discard_backlog(self):
+        self.dropped += len(self._queue)
+        self._queue.clear()
+        self.needs_resync = True
+        self._ready.set()
+
+    def pop(self):
+        if not self._queue:
+            return None
+        _, item = self._queue.popitem(last=False)
+        return item
+
+    async def wait(self):
+        while not self._queue and not self.needs_resync:
+            self._ready.clear()
+            await self._ready.wait()
+
+    def record_sent(self, lag):
+        self.sent += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def oldest_age(self):
+        if not self._queue:
+            return 0.0
+        # Coalesced entries move to the back, so the head isn't necessarily the oldest
+        enqueued_at = min(enqueued_at for enqueued_at, _ in self._queue.values())
+        return time.monotonic() - enqueued_at
+
+    def metrics(self):
+        return {
+            'channel_name': self.channel_name,
+            'label': self.label,
+            'connected_for': round(time.time() - self.connected_at, 1),
+            'depth': len(self._queue),
+            'max_depth': self.max_depth,
+            'oldest_age': round(self.oldest_age(), 3),
+            'last_lag': round(self.last_lag, 3),
+            'max_lag': round(self.max_lag, 3),
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'resyncs': self.resyncs,
+        }
+
+
+class BufferedSendMixin(abc.ABC):
+    """Route a consumer's outgoing messages through a ConnectionOutbox"""
+
+    outbox = None
+    _writer = None
+
+    def outbox_label(self):
+        return self.__class__.__name__
+
+    def start_outbox(self):
+        self.outbox = ConnectionOutbox(self.channel_name, self.outbox_label())
+        _registry[self.channel_name] = self.outbox
+        self._writer = asyncio.ensure_future(self._drain_outbox())
+
+    async def stop_outbox(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        if self.outbox is not None:
+            _registry.pop(self.channel_name, None)
+
+    async def send_event(self, data, coalesce_key=None):
+        """Queue a JSON message; messages sharing a coalesce_key collapse to the latest"""
+        text = json.dumps(data)
+        if self.outbox is None:
+            # Not accepted yet (or closing) - nothing to buffer against
+            await self.send(text_data=text)
+            return
+        self.outbox.put(text, coalesce_key)
+
+    @abc.abstractmethod
+    async def resync(self):
+        """Send a fresh snapshot after queued messages were discarded"""
+
+    async def channel_layer_switched(self, event):
+        """The channel layer failed over; the client reconnects and re-subscribes on the new backend"""
+        logger.info(f"Closing {self.outbox_label()} socket after a channel layer switch")
+        await self.close(code=1012)
+
+    async def _drain_outbox(self):
+        outbox = self.outbox
+        try:
+            while True:
+                await outbox.wait()
+
+                if outbox.needs_resync:
+                    outbox.needs_resync = False
+                    outbox.resyncs += 1
+                    await self.resync()
+                    continue
+
+                if outbox.oldest_age() > outbox.max_age:
+                    logger.warning(f"Outbox for {outbox.label} is {outbox.oldest_age():.1f}s behind - dropping stale backlog")
+                    outbox.discard_backlog()
+                    continue
+
+                item = outbox.pop()
+                if item is None:
+                    continue
+
+                enqueued_at, text = item
+                await self.send(text_data=text)
+                outbox.record_sent(time.monotonic() - enqueued_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Outbox writer for {outbox.label} failed: {e}", exc_info=True)
+            # Nothing drains the outbox any more - close so the client reconnects and resyncs
+            try:
+                await self.close(code=1011)
+            except Exception as e:
+                logger.warning(f"Could not close {outbox.label} socket after writer failure: {e}")
+
+
+def connection_metrics():
+    """Lag metrics for every open WebSocket connection in this process"""
+    return [outbox.metrics() for outbox in list(_registry.values())]
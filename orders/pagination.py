@@ -0,0 +1,119 @@
+"""
+Keyset (cursor) pagination and cheap row-count estimates for long order lists.
+
+`Paginator` issues COUNT(*) and OFFSET, both of which get slower the deeper a
+cashier pages into history. Keyset pagination walks the (created_at, id) index
+instead: each page ends with an opaque cursor holding the last row's key, and
+the next page is simply the rows strictly "older" than it.
+
+Totals are shown as estimates: the planner's row estimate on PostgreSQL, and a
+briefly cached exact count on other databases.
+"""
+import base64
+import json
+import logging
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+# Planner estimates are unreliable for small results, so count those exactly
+EXACT_COUNT_THRESHOLD = 1000
+
+
+def encode_cursor(obj):
+    raw = f'{obj.created_at.isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (created_at, id) from a cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|', 1)
+        return datetime.fromisoformat(created_at), uuid.UUID(pk)
+    except (ValueError, UnicodeDecodeError):
+        logger.warning(f"Ignoring malformed pagination cursor: {cursor!r}")
+        return None
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset, newest first"""
+
+    def __init__(self, object_list, next_cursor, per_page, cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.per_page = per_page
+        self.cursor = cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self):
+        return self.cursor is None
+
+
+def keyset_paginate(queryset, cursor=None, per_page=20, archived=None):
+    """
+    Return the page of `queryset` (ordered by -created_at, -id) after `cursor`.
+
+    `archived` is an optional matching queryset over the archive tables
+    (see orders.archive); both are read from the cursor and merged in order.
+    """
+    position = decode_cursor(cursor)
+    rows = []
+    for source in (queryset, archived):
+        if source is None:
+            continue
+        source = source.order_by('-created_at', '-id')
+        if position is not None:
+            created_at, pk = position
+            source = source.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        # Fetch one extra row to learn whether there is a next page without counting
+        rows.extend(source[:per_page + 1])
+
+    if archived is not None:
+        rows = sorted(rows, key=lambda row: (row.created_at, row.pk), reverse=True)[:per_page + 1]
+    next_cursor = encode_cursor(rows[per_page - 1]) if len(rows) > per_page else None
+    return KeysetPage(rows[:per_page], next_cursor, per_page, cursor if position else None)
+
+
+def planner_estimate(queryset):
+    """Row estimate from the PostgreSQL planner for `queryset`, without running it"""
+    connection = connections[queryset.db]
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def estimated_count(queryset, cache_key):
+    """Approximate total rows for a list header; exact for small results"""
+    if connections[queryset.db].vendor == 'postgresql':
+        try:
+            estimate = planner_estimate(queryset)
+            if estimate >= EXACT_COUNT_THRESHOLD:
+                return estimate
+        except Exception as e:
+            logger.warning(f"Planner estimate failed, falling back to a cached count: {e}")
+
+    timeout = getattr(settings, 'ORDER_COUNT_CACHE_TTL', 60)
+    return cache.get_or_set(cache_key, queryset.order_by().count, timeout)
@@ -0,0 +1,142 @@
+"""
+Presence registry for channel-layer groups.
+
+Consumers register their channel in the groups they join, and producers ask
+which of their target groups actually have listeners before serializing and
+calling group_send. Most `table_{n}` groups are empty most of the time, so
+this skips the bulk of the fan-out work on every order save.
+
+Membership is kept in-process and, when Redis is reachable, in one Redis set
+per group so every worker sees the same answer. Errors always fall on the side
+of sending: if the channel layer spans processes but Redis presence is
+unavailable, every group is reported as having listeners.
+"""
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.conf import settings
+
+from core.channel_layers import MEMORY, FailoverChannelLayer
+from core.redis_utils import get_redis, reset_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'presence'
+
+_lock = threading.Lock()
+_local_members = {}
+_synced_client_id = None
+
+
+def _key(group):
+    return f'{KEY_PREFIX}:{group}'
+
+
+def _layer_is_local():
+    layer = get_channel_layer()
+    # The failover layer may be running on either backend right now
+    if isinstance(layer, FailoverChannelLayer):
+        return layer.active == MEMORY
+    return isinstance(layer, InMemoryChannelLayer)
+
+
+def _redis():
+    """Return the Redis client, re-publishing local members after a reconnect"""
+    global _synced_client_id
+
+    client = get_redis()
+    if client is None or id(client) == _synced_client_id:
+        return client
+
+    with _lock:
+        members = {group: set(channels) for group, channels in _local_members.items()}
+    try:
+        pipe = client.pipeline(transaction=False)
+        for group, channels in members.items():
+            if channels:
+                pipe.sadd(_key(group), *channels)
+                pipe.expire(_key(group), _ttl())
+        pipe.execute()
+    except Exception as e:
+        reset_redis(e)
+        return None
+    _synced_client_id = id(client)
+    return client
+
+
+def _ttl():
+    # Match the channel layer's own group expiry so crashed workers age out
+    return getattr(settings, 'PRESENCE_TTL', 86400)
+
+
+def join(group, channel_name):
+    with _lock:
+        _local_members.setdefault(group, set()).add(channel_name)
+
+    client = _redis()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.sadd(_key(group), channel_name)
+        pipe.expire(_key(group), _ttl())
+        pipe.execute()
+    except Exception as e:
+        reset_redis(e)
+
+
+def leave(group, channel_name):
+    with _lock:
+        channels = _local_members.get(group)
+        if channels is not None:
+            channels.discard(channel_name)
+            if not channels:
+                del _local_members[group]
+
+    client = _redis()
+    if client is None:
+        return
+    try:
+        client.srem(_key(group), channel_name)
+    except Exception as e:
+        reset_redis(e)
+
+
+def listening(*groups):
+    """Return the subset of `groups` that currently have at least one listener"""
+    with _lock:
+        local = [group for group in groups if _local_members.get(group)]
+
+    if _layer_is_local():
+        return local
+
+    client = _redis()
+    if client is None:
+        return list(groups)
+    try:
+        pipe = client.pipeline(transaction=False)
+        for group in groups:
+            pipe.exists(_key(group))
+        remote = pipe.execute()
+    except Exception as e:
+        reset_redis(e)
+        return list(groups)
+
+    return [group for group, exists in zip(groups, remote) if exists or group in local]
+
+
+def has_listeners(group):
+    return bool(listening(group))
+
+
+def counts():
+    """Local listener counts per group, for diagnostics"""
+    with _lock:
+        return {group: len(channels) for group, channels in _local_members.items()}
+
+
+ajoin = sync_to_async(join, thread_sensitive=False)
+aleave = sync_to_async(leave, thread_sensitive=False)
+alistening = sync_to_async(listening, thread_sensitive=False)
@@ -0,0 +1,146 @@
+"""
+Hourly sales rollups for the cashier and vendor reports.
+
+Every time an order becomes paid its items are folded into `SalesRollup` rows
+keyed by (business_date, hour, vendor, menu_item, payment_method), at three
+levels: per menu item, per vendor (menu_item is NULL) and site-wide (vendor
+and menu_item are NULL). Leaving the paid status, or deleting a paid order,
+subtracts the same amounts again. Reports then aggregate a few hundred rollup
+rows instead of rescanning order history.
+
+Writes happen in the same transaction as the order save. Readers always Sum()
+over the rows they select, so duplicate buckets created by racing first writers
+are harmless. Migration 0011 builds them from the order history that existed
+before; `manage.py backfill_sales_rollups` rebuilds a date range.
+"""
+import logging
+import re
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+PAYMENT_METHODS = ('cash', 'card', 'mobile')
+PAYMENT_NOTE = re.compile(r'\[PAYMENT\]\s*(?:Method:\s*)?([A-Za-z_]+)')
+
+
+def payment_method_for(order):
+    """Payment method recorded in the order notes by the cashier, or 'other'"""
+    notes = order.notes or ''
+    match = PAYMENT_NOTE.search(notes)
+    if match:
+        method = match.group(1).lower()
+        return method if method in PAYMENT_METHODS else 'other'
+    lowered = notes.lower()
+    for method in PAYMENT_METHODS:
+        if method in lowered:
+            return method
+    return 'other'
+
+
+def _bucket(order):
+    return order.business_date, order.business_hour
+
+
+def rollup_deltas(order):
+    """(vendor_id, menu_item_id) -> {quantity, revenue} for one paid (or archived) order"""
+    rows = (
+        order.items.order_by()
+        .values('menu_item_id', 'vendor_id')
+        .annotate(quantity=Sum('quantity'), revenue=Sum('subtotal'))
+    )
+    deltas = defaultdict(lambda: {'quantity': 0, 'revenue': Decimal('0.00')})
+    for row in rows:
+        vendor_id = row['vendor_id']
+        for key in ((vendor_id, row['menu_item_id']), (vendor_id, None)):
+            deltas[key]['quantity'] += row['quantity']
+            deltas[key]['revenue'] += row['revenue']
+
+    site = deltas[(None, None)]
+    site['quantity'] = sum(row['quantity'] for row in rows)
+    site['revenue'] = order.total_amount or Decimal('0.00')
+    return deltas
+
+
+def _apply(order, sign):
+    from .models import SalesRollup
+
+    business_date, hour = _bucket(order)
+    payment_method = payment_method_for(order)
+
+    with transaction.atomic():
+        for (vendor_id, menu_item_id), values in rollup_deltas(order).items():
+            bucket = dict(
+                business_date=business_date,
+                hour=hour,
+                vendor_id=vendor_id,
+                menu_item_id=menu_item_id,
+                payment_method=payment_method,
+            )
+            rollup = SalesRollup.objects.filter(**bucket).first()
+            if rollup is None:
+                rollup = SalesRollup.objects.create(**bucket)
+            SalesRollup.objects.filter(pk=rollup.pk).update(
+                quantity=F('quantity') + sign * values['quantity'],
+                revenue=F('revenue') + sign * values['revenue'],
+                order_count=F('order_count') + sign,
+            )
+
+
+def record_status_change(order, old_status, new_status):
+    if old_status != 'paid' and new_status == 'paid':
+        _apply(order, 1)
+    elif old_status == 'paid' and new_status != 'paid':
+        _apply(order, -1)
+
+
+def record_order_created(order):
+    if order.status == 'paid':
+        _apply(order, 1)
+
+
+def record_order_deleted(order):
+    if order.status == 'paid':
+        _apply(order, -1)
+
+
+def backfill(start_date, end_date):
+    """Rebuild the rollups for paid orders, live and archived, between two dates (inclusive)"""
+    from .archive import tables
+    from .models import SalesRollup
+
+    with transaction.atomic():
+        deleted, _ = SalesRollup.objects.filter(business_date__range=[start_date, end_date]).delete()
+        count = 0
+        for order_model in (tables().order, tables(archived=True).order):
+            orders = order_model.objects.filter(status='paid', business_date__range=[start_date, end_date])
+            for order in orders.iterator():
+                _apply(order, 1)
+                count += 1
+    logger.info(f"Backfilled sales rollups for {count} orders ({start_date} to {end_date}), replaced {deleted} rows")
+    return count
+
+
+def _money(amount):
+    return Decimal(amount or 0).quantize(CENT)
+
+
+def item_totals(rollups):
+    """Per menu item quantity, revenue and orders from a rollup queryset"""
+    rows = (
+        rollups.filter(menu_item__isnull=False)
+        .values('menu_item_id', name=F('menu_item__name'))
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'), orders=Sum('order_count'))
+        .filter(orders__gt=0)
+        .order_by()
+    )
+    return [dict(row, revenue=_money(row['revenue'])) for row in rows]
+
+
+def payment_method_totals(rollups):
+    totals = rollups.values_list('payment_method').annotate(total=Sum('revenue')).order_by()
+    return {method: _money(total) for method, total in totals if total}
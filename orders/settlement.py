@@ -0,0 +1,343 @@
+"""
+Table close-out operations: settle every payable order, or reset the table.
+
+Closing out a table used to mean one `mark_order_paid` round trip per order,
+each with its own pre_save SELECT, several UPDATEs, a history insert and a
+broadcast. `settle_table` locks the table's payable orders, pays them with a
+single conditional UPDATE, bulk-creates the status history and payment rows,
+and sends one consolidated `table_settled` event to the table, each vendor
+(listing only that vendor's orders) and the cashiers once the transaction
+commits. The consumers expand it into the
+per-order `order_status_change` / `order_payment_update` frames the pages
+already handle.
+
+The bulk UPDATE bypasses `Order.save()` and therefore the order signals, so the
+derived state they normally maintain (live cashier counters, sales rollups,
+table state, WebSocket snapshots) is refreshed explicitly here.
+
+`reset_table` is the cancellation counterpart: one UPDATE ... RETURNING (on
+PostgreSQL; a locked SELECT plus one UPDATE elsewhere), one bulk history insert
+and one `table_reset` event per affected group, which the consumers likewise
+turn into per-order cancellation frames.
+"""
+import logging
+import time
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import connections, transaction
+from django.db.models import DateTimeField, Value
+from django.db.models.functions import Coalesce, Concat
+from django.utils import timezone
+
+from . import eta, live_stats, presence, rollups
+from .snapshots import invalidate_order_snapshots
+from .table_state import refresh_table_state
+from vendors.reports import invalidate_vendor_reports
+
+logger = logging.getLogger(__name__)
+
+PAYABLE_STATUSES = ('ready', 'delivered')
+CANCELLABLE_STATUSES = ('pending', 'confirmed', 'preparing', 'ready', 'delivered')
+
+
+class SettlementError(Exception):
+    """The settlement request cannot be applied (e.g. the amount is short)"""
+
+
+def payment_note(payment_method, notes=''):
+    """The [PAYMENT] line appended to an order's notes, as written by the cashier views"""
+    if notes:
+        return f"\n[PAYMENT] {payment_method.upper()}: {notes}"
+    return f"\n[PAYMENT] Method: {payment_method.upper()}"
+
+
+def normalize_payment_method(payment_method):
+    from .models import PaymentMethod
+
+    method = (payment_method or 'cash').lower()
+    return method if method in PaymentMethod.values else PaymentMethod.OTHER
+
+
+def settle_table(table, payment_method='cash', user=None, payment_amount=None, notes=''):
+    """Pay every ready/delivered order on `table`; returns a summary or None if nothing was payable"""
+    from .models import Order, OrderItem, OrderStatus, OrderStatusHistory, Payment
+
+    method = normalize_payment_method(payment_method)
+    note = payment_note(method, notes)
+    now = timezone.now()
+    settlement_id = uuid.uuid4()
+
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update()
+            .filter(table=table, status__in=PAYABLE_STATUSES)
+            .order_by('created_at')
+        )
+        if not orders:
+            return None
+
+        total = sum((order.total_amount for order in orders), Decimal('0.00'))
+        if payment_amount not in (None, ''):
+            try:
+                tendered = Decimal(str(payment_amount))
+            except InvalidOperation:
+                raise SettlementError('Invalid payment amount')
+            if tendered < total:
+                raise SettlementError(f'Payment amount (${tendered}) is less than table total (${total})')
+
+        order_ids = [order.pk for order in orders]
+        updated = Order.objects.filter(pk__in=order_ids, status__in=PAYABLE_STATUSES).update(
+            status=OrderStatus.PAID,
+            paid_at=Coalesce('paid_at', Value(now, output_field=DateTimeField())),
+            updated_at=now,
+            notes=Concat('notes', Value(note)),
+        )
+
+        changes = []
+        for order in orders:
+            changes.append((order, order.status, OrderStatus.PAID))
+            order.status = OrderStatus.PAID
+            order.paid_at = order.paid_at or now
+            order.notes += note
+
+        OrderStatusHistory.objects.bulk_create([
+            OrderStatusHistory(
+                order=order,
+                status=OrderStatus.PAID,
+                changed_by=user,
+                notes=f"Status changed from {old_status} to paid (table {table.number} settled)"
+            )
+            for order, old_status, _ in changes
+        ])
+        Payment.objects.bulk_create([
+            Payment(
+                order=order,
+                method=method,
+                amount=order.total_amount,
+                received_by=user,
+                settlement_id=settlement_id,
+                notes=notes,
+            )
+            for order in orders
+        ])
+
+        # Signals did not run for the bulk UPDATE - bring the projections up to date
+        live_stats.record_status_changes(changes)
+        for order, old_status, new_status in changes:
+            rollups.record_status_change(order, old_status, new_status)
+        refresh_table_state(table.pk)
+        vendor_orders = {}
+        for order_id, vendor_id in (
+            OrderItem.objects.filter(order_id__in=order_ids)
+            .values_list('order_id', 'vendor_id')
+            .distinct()
+        ):
+            vendor_orders.setdefault(vendor_id, set()).add(str(order_id))
+        invalidate_order_snapshots(table.number, vendor_orders.keys())
+        invalidate_vendor_reports(vendor_orders.keys())
+
+        settlement = {
+            'settlement_id': str(settlement_id),
+            'table_number': table.number,
+            'payment_method': method,
+            'total_amount': str(total),
+            'orders_paid': updated,
+            'paid_at': now.isoformat(),
+            'orders': [
+                {
+                    'id': str(order.pk),
+                    'old_status': old_status,
+                    'total_amount': str(order.total_amount),
+                }
+                for order, old_status, _ in changes
+            ],
+        }
+        transaction.on_commit(lambda: notify_table_settled(settlement, vendor_orders))
+
+    logger.info(f"Table {table.number} settled: {updated} orders, {total} via {method}")
+    return settlement
+
+
+def notify_table_settled(settlement, vendor_orders):
+    """Send one table_settled event per affected group; vendors only hear about their orders"""
+    from .consumers import serialize_cashier_stats
+
+    table_group = f"table_{settlement['table_number']}"
+    vendor_groups = {f'vendor_{vendor_id}': order_ids for vendor_id, order_ids in vendor_orders.items()}
+    groups = presence.listening(table_group, *vendor_groups, 'cashier_dashboard')
+    if not groups:
+        return
+
+    channel_layer = get_channel_layer()
+    try:
+        for group in groups:
+            event = {'type': 'table_settled', 'settlement': settlement}
+            if group in vendor_groups:
+                order_ids = vendor_groups[group]
+                event['settlement'] = dict(
+                    settlement,
+                    orders=[order for order in settlement['orders'] if order['id'] in order_ids],
+                )
+            elif group == 'cashier_dashboard':
+                event['stats'] = serialize_cashier_stats(live_stats.get_cashier_stats())
+            async_to_sync(channel_layer.group_send)(group, event)
+    except Exception as e:
+        logger.error(f"Error sending table_settled notification: {e}", exc_info=True)
+
+
+def _cancel_returning(table, note, now):
+    """PostgreSQL: cancel in one statement, returning each order's previous status"""
+    from .models import Order
+
+    connection = connections[Order.objects.db]
+    table_name = connection.ops.quote_name(Order._meta.db_table)
+    sql = f"""
+        WITH targets AS (
+            SELECT id, status FROM {table_name}
+            WHERE table_id = %s AND status = ANY(%s)
+            FOR UPDATE
+        )
+        UPDATE {table_name} AS o
+        SET status = %s, updated_at = %s, notes = o.notes || %s
+        FROM targets
+        WHERE o.id = targets.id
+        RETURNING o.id, targets.status, o.total_amount, o.created_at, o.business_date, o.business_hour
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table.pk, list(CANCELLABLE_STATUSES), 'cancelled', now, note])
+        rows = cursor.fetchall()
+
+    return [
+        (
+            Order(
+                id=pk, table_id=table.pk, status='cancelled', total_amount=total, created_at=created_at,
+                business_date=business_date, business_hour=business_hour,
+            ),
+            old_status,
+        )
+        for pk, old_status, total, created_at, business_date, business_hour in rows
+    ]
+
+
+def _cancel_locked(table, note, now):
+    """Other databases: lock the rows, then cancel them with one UPDATE"""
+    from .models import Order
+
+    orders = list(
+        Order.objects.select_for_update()
+        .filter(table=table, status__in=CANCELLABLE_STATUSES)
+        .only('id', 'table_id', 'status', 'total_amount', 'created_at', 'business_date', 'business_hour')
+    )
+    if not orders:
+        return []
+
+    Order.objects.filter(pk__in=[order.pk for order in orders]).update(
+        status='cancelled',
+        updated_at=now,
+        notes=Concat('notes', Value(note)),
+    )
+    cancelled = []
+    for order in orders:
+        old_status = order.status
+        order.status = 'cancelled'
+        cancelled.append((order, old_status))
+    return cancelled
+
+
+def reset_table(table, reason='Table reset by cashier', user=None):
+    """Cancel every active order on `table` as one set-based operation"""
+    from .models import Order, OrderItem, OrderStatus, OrderStatusHistory
+
+    started = time.perf_counter()
+    username = user.username if user else 'system'
+    note = f"\n[CANCELLED] {reason} - by {username}"
+    now = timezone.now()
+
+    with transaction.atomic():
+        if connections[Order.objects.db].vendor == 'postgresql':
+            cancelled = _cancel_returning(table, note, now)
+        else:
+            cancelled = _cancel_locked(table, note, now)
+        updated_at = time.perf_counter()
+
+        if not cancelled:
+            return None
+
+        OrderStatusHistory.objects.bulk_create([
+            OrderStatusHistory(
+                order_id=order.pk,
+                status=OrderStatus.CANCELLED,
+                changed_by=user,
+                notes=f"Status changed from {old_status} to cancelled (table {table.number} reset)"
+            )
+            for order, old_status in cancelled
+        ])
+
+        # Signals did not run for the bulk UPDATE - bring the projections up to date
+        live_stats.record_status_changes(
+            [(order, old_status, OrderStatus.CANCELLED) for order, old_status in cancelled]
+        )
+        refresh_table_state(table.pk)
+
+        order_ids = [order.pk for order, _ in cancelled]
+        vendor_orders = {}
+        for order_id, vendor_id in (
+            OrderItem.objects.filter(order_id__in=order_ids)
+            .values_list('order_id', 'vendor_id')
+            .distinct()
+        ):
+            vendor_orders.setdefault(vendor_id, set()).add(str(order_id))
+        invalidate_order_snapshots(table.number, vendor_orders.keys())
+        invalidate_vendor_reports(vendor_orders.keys())
+        eta.record_orders_removed(vendor_orders)
+
+        reset = {
+            'table_number': table.number,
+            'reason': reason,
+            'orders_cancelled': len(cancelled),
+            'order_ids': [str(order_id) for order_id in order_ids],
+            'cancelled_orders': [
+                {
+                    'id': str(order.pk)[:8],
+                    'old_status': old_status,
+                    'total_amount': str(order.total_amount),
+                }
+                for order, old_status in cancelled
+            ],
+        }
+        transaction.on_commit(lambda: notify_table_reset(reset, vendor_orders))
+
+    finished = time.perf_counter()
+    reset['timing'] = {
+        'update_ms': round((updated_at - started) * 1000, 2),
+        'total_ms': round((finished - started) * 1000, 2),
+    }
+    logger.info(f"Table {table.number} reset: {len(cancelled)} orders cancelled in {reset['timing']['total_ms']}ms")
+    return reset
+
+
+def notify_table_reset(reset, vendor_orders):
+    """Send one table_reset event per affected group; vendors only hear about their orders"""
+    from .consumers import serialize_cashier_stats
+
+    table_group = f"table_{reset['table_number']}"
+    vendor_groups = {f'vendor_{vendor_id}': order_ids for vendor_id, order_ids in vendor_orders.items()}
+    groups = presence.listening(table_group, *vendor_groups, 'cashier_dashboard')
+    if not groups:
+        return
+
+    channel_layer = get_channel_layer()
+    summary = {key: reset[key] for key in ('table_number', 'reason', 'order_ids')}
+    try:
+        for group in groups:
+            event = {'type': 'table_reset', 'reset': summary}
+            if group in vendor_groups:
+                event['reset'] = dict(summary, order_ids=sorted(vendor_groups[group]))
+            elif group == 'cashier_dashboard':
+                event['stats'] = serialize_cashier_stats(live_stats.get_cashier_stats())
+            async_to_sync(channel_layer.group_send)(group, event)
+    except Exception as e:
+        logger.error(f"Error sending table_reset notification: {e}", exc_info=True)
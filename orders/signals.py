@@ -1,8 +1,17 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete
 from django.dispatch import receiver
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from .models import Order, OrderItem, OrderStatusHistory
+from vendors.models import Vendor
+from .snapshots import invalidate_order_snapshots
+from .table_state import refresh_table_state
+from vendors.reports import invalidate_vendor_reports
+from . import live_stats
+from . import rollups
+from . import eta
+from . import presence
+from django.db import transaction
 from django.utils import timezone
 import logging
 
@@ -14,14 +23,40 @@ def order_created_or_updated(sender, instance, created, **kwargs):
     """Send real-time notification when order is created or updated"""
     logger.info(f"Signal order_created_or_updated fired - created: {created}, order_id: {instance.id}")
     try:
+        # Cached WebSocket snapshots that include this order are now stale
+        vendor_ids = get_order_vendor_ids(instance)
+        invalidate_order_snapshots(instance.table.number, vendor_ids)
+
+        # Keep the cashier counters in step with the transition
+        old_status = instance.__dict__.pop('_old_status', None)
+        old_total = instance.__dict__.pop('_old_total', None)
+        old_table_id = instance.__dict__.pop('_old_table_id', None)
+        if created:
+            live_stats.record_order_created(instance)
+            rollups.record_order_created(instance)
+            invalidate_vendor_reports(vendor_ids)
+        elif old_status is not None:
+            live_stats.record_status_change(instance, old_status, instance.status)
+            rollups.record_status_change(instance, old_status, instance.status)
+            eta.record_status_change(instance, old_status, instance.status, vendor_ids)
+            if old_status != instance.status:
+                invalidate_vendor_reports(vendor_ids)
+
+        # Recompute the table's materialized status within this transaction, but
+        # only when something it is derived from changed (notes edits, timestamp
+        # follow-up saves and the like leave it as it was)
+        if (created or old_status is None or old_status != instance.status
+                or old_total != instance.total_amount or old_table_id != instance.table_id):
+            refresh_table_state(*{instance.table_id, old_table_id or instance.table_id})
+
         if created:
             # New order created - notify all relevant parties
             logger.info(f"New order created: {instance.id}, table: {instance.table.number}")
-            send_new_order_notification(instance)
+            send_new_order_notification(instance, vendor_ids)
         else:
             # Order updated - notify table and vendors
             logger.info(f"Order updated: {instance.id}, status: {instance.status}")
-            send_order_update_notification(instance)
+            send_order_update_notification(instance, vendor_ids)
     except Exception as e:
         logger.error(f"Error in order_created_or_updated signal: {e}", exc_info=True)
 
@@ -31,15 +66,15 @@ def track_order_status_change(sender, instance, **kwargs):
     if instance.pk:  # Only for existing orders
         try:
             old_order = Order.objects.get(pk=instance.pk)
+            instance._old_status = old_order.status
+            instance._old_total = old_order.total_amount
+            instance._old_table_id = old_order.table_id
             if old_order.status != instance.status:
                 # Status changed, update appropriate timestamp
                 now = timezone.now()
 
                 if instance.status == 'confirmed' and not instance.confirmed_at:
                     instance.confirmed_at = now
-                    # Calculate estimated ready time
-                    prep_time = instance.get_preparation_time()
-                    instance.estimated_ready_time = now + timezone.timedelta(minutes=prep_time)
 
                 elif instance.status == 'ready' and not instance.ready_at:
                     instance.ready_at = now
@@ -64,10 +99,36 @@ def track_order_status_change(sender, instance, **kwargs):
         except Order.DoesNotExist:
             pass
 
+@receiver(pre_delete, sender=Order)
+def order_deleting(sender, instance, **kwargs):
+    """Take a paid order out of the sales rollups while its items still exist"""
+    try:
+        vendor_ids = get_order_vendor_ids(instance)
+        rollups.record_order_deleted(instance)
+        eta.record_order_deleted(instance, vendor_ids)
+        invalidate_vendor_reports(vendor_ids)
+    except Exception as e:
+        logger.error(f"Error in order_deleting signal: {e}", exc_info=True)
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    """Remove a deleted order from the cashier counters and table state"""
+    try:
+        live_stats.record_order_deleted(instance)
+        # Deferred: when a whole table is being deleted its state row goes with it
+        transaction.on_commit(lambda: refresh_table_state(instance.table_id))
+    except Exception as e:
+        logger.error(f"Error in order_deleted signal: {e}", exc_info=True)
+
 @receiver(post_save, sender=OrderItem)
 def order_item_updated(sender, instance, created, **kwargs):
     """Send notification when order item is created or updated"""
     try:
+        invalidate_order_snapshots(instance.order.table.number, [instance.vendor_id])
+        invalidate_vendor_reports([instance.vendor_id])
+        # Queue position and prep time both depend on the order's lines
+        eta.record_items_changed(instance.order)
+
         if created:
             # New item added to order - notify vendor
             logger.info(f"New order item created: {instance.id} for order {instance.order.id}")
@@ -78,31 +139,48 @@ def order_item_updated(sender, instance, created, **kwargs):
     except Exception as e:
         logger.error(f"Error in order_item_updated signal: {e}")
 
-def send_new_order_notification(order):
+@receiver(post_save, sender=Vendor)
+def vendor_updated(sender, instance, created, **kwargs):
+    """A vendor's parallel capacity feeds the ready-time estimates of its queue"""
+    if not created:
+        eta.record_vendor_changed(instance.id)
+
+def get_order_vendor_ids(order):
+    """IDs of every vendor with items in this order, in one query"""
+    return set(order.items.values_list('vendor_id', flat=True))
+
+def send_new_order_notification(order, vendor_ids=None):
     """Send new order notification to all relevant channels"""
     logger.info(f"send_new_order_notification called for order {order.id}")
+    if vendor_ids is None:
+        vendor_ids = get_order_vendor_ids(order)
+
+    # Skip serialization entirely when nobody is listening
+    table_group = f'table_{order.table.number}'
+    vendor_groups = [f'vendor_{vendor_id}' for vendor_id in vendor_ids]
+    groups = presence.listening(table_group, *vendor_groups)
+    if not groups:
+        logger.debug(f"No listeners for order {order.id} - skipping new order notification")
+        return
+
     order_data = serialize_order_for_notification(order)
     logger.info(f"Order data serialized: {order_data.get('id')}, table: {order_data.get('table_number')}")
 
     # Notify customer table
-    table_group = f'table_{order.table.number}'
-    logger.info(f"Sending to table group: {table_group}")
-    async_to_sync(channel_layer.group_send)(table_group, {
-        'type': 'new_order',
-        'order': order_data
-    })
+    if table_group in groups:
+        logger.info(f"Sending to table group: {table_group}")
+        async_to_sync(channel_layer.group_send)(table_group, {
+            'type': 'new_order',
+            'order': order_data
+        })
 
     # Notify each vendor involved in the order
     try:
-        from vendors.models import Vendor
-        vendor_ids = set()
-        for item in order.items.all():
-            vendor_ids.add(item.menu_item.category.vendor.id)
-
         logger.info(f"Order has items from vendors: {vendor_ids}")
 
-        for vendor_id in vendor_ids:
-            vendor_group = f'vendor_{vendor_id}'
+        for vendor_group in vendor_groups:
+            if vendor_group not in groups:
+                continue
             logger.info(f"Sending new_order_for_vendor to group: {vendor_group}")
             async_to_sync(channel_layer.group_send)(vendor_group, {
                 'type': 'new_order_for_vendor',
@@ -112,64 +190,57 @@ def send_new_order_notification(order):
     except Exception as e:
         logger.error(f"Error notifying vendors: {e}", exc_info=True)
 
-
-
     logger.info(f"New order notification sent for order {order.id}")
 
-def send_order_update_notification(order):
+def send_order_update_notification(order, vendor_ids=None):
     """Send order update notification"""
-    order_data = serialize_order_for_notification(order)
+    if vendor_ids is None:
+        vendor_ids = get_order_vendor_ids(order)
 
-    # Notify customer table
+    # Skip serialization entirely when nobody is listening
     table_group = f'table_{order.table.number}'
-    async_to_sync(channel_layer.group_send)(table_group, {
-        'type': 'order_update',
-        'order': order_data
-    })
+    groups = presence.listening(table_group, *[f'vendor_{vendor_id}' for vendor_id in vendor_ids])
+    if not groups:
+        logger.debug(f"No listeners for order {order.id} - skipping update notification")
+        return
 
-    # Notify vendors involved in this order
-    try:
-        from vendors.models import Vendor
-        vendor_ids = set()
-        for item in order.items.all():
-            vendor_ids.add(item.menu_item.category.vendor.id)
+    order_data = serialize_order_for_notification(order)
 
-        for vendor_id in vendor_ids:
-            vendor_group = f'vendor_{vendor_id}'
-            async_to_sync(channel_layer.group_send)(vendor_group, {
+    # Notify customer table and the vendors involved in this order
+    try:
+        for group in groups:
+            async_to_sync(channel_layer.group_send)(group, {
                 'type': 'order_update',
                 'order': order_data
             })
     except Exception as e:
-        logger.error(f"Error notifying vendors: {e}")
-
-
+        logger.error(f"Error notifying order groups: {e}")
 
     logger.info(f"Order update notification sent for order {order.id}")
 
 def send_order_item_update_notification(order_item):
     """Send notification when individual order item is updated"""
     order = order_item.order
-    order_data = serialize_order_for_notification(order)
+    groups = presence.listening(
+        f'table_{order.table.number}',
+        f'vendor_{order_item.vendor_id}'
+    )
+    if not groups:
+        return
 
-    # Notify customer table
-    table_group = f'table_{order.table.number}'
-    async_to_sync(channel_layer.group_send)(table_group, {
-        'type': 'order_update',
-        'order': order_data
-    })
+    order_data = serialize_order_for_notification(order)
 
-    # Notify vendor
-    vendor_group = f'vendor_{order_item.vendor.id}'
-    async_to_sync(channel_layer.group_send)(vendor_group, {
-        'type': 'order_update',
-        'order': order_data
-    })
+    # Notify customer table and vendor
+    for group in groups:
+        async_to_sync(channel_layer.group_send)(group, {
+            'type': 'order_update',
+            'order': order_data
+        })
 
 def serialize_order_for_notification(order):
     """Serialize order data for WebSocket notifications"""
     items = []
-    for item in order.items.all():
+    for item in order.items.select_related('menu_item', 'vendor'):
         items.append({
             'id': item.id,
             'name': item.menu_item.name,
@@ -177,7 +248,7 @@ def serialize_order_for_notification(order):
             'unit_price': str(item.unit_price),
             'subtotal': str(item.subtotal),
             'vendor': item.vendor.name,
-            'vendor_id': item.vendor.id,
+            'vendor_id': item.vendor_id,
 
             'special_instructions': item.special_instructions,
             'preparation_time': item.menu_item.preparation_time
@@ -203,7 +274,7 @@ def serialize_order_for_notification(order):
 def send_new_order_notification_for_item(order_item):
     """Send new order notification when an item is added to an order"""
     order = order_item.order
-    vendor_id = order_item.menu_item.category.vendor.id
+    vendor_id = order_item.vendor_id
 
     logger.info(f"send_new_order_notification_for_item called for order {order.id}, vendor {vendor_id}")
 
@@ -211,13 +282,13 @@ def send_new_order_notification_for_item(order_item):
     # Check if this vendor already has items in this order
     existing_items = OrderItem.objects.filter(
         order=order,
-        menu_item__category__vendor_id=vendor_id
+        vendor_id=vendor_id
     ).exclude(id=order_item.id).exists()
 
-    if not existing_items and order.status == 'pending':
+    vendor_group = f'vendor_{vendor_id}'
+    if not existing_items and order.status == 'pending' and presence.has_listeners(vendor_group):
         # This is the first item for this vendor in this order
         order_data = serialize_order_for_notification(order)
-        vendor_group = f'vendor_{vendor_id}'
 
         logger.info(f"Sending new_order_for_vendor to group: {vendor_group}")
         async_to_sync(channel_layer.group_send)(vendor_group, {
@@ -229,6 +300,8 @@ def send_new_order_notification_for_item(order_item):
 def notify_cashier_order_ready(order):
     """Notify cashier dashboard when an order is ready or delivered"""
     logger.info(f"notify_cashier_order_ready called for order {order.id}, status: {order.status}")
+    if not presence.has_listeners('cashier_dashboard'):
+        return
 
     try:
         # Calculate time elapsed
@@ -244,8 +317,8 @@ def notify_cashier_order_ready(order):
 
         # Group items by vendor
         vendor_items = {}
-        for item in order.items.all():
-            vendor_name = item.menu_item.category.vendor.name
+        for item in order.items.select_related('menu_item', 'vendor'):
+            vendor_name = item.vendor.name
             if vendor_name not in vendor_items:
                 vendor_items[vendor_name] = []
 
@@ -280,6 +353,8 @@ def send_order_status_change_notification(order, old_status, new_status, message
     """Send specific status change notification"""
     # Notify customer table
     table_group = f'table_{order.table.number}'
+    if not presence.has_listeners(table_group):
+        return
     async_to_sync(channel_layer.group_send)(table_group, {
         'type': 'order_status_change',
         'order_id': str(order.id),
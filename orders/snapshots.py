@@ -0,0 +1,127 @@
+"""
+Single-flight coalescing for WebSocket snapshot loads.
+
+When the server restarts, every vendor tablet and cashier screen reconnects
+at roughly the same moment and asks for the same snapshot. Instead of running
+one `database_sync_to_async` query per socket, concurrent identical requests
+share a single in-flight computation and the result is reused for a short TTL.
+
+Each snapshot key has a generation, kept as a namespace version in the shared
+cache so that a write handled by one worker invalidates the snapshots every
+other worker holds. A result is only served while its generation is current.
+"""
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from core import cache as cache_utils
+
+logger = logging.getLogger(__name__)
+
+
+def vendor_snapshot_key(vendor_id):
+    return ('vendor', str(vendor_id))
+
+
+def cashier_snapshot_key(status_filter='unpaid'):
+    return ('cashier', status_filter)
+
+
+def table_snapshot_key(table_number):
+    return ('table', str(table_number))
+
+
+def _namespace(key):
+    return ':'.join(('snapshot', *key))
+
+
+class SnapshotCoalescer:
+    """Share one in-flight snapshot computation between identical requests"""
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._inflight = {}
+        self._results = {}
+        self.hits = 0
+        self.coalesced = 0
+        self.loads = 0
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'WEBSOCKET_SNAPSHOT_TTL', 2.0)
+
+    async def get(self, key, loader):
+        """Return the snapshot for `key`, running `loader()` at most once at a time"""
+        generation = await self._generation(key)
+        cached = self._results.get(key)
+        if cached and cached[0] > time.monotonic() and cached[1] == generation:
+            self.hits += 1
+            return cached[2]
+
+        # Futures are bound to an event loop, so in-flight work is tracked per loop
+        inflight_key = (id(asyncio.get_running_loop()), key)
+        inflight = self._inflight.get(inflight_key)
+        # A load that started before the latest invalidation may return stale
+        # data, so late arrivals start a fresh one instead of joining it
+        if inflight is None or inflight[0] != generation:
+            self.loads += 1
+            future = asyncio.ensure_future(self._load(inflight_key, key, generation, loader))
+            self._inflight[inflight_key] = (generation, future)
+        else:
+            future = inflight[1]
+            self.coalesced += 1
+
+        # Shield so one cancelled waiter doesn't cancel the load for everyone else
+        return await asyncio.shield(future)
+
+    async def _load(self, inflight_key, key, generation, loader):
+        try:
+            # Loaded from the primary: the result is shared and cached, and a
+            # lagging replica would hand out pre-invalidation data
+            value = await loader()
+            # Don't cache a result that was invalidated while it was being computed
+            if self.ttl > 0 and generation == await self._generation(key):
+                self._results[key] = (time.monotonic() + self.ttl, generation, value)
+            return value
+        finally:
+            # A newer load may have replaced this one; leave that entry alone
+            inflight = self._inflight.get(inflight_key)
+            if inflight is not None and inflight[1] is asyncio.current_task():
+                del self._inflight[inflight_key]
+
+    async def _generation(self, key):
+        # Off the event loop: a Redis round trip can block for the socket timeout
+        return await sync_to_async(cache_utils.version, thread_sensitive=False)(_namespace(key))
+
+    def invalidate(self, key):
+        """Drop a cached snapshot in every worker; safe to call from signal handlers in worker threads"""
+        self._results.pop(key, None)
+        cache_utils.bump(_namespace(key))
+
+    def clear(self):
+        self._results.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'coalesced': self.coalesced,
+            'loads': self.loads,
+            'inflight': len(self._inflight),
+        }
+
+
+snapshot_coalescer = SnapshotCoalescer()
+
+
+def invalidate_order_snapshots(table_number=None, vendor_ids=()):
+    """Invalidate every snapshot an order change can affect"""
+    if table_number is not None:
+        snapshot_coalescer.invalidate(table_snapshot_key(table_number))
+    for vendor_id in vendor_ids:
+        snapshot_coalescer.invalidate(vendor_snapshot_key(vendor_id))
+    snapshot_coalescer.invalidate(cashier_snapshot_key())
@@ -0,0 +1,112 @@
+"""
+Materialized per-table status for the cashier overview and table pickers.
+
+`TableState` holds each table's derived status, active order count, unpaid
+total and latest order. It is recomputed inside the same transaction as every
+order save or delete (see signals), so readers get the whole map from a single
+query instead of several queries per table. Code that changes orders without
+going through `Order.save()` (queryset updates, bulk operations) must call
+`refresh_table_state()` for the affected tables itself.
+"""
+import logging
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('pending', 'confirmed', 'preparing', 'ready', 'delivered')
+KITCHEN_STATUSES = ('pending', 'confirmed', 'preparing')
+
+
+def compute_table_state(table_id):
+    """Derive a table's state fields from its active orders"""
+    from .models import Order, TableStatus
+
+    active = Order.objects.filter(table_id=table_id, status__in=ACTIVE_STATUSES)
+    totals = active.aggregate(
+        orders_count=Count('id'),
+        kitchen_count=Count('id', filter=Q(status__in=KITCHEN_STATUSES)),
+        payable_count=Count('id', filter=Q(status__in=['ready', 'delivered'])),
+        cooking_count=Count('id', filter=Q(status__in=['confirmed', 'preparing'])),
+        unpaid_total=Sum('total_amount'),
+    )
+
+    if not totals['orders_count']:
+        status = TableStatus.AVAILABLE
+    elif totals['payable_count']:
+        status = TableStatus.READY_FOR_PAYMENT
+    elif totals['cooking_count']:
+        status = TableStatus.OCCUPIED
+    else:
+        status = TableStatus.PENDING
+
+    return {
+        'status': status,
+        'orders_count': totals['orders_count'],
+        'kitchen_count': totals['kitchen_count'],
+        'unpaid_total': totals['unpaid_total'] or Decimal('0.00'),
+        'latest_order_id': active.order_by('-created_at').values_list('id', flat=True).first(),
+    }
+
+
+def _lock_state_row(table_id):
+    """Lock the table's state row, creating it on the table's first order"""
+    from .models import TableState
+
+    try:
+        return TableState.objects.select_for_update().get(table_id=table_id)
+    except TableState.DoesNotExist:
+        pass
+    try:
+        with transaction.atomic():
+            return TableState.objects.create(table_id=table_id)
+    except IntegrityError:
+        # A concurrent first write created the row; wait for its lock instead
+        return TableState.objects.select_for_update().get(table_id=table_id)
+
+
+def refresh_table_state(*table_ids):
+    """Recompute the projection for the given tables in the current transaction"""
+    from vendors.models import Table
+    from .models import TableState
+
+    with transaction.atomic():
+        # Skip tables that were deleted along with their orders
+        for table_id in Table.objects.filter(id__in=table_ids).values_list('id', flat=True):
+            # Lock the row so concurrent transitions on one table apply in order
+            _lock_state_row(table_id)
+            TableState.objects.filter(table_id=table_id).update(
+                updated_at=timezone.now(), **compute_table_state(table_id)
+            )
+
+
+def rebuild_table_states():
+    """Recompute every table's projection; returns the number of tables refreshed"""
+    from vendors.models import Table
+
+    table_ids = list(Table.objects.values_list('id', flat=True))
+    refresh_table_state(*table_ids)
+    logger.info(f"Rebuilt table state for {len(table_ids)} tables")
+    return len(table_ids)
+
+
+def serialize_table_state(table):
+    """Overview entry for a Table loaded with select_related('state__latest_order')"""
+    state = getattr(table, 'state', None)
+    latest_order = state.latest_order if state else None
+    return {
+        'number': table.number,
+        'seats': table.seats,
+        'status': state.status if state else 'available',
+        'orders_count': state.orders_count if state else 0,
+        'unpaid_total': str(state.unpaid_total if state else Decimal('0.00')),
+        'latest_order': {
+            'id': str(latest_order.id)[:8],
+            'status': latest_order.status,
+            'created_at': latest_order.created_at.isoformat(),
+            'customer_name': latest_order.customer_name
+        } if latest_order else None
+    }
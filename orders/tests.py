@@ -1,3 +1,353 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.urls import reverse, reverse_lazy
+
+from core import throttling
+from vendors.models import Category, MenuItem, Table, Vendor
+
+from . import archive, eta, rollups, settlement
+from .business_dates import current_business_date
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, SalesRollup
+from .outbox import BufferedSendMixin
+from .snapshots import SnapshotCoalescer, table_snapshot_key
+
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-sessions'},
+}
+MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CACHES=LOCAL_CACHES, CHANNEL_LAYERS=MEMORY_CHANNEL_LAYERS)
+class OrderTestCase(TestCase):
+    """Two vendors with one menu item each and a table, without Redis"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendors = []
+        cls.menu_items = []
+        for number, vendor_type in enumerate(('food', 'drinks'), start=1):
+            owner = User.objects.create_user(f'vendor{number}', password='secret')
+            vendor = Vendor.objects.create(name=f'Vendor {number}', vendor_type=vendor_type, owner=owner)
+            category = Category.objects.create(name='Mains', vendor=vendor)
+            cls.vendors.append(vendor)
+            cls.menu_items.append(MenuItem.objects.create(name=f'Item {number}', price=Decimal('10.00'), category=category))
+        cls.table = Table.objects.create(number=1)
+
+    def setUp(self):
+        from django.core.cache import caches
+
+        for alias in LOCAL_CACHES:
+            caches[alias].clear()
+
+    def place_order(self, *menu_items, status='pending', table=None, **fields):
+        order = Order.objects.create(table=table or self.table, status=status, **fields)
+        for menu_item in menu_items:
+            OrderItem.objects.create(order=order, menu_item=menu_item, quantity=1, unit_price=menu_item.price)
+        return order
+
+    def pay_order(self, *menu_items, days_ago=0):
+        """A paid order on the business date `days_ago` days back"""
+        business_date = current_business_date() - timedelta(days=days_ago)
+        order = self.place_order(*menu_items, status='ready', business_date=business_date, business_hour=12)
+        order.refresh_from_db()
+        order.status = 'paid'
+        order.save()
+        return order
+
+
+class RecordingLayer:
+    def __init__(self):
+        self.sent = []
+
+    async def group_send(self, group, event):
+        self.sent.append((group, event))
+
+
+@mock.patch.object(settlement.presence, 'listening', lambda *groups: list(groups))
+class TableCloseOutTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        food, drinks = self.menu_items
+        self.food_only = self.place_order(food, status='ready')
+        self.drinks_only = self.place_order(drinks, status='ready')
+        self.both = self.place_order(food, drinks, status='delivered')
+        self.layer = RecordingLayer()
+        patcher = mock.patch.object(settlement, 'get_channel_layer', return_value=self.layer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sent_to(self, group):
+        return [event for sent_group, event in self.layer.sent if sent_group == group]
+
+    def test_settle_sends_each_vendor_only_its_orders(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = settlement.settle_table(self.table, 'cash')
+
+        self.assertEqual(result['orders_paid'], 3)
+        food_vendor, drinks_vendor = self.vendors
+        [food_event] = self.sent_to(f'vendor_{food_vendor.pk}')
+        [drinks_event] = self.sent_to(f'vendor_{drinks_vendor.pk}')
+        self.assertEqual(
+            {order['id'] for order in food_event['settlement']['orders']},
+            {str(self.food_only.pk), str(self.both.pk)},
+        )
+        self.assertEqual(
+            {order['id'] for order in drinks_event['settlement']['orders']},
+            {str(self.drinks_only.pk), str(self.both.pk)},
+        )
+        [table_event] = self.sent_to('table_1')
+        self.assertEqual(len(table_event['settlement']['orders']), 3)
+        [cashier_event] = self.sent_to('cashier_dashboard')
+        self.assertIn('stats', cashier_event)
+
+    def test_reset_sends_each_vendor_only_its_orders(self):
+        pending = self.place_order(self.menu_items[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            result = settlement.reset_table(self.table)
+
+        self.assertEqual(result['orders_cancelled'], 4)
+        self.assertEqual(Order.objects.filter(table=self.table).exclude(status='cancelled').count(), 0)
+        food_vendor, drinks_vendor = self.vendors
+        [food_event] = self.sent_to(f'vendor_{food_vendor.pk}')
+        [drinks_event] = self.sent_to(f'vendor_{drinks_vendor.pk}')
+        self.assertEqual(
+            set(food_event['reset']['order_ids']),
+            {str(self.food_only.pk), str(self.both.pk), str(pending.pk)},
+        )
+        self.assertEqual(set(drinks_event['reset']['order_ids']), {str(self.drinks_only.pk), str(self.both.pk)})
+        [table_event] = self.sent_to('table_1')
+        self.assertEqual(len(table_event['reset']['order_ids']), 4)
+
+
+class EtaDedupTests(OrderTestCase):
+    def test_lines_saved_in_one_transaction_queue_the_order_once(self):
+        with mock.patch.object(eta, '_enqueue') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                order = self.place_order(*self.menu_items, self.menu_items[0])
+
+        enqueue.assert_called_once()
+        self.assertEqual(enqueue.call_args.args[0].pk, order.pk)
+
+    def test_rolled_back_lines_do_not_block_the_next_transaction(self):
+        order = Order.objects.create(table=self.table)
+
+        with mock.patch.object(eta, '_enqueue') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        OrderItem.objects.create(order=order, menu_item=self.menu_items[0], quantity=1)
+                        raise ValueError
+                except ValueError:
+                    pass
+                OrderItem.objects.create(order=order, menu_item=self.menu_items[1], quantity=1)
+
+        enqueue.assert_called_once()
+        self.assertEqual(enqueue.call_args.args[0].pk, order.pk)
+
+
+class MetricsAccessTests(OrderTestCase):
+    url = reverse_lazy('orders:prometheus_metrics')
+
+    def test_local_requests_are_refused_by_default(self):
+        response = self.client.get(self.url, REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_bearer_token_grants_access(self):
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer scrape-me').status_code, 200)
+
+    def test_staff_can_read_metrics(self):
+        staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_allowlist_is_opt_in(self):
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+
+class SnapshotCoalescerTests(OrderTestCase):
+    async def test_invalidation_reaches_other_workers(self):
+        worker_a, worker_b = SnapshotCoalescer(ttl=60), SnapshotCoalescer(ttl=60)
+        key = table_snapshot_key(1)
+        payloads = iter(['before', 'after'])
+
+        async def load():
+            return next(payloads)
+
+        self.assertEqual(await worker_a.get(key, load), 'before')
+        self.assertEqual(await worker_a.get(key, load), 'before')
+        worker_b.invalidate(key)
+        self.assertEqual(await worker_a.get(key, load), 'after')
+        self.assertEqual(worker_a.loads, 2)
+
+
+class ArchiveTests(OrderTestCase):
+    def rollup_totals(self):
+        return {
+            row['vendor_id']: (row['quantity'], row['revenue'], row['orders'])
+            for row in SalesRollup.objects.values('vendor_id').annotate(
+                quantity=Sum('quantity'), revenue=Sum('revenue'), orders=Sum('order_count')
+            )
+        }
+
+    def test_archive_and_restore_keep_rows_and_rollups(self):
+        food, drinks = self.menu_items
+        old = [self.pay_order(food, drinks, days_ago=40), self.pay_order(food, days_ago=35)]
+        recent = self.pay_order(drinks)
+        totals = self.rollup_totals()
+        self.assertEqual(totals[None], (4, Decimal('40.00'), 3))
+
+        moved = archive.archive_orders(days=30)
+        self.assertEqual(moved['order'], 2)
+        self.assertEqual(moved['item'], 3)
+        self.assertEqual(set(ArchivedOrder.objects.values_list('id', flat=True)), {order.pk for order in old})
+        self.assertEqual(list(Order.objects.values_list('id', flat=True)), [recent.pk])
+        self.assertEqual(self.rollup_totals(), totals)
+
+        # A rebuild reads the archive tables too
+        rollups.backfill(current_business_date() - timedelta(days=90), current_business_date())
+        self.assertEqual(self.rollup_totals(), totals)
+
+        restored = archive.restore_dates(current_business_date() - timedelta(days=90), current_business_date())
+        self.assertEqual(restored['order'], 2)
+        self.assertFalse(ArchivedOrder.objects.exists())
+        self.assertFalse(ArchivedOrderItem.objects.exists())
+        self.assertEqual(OrderItem.objects.filter(order__in=old).count(), 3)
+        self.assertEqual(self.rollup_totals(), totals)
+
+
+class VendorPaidOrdersPaginationTests(OrderTestCase):
+    def test_pages_run_across_live_and_archived_orders(self):
+        food, drinks = self.menu_items
+        food_orders = [self.pay_order(food, days_ago=days) for days in (50, 45, 40, 2, 1, 0)]
+        self.pay_order(drinks, days_ago=1)
+        archive.archive_orders(days=30)
+        self.assertEqual(ArchivedOrder.objects.count(), 3)
+
+        vendor = self.vendors[0]
+        self.client.force_login(vendor.owner)
+        url = reverse('vendors:vendor_paid_orders', args=[vendor.pk])
+        seen = []
+        cursor = None
+        while True:
+            params = {'days': 90, 'per_page': 4}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get(url, params).json()
+            seen.extend(entry['order']['id'] for entry in data['orders'])
+            cursor = data['next_cursor']
+            if not data['has_next']:
+                break
+
+        self.assertEqual(seen, [str(order.pk) for order in reversed(food_orders)])
+
+
+class FakeSocket(BufferedSendMixin):
+    """Just enough of a consumer to drive the outbox writer"""
+
+    channel_name = 'test.outbox'
+
+    def __init__(self, fail_resync=False):
+        self.frames = []
+        self.close_code = None
+        self.fail_resync = fail_resync
+        self.release = asyncio.Event()
+
+    async def send(self, text_data=None):
+        # Nothing goes out until the test releases the socket, like a slow tablet
+        await self.release.wait()
+        self.frames.append(text_data)
+
+    async def resync(self):
+        if self.fail_resync:
+            raise RuntimeError('database unavailable')
+        self.frames.append('snapshot')
+
+    async def close(self, code=None):
+        self.close_code = code
+
+
+@override_settings(WEBSOCKET_SEND_QUEUE_SIZE=3)
+class OutboxTests(OrderTestCase):
+    async def drain(self, socket):
+        socket.release.set()
+        for _ in range(20):
+            await asyncio.sleep(0)
+
+    async def test_updates_for_the_same_order_coalesce(self):
+        socket = FakeSocket()
+        socket.start_outbox()
+        for status in ('confirmed', 'preparing', 'ready'):
+            await socket.send_event({'order_id': 'a', 'status': status}, coalesce_key='a')
+        await socket.send_event({'order_id': 'b', 'status': 'confirmed'}, coalesce_key='b')
+        await self.drain(socket)
+        await socket.stop_outbox()
+
+        self.assertEqual(socket.outbox.coalesced, 2)
+        self.assertNotIn('"confirmed"', ''.join(frame for frame in socket.frames if '"a"' in frame))
+
+    async def test_overflow_discards_the_backlog_and_resyncs(self):
+        socket = FakeSocket()
+        socket.start_outbox()
+        for number in range(5):
+            await socket.send_event({'number': number})
+        await self.drain(socket)
+        await socket.stop_outbox()
+
+        self.assertEqual(socket.outbox.resyncs, 1)
+        self.assertIn('snapshot', socket.frames)
+        self.assertEqual(socket.frames[socket.frames.index('snapshot') + 1:], ['{"number": 4}'])
+
+    async def test_failed_writer_closes_the_socket(self):
+        socket = FakeSocket(fail_resync=True)
+        socket.start_outbox()
+        for number in range(5):
+            await socket.send_event({'number': number})
+        await self.drain(socket)
+        await socket.stop_outbox()
+
+        self.assertEqual(socket.close_code, 1011)
+
+
+class UnreachableRedis:
+    def register_script(self, script):
+        def run(keys, args):
+            raise ConnectionError('Connection refused')
+        return run
+
+
+@override_settings(THROTTLE_ENABLED=True, THROTTLE_RATES={'items_status': {'ip': '2/min'}})
+class ThrottleFallbackTests(OrderTestCase):
+    url = reverse_lazy('orders:table_items_status', args=[1])
+
+    def setUp(self):
+        super().setUp()
+        throttling._local.reset()
+        self.addCleanup(throttling._local.reset)
+
+    def assert_local_buckets_throttle(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    def test_requests_are_throttled_locally_without_redis(self):
+        with mock.patch.object(throttling, 'get_redis', return_value=None):
+            self.assert_local_buckets_throttle()
+
+    def test_failing_redis_falls_back_to_local_buckets(self):
+        with mock.patch.object(throttling, 'get_redis', return_value=UnreachableRedis()), \
+                mock.patch.object(throttling, 'reset_redis') as reset_redis:
+            self.assert_local_buckets_throttle()
+        self.assertEqual(reset_redis.call_count, 3)
@@ -20,11 +20,14 @@ urlpatterns = [
     path('cashier/login/', cashier_views.cashier_login, name='cashier_login'),
     path('cashier/logout/', cashier_views.cashier_logout, name='cashier_logout'),
     path('cashier/', cashier_views.cashier_dashboard, name='cashier_dashboard'),
+    path('cashier/orders/rows/', cashier_views.cashier_order_rows, name='cashier_order_rows'),
     path('cashier/mark-paid/<uuid:order_id>/', cashier_views.mark_order_paid, name='mark_order_paid'),
     path('cashier/reset-table/<int:table_number>/', cashier_views.reset_table, name='reset_table'),
+    path('cashier/settle-table/<int:table_number>/', cashier_views.settle_table, name='settle_table'),
     path('cashier/order/<uuid:order_id>/', cashier_views.order_details, name='cashier_order_details'),
     path('cashier/tables-overview/', cashier_views.table_status_overview, name='table_status_overview'),
     path('cashier/sales-report/', cashier_views.daily_sales_report, name='daily_sales_report'),
+    path('cashier/export/<str:dataset>/', cashier_views.export_data, name='export_data'),
 
     # WebSocket URL (handled by routing.py)
     # path('ws/orders/<int:table_number>/', ...),
@@ -39,6 +42,10 @@ urlpatterns = [
     path('api/table-status/<int:table_number>/', views.table_status, name='table_status'),
     path('api/tables/', views.get_tables, name='get_tables'),
     path('api/status/', views.status_check, name='status_check'),
+    path('api/ws-metrics/', views.websocket_metrics, name='websocket_metrics'),
+    path('api/db-pool-metrics/', views.db_pool_metrics, name='db_pool_metrics'),
+    path('api/cache-metrics/', views.cache_metrics, name='cache_metrics'),
+    path('metrics', views.prometheus_metrics, name='prometheus_metrics'),
     path('api/clear-session/', views.clear_session, name='clear_session'),
     path('debug/cart/<int:table_number>/', views.debug_cart, name='debug_cart'),
 ]
@@ -1,32 +1,40 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.db import transaction
 from django.utils import timezone
+from django.conf import settings
+from channels.layers import get_channel_layer
 from .models import Order, OrderItem, Cart, CartItem
+from .outbox import connection_metrics
+from core.db_pool import pool_stats
+from core import cache as cache_utils
+from core.throttling import client_ip, throttle
+from core import metrics
+from . import presence
 from vendors.models import Table, MenuItem, Vendor, Category
+from vendors import menu
 import json
+import secrets
 from decimal import Decimal
 
+def _remember(request, **values):
+    """Store values in the session, leaving it unmodified (and unsaved) when nothing changed"""
+    for key, value in values.items():
+        if request.session.get(key) != value:
+            request.session[key] = value
+
 def table_selection(request):
     """Landing page with menu and table selection"""
-    tables = Table.objects.filter(is_active=True).order_by('number')
+    tables = Table.objects.filter(is_active=True).select_related('state').order_by('number')
 
     # Add occupancy status to each table
     for table in tables:
         table.occupied = table.is_occupied
 
-    # Get all vendors and their categories for the menu
-    vendors = Vendor.objects.filter(is_active=True).prefetch_related(
-        'categories__menu_items'
-    ).order_by('vendor_type', 'name')
-
-    # Separate drinks and food vendors
-    drinks_vendors = vendors.filter(vendor_type='drinks')
-    food_vendors = vendors.filter(vendor_type='food')
-
     # Check if user has a saved table
     saved_table = None
     if request.session.get('selected_table'):
@@ -36,52 +44,11 @@ def table_selection(request):
         except Table.DoesNotExist:
             del request.session['selected_table']
 
-    # Serialize vendor data for frontend
-    def serialize_vendors(vendor_queryset):
-        vendors_data = []
-        for vendor in vendor_queryset:
-            categories_data = []
-            for category in vendor.categories.filter(is_active=True):
-                items_data = []
-                for item in category.menu_items.filter(is_available=True):
-                    items_data.append({
-                        'id': item.id,
-                        'name': item.name,
-                        'description': item.description,
-                        'price': str(item.price),
-                        'is_available': item.is_available,
-                        'is_vegetarian': item.is_vegetarian,
-                        'is_vegan': item.is_vegan,
-                        'is_spicy': item.is_spicy,
-                        'calories': item.calories,
-                        'preparation_time': item.preparation_time,
-                        'ingredients': item.ingredients,
-                        'image': item.image.url if item.image else None
-                    })
-
-                if items_data:  # Only include categories that have available items
-                    categories_data.append({
-                        'id': category.id,
-                        'name': category.name,
-                        'description': category.description,
-                        'menu_items': items_data
-                    })
-
-            if categories_data:  # Only include vendors that have active categories with items
-                vendors_data.append({
-                    'id': vendor.id,
-                    'name': vendor.name,
-                    'description': vendor.description,
-                    'vendor_type': vendor.vendor_type,
-                    'categories': categories_data
-                })
-
-        return vendors_data
-
+    # Menu payloads are cached per menu version (see vendors.menu)
     context = {
         'tables': tables,
-        'drinks_vendors': json.dumps(serialize_vendors(drinks_vendors)),
-        'food_vendors': json.dumps(serialize_vendors(food_vendors)),
+        'drinks_vendors': json.dumps(menu.get_menu_payload('drinks')),
+        'food_vendors': json.dumps(menu.get_menu_payload('food')),
         'saved_table': saved_table,
     }
 
@@ -98,9 +65,7 @@ def phone_input(request, table_number):
 
         if phone:
             # Store customer info in session
-            request.session['selected_table'] = table_number
-            request.session['customer_phone'] = phone
-            request.session['customer_name'] = customer_name
+            _remember(request, selected_table=table_number, customer_phone=phone, customer_name=customer_name)
             return redirect('orders:table_menu', table_number=table_number)
         else:
             messages.error(request, 'Please enter a valid phone number.')
@@ -120,21 +85,14 @@ def table_menu(request, table_number):
         return redirect('orders:phone_input', table_number=table_number)
 
     # Store selected table in session
-    request.session['selected_table'] = table_number
-
-    # Get all vendors and their categories for the menu
-    vendors = Vendor.objects.filter(is_active=True).prefetch_related(
-        'categories__menu_items'
-    ).order_by('vendor_type', 'name')
-
-    # Separate drinks and food vendors
-    drinks_vendors = vendors.filter(vendor_type='drinks')
-    food_vendors = vendors.filter(vendor_type='food')
+    _remember(request, selected_table=table_number)
 
+    # Menu payloads are cached per menu version (see vendors.menu); the page
+    # applies later menu_update deltas over its WebSocket
     context = {
         'table': table,
-        'drinks_vendors': drinks_vendors,
-        'food_vendors': food_vendors,
+        'drinks_vendors': menu.get_menu_payload('drinks'),
+        'food_vendors': menu.get_menu_payload('food'),
         'customer_phone': request.session.get('customer_phone'),
         'customer_name': request.session.get('customer_name'),
     }
@@ -142,6 +100,7 @@ def table_menu(request, table_number):
     return render(request, 'orders/simple_menu.html', context)
 
 @require_http_methods(["POST"])
+@throttle('add_to_cart')
 def add_to_cart(request):
     """Add item to cart via AJAX"""
     try:
@@ -158,7 +117,7 @@ def add_to_cart(request):
         table = get_object_or_404(Table, number=table_number, is_active=True)
 
         # Store table selection in session
-        request.session['selected_table'] = table_number
+        _remember(request, selected_table=table.number)
 
         # Get or create cart
         cart = get_or_create_cart(request, table)
@@ -192,6 +151,7 @@ def add_to_cart(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 @require_http_methods(["POST"])
+@throttle('update_cart_item')
 def update_cart_item(request):
     """Update cart item quantity"""
     try:
@@ -217,6 +177,7 @@ def update_cart_item(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 @require_http_methods(["POST"])
+@throttle('update_cart_item')
 def remove_from_cart(request):
     """Remove item from cart"""
     try:
@@ -272,6 +233,7 @@ def checkout(request, table_number):
     return render(request, 'orders/checkout.html', context)
 
 @require_http_methods(["POST"])
+@throttle('place_order')
 def place_order(request, table_number):
     """Place the order"""
     try:
@@ -353,7 +315,7 @@ def track_orders(request, table_number):
                 'subtotal': str(item.subtotal),
                 'special_instructions': item.special_instructions,
 
-                'vendor': item.menu_item.category.vendor.name
+                'vendor': item.vendor.name
             })
 
         orders_data.append({
@@ -364,7 +326,7 @@ def track_orders(request, table_number):
             'created_at': order.created_at.isoformat(),
             'confirmed_at': order.confirmed_at.isoformat() if order.confirmed_at else None,
             'ready_at': order.ready_at.isoformat() if order.ready_at else None,
-            'estimated_ready_time': None,  # Add estimated time logic later
+            'estimated_ready_time': order.estimated_ready_time.isoformat() if order.estimated_ready_time else None,
             'items': order_items
         })
 
@@ -450,6 +412,7 @@ def get_cart_status(request, table_number):
         return JsonResponse({'error': str(e)}, status=500)
 
 @require_http_methods(["GET"])
+@throttle('items_status')
 def get_table_items_status(request, table_number):
     """Get comprehensive items status including cart and orders"""
     try:
@@ -492,7 +455,7 @@ def get_table_items_status(request, table_number):
                 items_data.append({
                     'id': item.id,
                     'name': item.menu_item.name,
-                    'vendor_name': item.menu_item.category.vendor.name,
+                    'vendor_name': item.vendor.name,
                     'quantity': item.quantity,
                     'unit_price': str(item.unit_price),
                     'subtotal': str(item.subtotal),
@@ -530,11 +493,13 @@ def status_check(request):
         vendor_count = Vendor.objects.count()
         menu_item_count = MenuItem.objects.count()
 
+        layer = get_channel_layer()
         return JsonResponse({
             'status': 'ok',
             'tables': table_count,
             'vendors': vendor_count,
             'menu_items': menu_item_count,
+            'channel_layer': layer.status() if hasattr(layer, 'status') else {'active': type(layer).__name__},
             'timestamp': timezone.now().isoformat()
         })
     except Exception as e:
@@ -543,10 +508,60 @@ def status_check(request):
             'error': str(e)
         }, status=500)
 
+@staff_member_required
+def websocket_metrics(request):
+    """Per-connection send queue depth and lag for this worker process"""
+    connections = connection_metrics()
+    return JsonResponse({
+        'connections': sorted(connections, key=lambda c: c['oldest_age'], reverse=True),
+        'summary': {
+            'open_connections': len(connections),
+            'queued_messages': sum(c['depth'] for c in connections),
+            'max_lag': max((c['max_lag'] for c in connections), default=0),
+            'dropped': sum(c['dropped'] for c in connections),
+            'resyncs': sum(c['resyncs'] for c in connections),
+        },
+        'presence': presence.counts(),
+        'timestamp': timezone.now().isoformat()
+    })
+
+@staff_member_required
+def db_pool_metrics(request):
+    """Database connection pool usage for this worker process"""
+    return JsonResponse({
+        'databases': pool_stats(),
+        'asgi_threads': settings.ASGI_THREADS,
+        'timestamp': timezone.now().isoformat()
+    })
+
+def _metrics_token_valid(request):
+    token = settings.METRICS_TOKEN
+    scheme, _, supplied = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and secrets.compare_digest(supplied.strip(), token)
+
+def prometheus_metrics(request):
+    """Request, WebSocket and backend metrics for this worker in the Prometheus text format"""
+    if not (
+        request.user.is_staff
+        or _metrics_token_valid(request)
+        or client_ip(request) in settings.METRICS_ALLOWED_IPS
+    ):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@staff_member_required
+def cache_metrics(request):
+    """Cache hit rates per namespace and cache backend state for this worker process"""
+    return JsonResponse({
+        **cache_utils.stats(),
+        'session_engine': settings.SESSION_ENGINE,
+        'timestamp': timezone.now().isoformat()
+    })
+
 def get_tables(request):
     """Get all tables for API"""
     try:
-        tables = Table.objects.filter(is_active=True).order_by('number')
+        tables = Table.objects.filter(is_active=True).select_related('state').order_by('number')
         tables_data = []
         for table in tables:
             tables_data.append({
@@ -582,8 +597,6 @@ def clear_session(request):
             if key in request.session:
                 del request.session[key]
 
-        request.session.modified = True
-
         return JsonResponse({'success': True, 'message': 'Session and cart cleared'})
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+Hot-path Query Benchmark for River Side Food Court
+
+Runs the dashboard and consumer queries that filter order items by vendor or
+orders by status/table, twice:
+
+    before  the legacy form (OrderItem -> MenuItem -> Category -> Vendor join)
+            with the composite indexes dropped inside a rolled-back transaction
+    after   the denormalized OrderItem.vendor and Order.business_date form
+            with the indexes in place
+
+For each query it prints the EXPLAIN plan of both runs and the median
+execution time over --repeat runs. Use --output to save the results as JSON.
+
+Examples:
+    python query_benchmark.py
+    python query_benchmark.py --repeat 50 --vendor 3 --output explain.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+NEW_INDEXES = {
+    'orders_order': ['orders_order_status_created', 'orders_order_table_status', 'orders_order_bizdate_status'],
+    'orders_orderitem': ['orders_item_vendor_order'],
+}
+ACTIVE_STATUSES = ['pending', 'confirmed', 'preparing', 'ready', 'delivered']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='EXPLAIN and time hot-path order queries before/after denormalization')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query')
+    parser.add_argument('--vendor', type=int, help='Vendor id to query (default: the vendor with most order items)')
+    parser.add_argument('--table', type=int, help='Table id to query (default: the table with most orders)')
+    parser.add_argument('--analyze', action='store_true', help='Use EXPLAIN ANALYZE on PostgreSQL')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    return parser.parse_args()
+
+
+def configure_django():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    import django
+    django.setup()
+
+
+def hot_queries(vendor_id, table_id, legacy):
+    """name -> queryset; `legacy` uses the three-table vendor join and created_at dates"""
+    from django.db.models import Count, Q, Sum
+    from django.utils import timezone
+    from orders.business_dates import current_business_date
+    from orders.models import Order, OrderItem
+
+    vendor_filter = {'menu_item__category__vendor_id': vendor_id} if legacy else {'vendor_id': vendor_id}
+    today = current_business_date()
+    placed_today = {'order__created_at__date': today} if legacy else {'order__business_date': today}
+    paid_today = (
+        {'created_at__gte': timezone.make_aware(datetime.combine(today, datetime.min.time()))} if legacy
+        else {'business_date': today}
+    )
+
+    return {
+        'vendor_active_items': OrderItem.objects.filter(
+            order__status__in=ACTIVE_STATUSES, **vendor_filter
+        ).select_related('order__table', 'menu_item').order_by('-order__created_at'),
+        'vendor_today_summary': OrderItem.objects.filter(
+            Q(**placed_today) | Q(order__status__in=['ready', 'delivered']), **vendor_filter
+        ).values('order__status').annotate(items=Count('id'), revenue=Sum('subtotal')),
+        'vendor_order_ids': Order.objects.filter(
+            id__in=OrderItem.objects.filter(**vendor_filter).values('order_id'), status='paid'
+        ).order_by('-created_at')[:20],
+        'cashier_unpaid': Order.objects.filter(
+            status__in=['ready', 'delivered']
+        ).order_by('-created_at'),
+        'cashier_status_today': Order.objects.filter(
+            status='paid', **paid_today
+        ),
+        'table_active_orders': Order.objects.filter(
+            table_id=table_id, status__in=ACTIVE_STATUSES
+        ).order_by('-created_at'),
+    }
+
+
+def explain(queryset, analyze):
+    """EXPLAIN text for a queryset"""
+    from django.db import connection
+    options = {'analyze': True} if analyze and connection.vendor == 'postgresql' else {}
+    return queryset.explain(**options)
+
+
+def time_query(queryset, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(queryset._chain())
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 3)
+
+
+def drop_new_indexes():
+    from django.db import connection
+    with connection.cursor() as cursor:
+        for names in NEW_INDEXES.values():
+            for name in names:
+                cursor.execute(f'DROP INDEX IF EXISTS {connection.ops.quote_name(name)}')
+
+
+def run_phase(phase, vendor_id, table_id, args):
+    from django.db import transaction
+
+    results = {}
+    with transaction.atomic():
+        legacy = phase == 'before'
+        if legacy:
+            drop_new_indexes()
+        queries = hot_queries(vendor_id, table_id, legacy)
+        for name, queryset in queries.items():
+            results[name] = {
+                'plan': explain(queryset, args.analyze),
+                'median_ms': time_query(queryset, args.repeat),
+            }
+        # Never keep the dropped indexes dropped
+        transaction.set_rollback(True)
+    return results
+
+
+def pick_defaults(args):
+    from django.db.models import Count
+    from orders.models import Order, OrderItem
+
+    vendor_id = args.vendor or (
+        OrderItem.objects.values('vendor_id').annotate(n=Count('id')).order_by('-n')
+        .values_list('vendor_id', flat=True).first()
+    )
+    table_id = args.table or (
+        Order.objects.values('table_id').annotate(n=Count('id')).order_by('-n')
+        .values_list('table_id', flat=True).first()
+    )
+    return vendor_id, table_id
+
+
+def print_summary(results):
+    print("\n" + "=" * 78)
+    print("📊 HOT-PATH QUERY BENCHMARK")
+    print("=" * 78)
+    for name in results['after']:
+        before = results['before'].get(name)
+        after = results['after'][name]
+        print(f"\n▶ {name}")
+        if before:
+            print("  before:")
+            for line in before['plan'].splitlines():
+                print(f"    {line}")
+        print("  after:")
+        for line in after['plan'].splitlines():
+            print(f"    {line}")
+        if before:
+            print(f"  median: {before['median_ms']}ms -> {after['median_ms']}ms")
+        else:
+            print(f"  median: {after['median_ms']}ms")
+
+
+def main():
+    args = parse_args()
+    configure_django()
+
+    from django.db import connection
+    from orders.models import OrderItem
+
+    if not OrderItem.objects.exists():
+        print("❌ No order items to query - run `manage.py create_sample_data` first")
+        sys.exit(1)
+
+    vendor_id, table_id = pick_defaults(args)
+    print(f"🔍 {connection.vendor}: vendor {vendor_id}, table {table_id}, {args.repeat} runs per query")
+
+    results = {
+        'database': connection.vendor,
+        'vendor_id': vendor_id,
+        'table_id': table_id,
+        'before': run_phase('before', vendor_id, table_id, args),
+        'after': run_phase('after', vendor_id, table_id, args),
+    }
+    print_summary(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n🛑 Benchmark interrupted by user")
+        sys.exit(1)
@@ -12,7 +12,7 @@ class VendorAdmin(admin.ModelAdmin):
             'fields': ('name', 'vendor_type', 'description', 'owner')
         }),
         ('Settings', {
-            'fields': ('is_active', 'opening_time', 'closing_time', 'logo')
+            'fields': ('is_active', 'opening_time', 'closing_time', 'parallel_capacity', 'logo')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
@@ -70,6 +70,7 @@ class TableAdmin(admin.ModelAdmin):
     search_fields = ('number',)
     list_editable = ('seats', 'is_active')
     readonly_fields = ('created_at', 'is_occupied')
+    list_select_related = ('state',)
 
     def is_occupied(self, obj):
         return obj.is_occupied
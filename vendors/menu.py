@@ -0,0 +1,236 @@
+"""
+Menu versioning and bulk menu edits.
+
+The customer menu payload is cached under a single global menu version.
+Saving a vendor, category or menu item bumps the version through signals, so
+admin edits invalidate it. Bulk edits from the menu management page go
+through `apply_menu_updates`. That writes every changed item in one
+transaction with a single `bulk_update`, bumps the version once and
+broadcasts one `menu_update` delta to MENU_GROUP. Signals never fire
+per item there.
+"""
+import logging
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from core import cache as cache_utils
+
+logger = logging.getLogger(__name__)
+
+MENU_GROUP = 'menu_updates'
+MENU_NAMESPACE = 'menu'
+
+EDITABLE_FIELDS = ('is_available', 'price', 'preparation_time', 'sort_order')
+
+
+class MenuUpdateError(Exception):
+    """A bulk menu edit that cannot be applied as requested"""
+
+
+def menu_version():
+    return cache_utils.version(MENU_NAMESPACE)
+
+
+def bump_menu_version():
+    """Retire the cached menu payload once the transaction commits"""
+    cache_utils.invalidate(MENU_NAMESPACE)
+
+
+def build_menu_payload(vendor_type):
+    """Active vendors of one type with their active categories and available items"""
+    from .models import Category, MenuItem, Vendor
+
+    vendors = Vendor.objects.filter(is_active=True, vendor_type=vendor_type).prefetch_related(
+        Prefetch(
+            'categories',
+            queryset=Category.objects.filter(is_active=True).prefetch_related(
+                Prefetch('menu_items', queryset=MenuItem.objects.filter(is_available=True))
+            )
+        )
+    ).order_by('vendor_type', 'name')
+
+    vendors_data = []
+    for vendor in vendors:
+        categories_data = []
+        for category in vendor.categories.all():
+            items_data = [
+                {
+                    'id': item.id,
+                    'name': item.name,
+                    'description': item.description,
+                    'price': str(item.price),
+                    'is_available': item.is_available,
+                    'is_vegetarian': item.is_vegetarian,
+                    'is_vegan': item.is_vegan,
+                    'is_spicy': item.is_spicy,
+                    'calories': item.calories,
+                    'preparation_time': item.preparation_time,
+                    'ingredients': item.ingredients,
+                    'image': item.image.url if item.image else None
+                }
+                for item in category.menu_items.all()
+            ]
+
+            if items_data:  # Only include categories that have available items
+                categories_data.append({
+                    'id': category.id,
+                    'name': category.name,
+                    'description': category.description,
+                    'menu_items': items_data
+                })
+
+        if categories_data:  # Only include vendors that have active categories with items
+            vendors_data.append({
+                'id': vendor.id,
+                'name': vendor.name,
+                'description': vendor.description,
+                'vendor_type': vendor.vendor_type,
+                'categories': categories_data
+            })
+
+    return vendors_data
+
+
+def get_menu_payload(vendor_type):
+    """Cached `build_menu_payload` for the current menu version"""
+    return cache_utils.get_or_build(
+        MENU_NAMESPACE, ('payload', vendor_type),
+        lambda: build_menu_payload(vendor_type),
+        getattr(settings, 'MENU_CACHE_TTL', 3600),
+    )
+
+
+def _clean_value(field, value):
+    if field == 'is_available':
+        if not isinstance(value, bool):
+            raise MenuUpdateError('is_available must be true or false')
+        return value
+    if field == 'price':
+        try:
+            price = Decimal(str(value)).quantize(Decimal('0.01'))
+        except (InvalidOperation, ValueError):
+            raise MenuUpdateError(f'Invalid price: {value}')
+        if price < Decimal('0.01'):
+            raise MenuUpdateError('price must be at least 0.01')
+        return price
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise MenuUpdateError(f'{field} must be a whole number')
+    if number < 0:
+        raise MenuUpdateError(f'{field} must not be negative')
+    return number
+
+
+def parse_updates(data):
+    """
+    Normalise a bulk edit request into {item_id: {field: value}}.
+
+    Accepts either per-item changes, `{"updates": [{"id": 1, "price": "4.50"}, ...]}`,
+    or one change for many items, `{"item_ids": [1, 2], "changes": {"is_available": false}}`.
+    """
+    if 'item_ids' in data:
+        updates = [{'id': item_id, **data.get('changes', {})} for item_id in data['item_ids']]
+    else:
+        updates = data.get('updates')
+    if not isinstance(updates, list) or not updates:
+        raise MenuUpdateError('No menu updates given')
+
+    limit = getattr(settings, 'MENU_BULK_UPDATE_LIMIT', 500)
+    if len(updates) > limit:
+        raise MenuUpdateError(f'At most {limit} items can be updated at once')
+
+    changes = {}
+    for update in updates:
+        try:
+            item_id = int(update['id'])
+        except (KeyError, TypeError, ValueError):
+            raise MenuUpdateError('Every update needs an item id')
+        unknown = set(update) - {'id', *EDITABLE_FIELDS}
+        if unknown:
+            raise MenuUpdateError(f"Cannot update {', '.join(sorted(unknown))}")
+        fields = {field: _clean_value(field, update[field]) for field in EDITABLE_FIELDS if field in update}
+        if not fields:
+            raise MenuUpdateError(f'No changes given for item {item_id}')
+        changes.setdefault(item_id, {}).update(fields)
+    return changes
+
+
+def apply_menu_updates(vendor, changes):
+    """
+    Apply {item_id: {field: value}} to `vendor`'s items in one transaction.
+
+    Returns the delta actually applied, as a list of item dicts with their new
+    values; items whose values were already as requested are left out.
+    """
+    from .models import MenuItem
+
+    with transaction.atomic():
+        items = list(
+            MenuItem.objects.select_for_update(of=('self',))
+            .filter(category__vendor=vendor, id__in=changes)
+        )
+        missing = set(changes) - {item.id for item in items}
+        if missing:
+            raise MenuUpdateError(f"Menu items not found for this vendor: {', '.join(map(str, sorted(missing)))}")
+
+        now = timezone.now()
+        changed_items = []
+        changed_fields = set()
+        for item in items:
+            fields = [field for field, value in changes[item.id].items() if getattr(item, field) != value]
+            if not fields:
+                continue
+            for field in fields:
+                setattr(item, field, changes[item.id][field])
+            item.updated_at = now
+            changed_items.append(item)
+            changed_fields.update(fields)
+
+        if not changed_items:
+            return []
+
+        # One statement for every item; bulk_update skips the per-item save signals
+        MenuItem.objects.bulk_update(changed_items, [*sorted(changed_fields), 'updated_at'])
+
+        delta = [
+            {
+                'id': item.id,
+                'category_id': item.category_id,
+                'name': item.name,
+                'is_available': item.is_available,
+                'price': str(item.price),
+                'preparation_time': item.preparation_time,
+                'sort_order': item.sort_order,
+            }
+            for item in changed_items
+        ]
+        bump_menu_version()
+        transaction.on_commit(lambda: notify_menu_update(vendor.id, delta))
+
+    logger.info(f"Bulk menu update for vendor {vendor.id}: {len(delta)} items ({', '.join(sorted(changed_fields))})")
+    return delta
+
+
+def notify_menu_update(vendor_id, delta):
+    """Broadcast one menu_update event with every changed item"""
+    from orders import presence
+
+    if not presence.has_listeners(MENU_GROUP):
+        return
+
+    try:
+        async_to_sync(get_channel_layer().group_send)(MENU_GROUP, {
+            'type': 'menu_update',
+            'version': menu_version(),
+            'vendor_id': vendor_id,
+            'items': delta,
+        })
+    except Exception as e:
+        logger.error(f"Error sending menu_update notification: {e}", exc_info=True)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:23
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendors', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vendor',
+            name='parallel_capacity',
+            field=models.PositiveSmallIntegerField(default=1, help_text='How many orders this stall can prepare at the same time (used for ready-time estimates)', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 
@@ -16,6 +17,10 @@ class Vendor(models.Model):
     is_active = models.BooleanField(default=True)
     opening_time = models.TimeField(null=True, blank=True)
     closing_time = models.TimeField(null=True, blank=True)
+    parallel_capacity = models.PositiveSmallIntegerField(
+        default=1, validators=[MinValueValidator(1)],
+        help_text="How many orders this stall can prepare at the same time (used for ready-time estimates)"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -92,8 +97,8 @@ class Table(models.Model):
 
     @property
     def is_occupied(self):
-        from orders.models import Order
-        return Order.objects.filter(
-            table=self,
-            status__in=['pending', 'confirmed', 'preparing']
-        ).exists()
+        # Read from the materialized orders.TableState (select_related('state') to avoid a query)
+        try:
+            return self.state.kitchen_count > 0
+        except ObjectDoesNotExist:
+            return False
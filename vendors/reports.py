@@ -0,0 +1,140 @@
+"""
+Vendor payment report engine.
+
+Paid figures (totals, daily buckets, top items, payment methods) are SQL
+aggregates over the hourly `orders.SalesRollup` rows; unpaid figures are one
+conditional aggregate over the vendor's open order items. All money stays in
+`Decimal` end to end.
+
+Reports are cached per (vendor, start, end). A range that ends before today
+can only change when an old order is paid late, so it is simply cached for
+VENDOR_REPORT_HISTORY_TTL. Ranges that include today also carry the vendor's
+report version in their key; `invalidate_vendor_reports` bumps that version,
+which retires today's reports without touching historical ones.
+"""
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Sum
+
+from core import cache as cache_utils
+from orders import business_dates, rollups
+from orders.models import OrderItem, SalesRollup
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+UNPAID_STATUSES = ('pending', 'confirmed', 'preparing', 'ready', 'delivered')
+PAYMENT_METHODS = ('cash', 'card', 'mobile', 'other')
+
+
+def _money(amount):
+    return Decimal(amount or 0).quantize(CENT)
+
+
+def _namespace(vendor_id):
+    return f'vendor_report:{vendor_id}'
+
+
+def invalidate_vendor_reports(vendor_ids):
+    """Retire cached reports covering today for these vendors, once the transaction commits"""
+    cache_utils.invalidate(*map(_namespace, set(vendor_ids)))
+
+
+def build_vendor_payment_report(vendor, start_date, end_date):
+    """Compute the payment report for `vendor` between two dates (inclusive)"""
+    vendor_rollups = SalesRollup.objects.filter(
+        vendor=vendor,
+        business_date__range=[start_date, end_date]
+    )
+    vendor_totals = vendor_rollups.filter(menu_item__isnull=True)
+
+    paid = vendor_totals.aggregate(
+        revenue=Sum('revenue'), orders=Sum('order_count'), quantity=Sum('quantity')
+    )
+    paid_revenue = _money(paid['revenue'])
+    paid_orders = paid['orders'] or 0
+
+    unpaid_items = OrderItem.objects.filter(
+        vendor=vendor,
+        order__status__in=UNPAID_STATUSES,
+        **business_dates.on_dates(start_date, end_date, prefix='order__')
+    )
+    unpaid = unpaid_items.aggregate(revenue=Sum('subtotal'), orders=Count('order', distinct=True))
+    unpaid_revenue = _money(unpaid['revenue'])
+
+    daily_revenue = {
+        day.isoformat(): _money(revenue)
+        for day, revenue in vendor_totals.values_list('business_date')
+        .annotate(total=Sum('revenue'))
+        .order_by('business_date')
+    }
+
+    top_items = sorted(
+        rollups.item_totals(vendor_rollups),
+        key=lambda item: item['revenue'],
+        reverse=True
+    )[:10]
+
+    payment_methods = {method: Decimal('0.00') for method in PAYMENT_METHODS}
+    for method, amount in rollups.payment_method_totals(vendor_totals).items():
+        payment_methods[method] = payment_methods.get(method, Decimal('0.00')) + amount
+
+    unpaid_orders_detail = [
+        {
+            'order_id': str(item.order.id)[:8],
+            'table_number': item.order.table.number,
+            'status': item.order.status,
+            'vendor_amount': item.subtotal,
+            'created_at': item.order.created_at.isoformat(),
+            'customer_name': item.order.customer_name
+        }
+        for item in unpaid_items.select_related('order__table').order_by('-order__created_at')[:20]
+    ]
+
+    return {
+        'vendor_id': vendor.id,
+        'vendor_name': vendor.name,
+        'date_range': {
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat()
+        },
+        'summary': {
+            'paid_revenue': paid_revenue,
+            'unpaid_revenue': unpaid_revenue,
+            'total_revenue': paid_revenue + unpaid_revenue,
+            'paid_orders': paid_orders,
+            'unpaid_orders': unpaid['orders'],
+            'total_items_sold': paid['quantity'] or 0,
+            'average_order_value': (paid_revenue / paid_orders).quantize(CENT) if paid_orders else Decimal('0.00')
+        },
+        'daily_revenue': daily_revenue,
+        'max_daily_revenue': max(daily_revenue.values(), default=Decimal('0.00')),
+        'payment_methods': payment_methods,
+        'top_items': [
+            {
+                'name': item['name'],
+                'quantity': item['quantity'],
+                'revenue': item['revenue'],
+                'orders': item['orders']
+            }
+            for item in top_items
+        ],
+        'unpaid_orders_detail': unpaid_orders_detail,
+    }
+
+
+def get_vendor_payment_report(vendor, start_date, end_date):
+    """Cached vendor payment report; see module docstring for invalidation"""
+    if end_date >= business_dates.current_business_date():
+        timeout = getattr(settings, 'VENDOR_REPORT_TTL', 300)
+        versioned = True
+    else:
+        timeout = getattr(settings, 'VENDOR_REPORT_HISTORY_TTL', 3600)
+        versioned = False
+    return cache_utils.get_or_build(
+        _namespace(vendor.id), (start_date.isoformat(), end_date.isoformat()),
+        lambda: build_vendor_payment_report(vendor, start_date, end_date),
+        timeout, versioned=versioned,
+    )
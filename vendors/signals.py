@@ -0,0 +1,15 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Vendor, Category, MenuItem
+from .menu import bump_menu_version
+
+
+@receiver(post_save, sender=Vendor)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=Vendor)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=MenuItem)
+def menu_changed(sender, **kwargs):
+    """Any single menu save retires the cached customer menu"""
+    bump_menu_version()
@@ -15,5 +15,8 @@ urlpatterns = [
     # AJAX endpoints for vendor operations
     path('<int:vendor_id>/api/update-order-status/', views.update_order_status, name='update_order_status'),
     path('<int:vendor_id>/api/payment-report/', views.vendor_payment_report, name='vendor_payment_report'),
+    path('<int:vendor_id>/api/paid-orders/', views.vendor_paid_orders, name='vendor_paid_orders'),
+    path('<int:vendor_id>/api/sales-export/', views.vendor_sales_export, name='vendor_sales_export'),
     path('<int:vendor_id>/api/toggle-menu-item/', views.toggle_menu_item, name='toggle_menu_item'),
+    path('<int:vendor_id>/api/menu/bulk-update/', views.bulk_update_menu, name='bulk_update_menu'),
 ]
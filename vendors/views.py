@@ -4,10 +4,15 @@ from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
 from django.contrib import messages
-from django.db.models import Q, Count
-from django.utils import timezone
+from django.db.models import Q, Count, Sum, Prefetch
 from .models import Vendor, MenuItem, Category
+from . import reports
+from .menu import MenuUpdateError, apply_menu_updates, parse_updates
 from orders.models import Order, OrderItem, OrderStatus
+from core.db_router import read_from_replica
+from orders.pagination import keyset_paginate
+from orders import archive, business_dates, exports
+from decimal import Decimal
 import json
 from django.core.serializers.json import DjangoJSONEncoder
 
@@ -49,15 +54,9 @@ def vendor_dashboard(request, vendor_id):
 
     # Get current orders for this vendor (including delivered orders for payment tracking)
     current_orders = OrderItem.objects.filter(
-        menu_item__category__vendor=vendor,
+        vendor=vendor,
         order__status__in=['pending', 'confirmed', 'preparing', 'ready', 'delivered']
-    ).select_related('order', 'menu_item').order_by('-order__created_at')
-
-    # Get paid orders for revenue tracking
-    paid_orders = OrderItem.objects.filter(
-        menu_item__category__vendor=vendor,
-        order__status='paid'
-    ).select_related('order', 'menu_item').order_by('-order__created_at')
+    ).select_related('order__table', 'menu_item').order_by('-order__created_at')
 
     # Group orders by order ID and serialize data
     orders_dict = {}
@@ -87,75 +86,34 @@ def vendor_dashboard(request, vendor_id):
 
     orders = list(orders_dict.values())
 
-    # Process paid orders for revenue tracking
-    paid_orders_dict = {}
-    for item in paid_orders:
-        order_id = item.order.id
-        if order_id not in paid_orders_dict:
-            paid_orders_dict[order_id] = {
-                'order': {
-                    'id': str(item.order.id),
-                    'table_number': item.order.table.number,
-                    'status': item.order.status,
-                    'total_amount': str(item.order.total_amount),
-                    'customer_name': item.order.customer_name,
-                    'created_at': item.order.created_at.isoformat(),
-                    'paid_at': item.order.paid_at.isoformat() if item.order.paid_at else None,
-                    'notes': item.order.notes
-                },
-                'items': [],
-                'vendor_total': 0
-            }
-
-        vendor_item_total = item.subtotal
-        paid_orders_dict[order_id]['vendor_total'] += float(vendor_item_total)
-        paid_orders_dict[order_id]['items'].append({
-            'id': item.id,
-            'name': item.menu_item.name,
-            'quantity': item.quantity,
-            'subtotal': str(item.subtotal),
-            'special_instructions': item.special_instructions,
-        })
-
-    paid_orders_list = list(paid_orders_dict.values())
-
-    # Get statistics
-    today = timezone.now().date()
-
-    # Calculate vendor-specific revenue
-    today_paid_items = OrderItem.objects.filter(
-        menu_item__category__vendor=vendor,
-        order__status='paid',
-        order__created_at__date=today
-    )
-    today_revenue = sum(float(item.subtotal) for item in today_paid_items)
-
-    # Calculate unpaid revenue (delivered orders ready for payment)
-    unpaid_items = OrderItem.objects.filter(
-        menu_item__category__vendor=vendor,
-        order__status__in=['delivered', 'ready']
+    # Today's summary in one aggregate; paid history is loaded on demand via vendor_paid_orders
+    placed_today = Q(**business_dates.on_dates(business_dates.current_business_date(), prefix='order__'))
+    paid_today = placed_today & Q(order__status='paid')
+    unpaid = Q(order__status__in=['delivered', 'ready'])
+    summary = OrderItem.objects.filter(
+        placed_today | unpaid,
+        vendor=vendor
+    ).aggregate(
+        todays_orders=Count('id', filter=placed_today),
+        paid_orders_today=Count('order', filter=paid_today, distinct=True),
+        today_revenue=Sum('subtotal', filter=paid_today),
+        unpaid_revenue=Sum('subtotal', filter=unpaid),
     )
-    unpaid_revenue = sum(float(item.subtotal) for item in unpaid_items)
 
     stats = {
         'pending_orders': len([o for o in orders if o['order']['status'] == 'pending']),
         'preparing_orders': len([o for o in orders if o['order']['status'] == 'preparing']),
         'ready_orders': len([o for o in orders if o['order']['status'] == 'ready']),
         'delivered_orders': len([o for o in orders if o['order']['status'] == 'delivered']),
-        'paid_orders_today': len([o for o in paid_orders_list if o['order']['created_at'][:10] == str(today)]),
-        'todays_orders': OrderItem.objects.filter(
-            menu_item__category__vendor=vendor,
-            order__created_at__date=today
-        ).count(),
-        'today_revenue': round(today_revenue, 2),
-        'unpaid_revenue': round(unpaid_revenue, 2),
-        'total_paid_orders': len(paid_orders_list)
+        'paid_orders_today': summary['paid_orders_today'],
+        'todays_orders': summary['todays_orders'],
+        'today_revenue': round(float(summary['today_revenue'] or 0), 2),
+        'unpaid_revenue': round(float(summary['unpaid_revenue'] or 0), 2),
     }
 
     context = {
         'vendor': vendor,
         'orders': json.dumps(orders, cls=DjangoJSONEncoder),
-        'paid_orders': paid_orders_list,
         'stats': stats
     }
 
@@ -211,7 +169,7 @@ def update_order_status(request, vendor_id):
         # Verify this vendor has items in this order
         vendor_items = OrderItem.objects.filter(
             order=order,
-            menu_item__category__vendor=vendor
+            vendor=vendor
         )
 
         if not vendor_items.exists():
@@ -233,6 +191,7 @@ def update_order_status(request, vendor_id):
         return JsonResponse({'error': str(e)}, status=500)
 
 @login_required
+@read_from_replica
 def vendor_payment_report(request, vendor_id):
     """Vendor payment report page"""
     try:
@@ -243,127 +202,122 @@ def vendor_payment_report(request, vendor_id):
             messages.error(request, 'You do not have permission to view this report')
             return redirect('vendors:vendor_dashboard', vendor_id=vendor_id)
 
-        # Get date range from request
-        from datetime import datetime, timedelta
-        end_date = datetime.now().date()
-        start_date = end_date - timedelta(days=30)  # Default to last 30 days
+        # Get date range from request (default: the last 30 days and today)
+        start_date, end_date = business_dates.parse_date_range(request.GET, default_days=31)
 
-        if request.GET.get('start_date'):
-            start_date = datetime.strptime(request.GET.get('start_date'), '%Y-%m-%d').date()
-        if request.GET.get('end_date'):
-            end_date = datetime.strptime(request.GET.get('end_date'), '%Y-%m-%d').date()
+        report = reports.get_vendor_payment_report(vendor, start_date, end_date)
 
-        # Get vendor items in date range
-        vendor_items = OrderItem.objects.filter(
-            menu_item__category__vendor=vendor,
-            order__created_at__date__range=[start_date, end_date]
-        ).select_related('order', 'menu_item')
-
-        # Separate paid and unpaid
-        paid_items = vendor_items.filter(order__status='paid')
-        unpaid_items = vendor_items.filter(order__status__in=['pending', 'confirmed', 'preparing', 'ready', 'delivered'])
-
-        # Calculate totals
-        paid_revenue = sum(float(item.subtotal) for item in paid_items)
-        unpaid_revenue = sum(float(item.subtotal) for item in unpaid_items)
-
-        # Group by date for trend analysis
-        daily_revenue = {}
-        for item in paid_items:
-            date_key = item.order.created_at.date().isoformat()
-            if date_key not in daily_revenue:
-                daily_revenue[date_key] = 0
-            daily_revenue[date_key] += float(item.subtotal)
-
-        # Top selling items
-        from collections import defaultdict
-        item_sales = defaultdict(lambda: {'quantity': 0, 'revenue': 0, 'orders': 0})
-        order_ids = set()
-
-        for item in paid_items:
-            key = item.menu_item.name
-            item_sales[key]['quantity'] += item.quantity
-            item_sales[key]['revenue'] += float(item.subtotal)
-            if item.order.id not in order_ids:
-                item_sales[key]['orders'] += 1
-                order_ids.add(item.order.id)
-
-        top_items = sorted(
-            item_sales.items(),
-            key=lambda x: x[1]['revenue'],
-            reverse=True
-        )[:10]
-
-        # Payment method breakdown (from order notes)
-        payment_methods = {'cash': 0, 'card': 0, 'mobile': 0, 'other': 0}
-        for item in paid_items:
-            payment_amount = float(item.subtotal)
-            if 'cash' in item.order.notes.lower():
-                payment_methods['cash'] += payment_amount
-            elif 'card' in item.order.notes.lower():
-                payment_methods['card'] += payment_amount
-            elif 'mobile' in item.order.notes.lower():
-                payment_methods['mobile'] += payment_amount
-            else:
-                payment_methods['other'] += payment_amount
-
-        report_data = {
-            'vendor_name': vendor.name,
-            'date_range': {
-                'start': start_date.isoformat(),
-                'end': end_date.isoformat()
-            },
-            'summary': {
-                'paid_revenue': round(paid_revenue, 2),
-                'unpaid_revenue': round(unpaid_revenue, 2),
-                'total_revenue': round(paid_revenue + unpaid_revenue, 2),
-                'paid_orders': len(set(item.order.id for item in paid_items)),
-                'unpaid_orders': len(set(item.order.id for item in unpaid_items)),
-                'total_items_sold': sum(item.quantity for item in paid_items),
-                'average_order_value': round(paid_revenue / len(set(item.order.id for item in paid_items)) if paid_items else 0, 2)
-            },
-            'daily_revenue': daily_revenue,
-            'payment_methods': payment_methods,
-            'top_items': [
-                {
-                    'name': name,
-                    'quantity': data['quantity'],
-                    'revenue': round(data['revenue'], 2),
-                    'orders': data['orders']
-                }
-                for name, data in top_items
-            ],
-            'unpaid_orders_detail': [
-                {
-                    'order_id': str(item.order.id)[:8],
-                    'table_number': item.order.table.number,
-                    'status': item.order.status,
-                    'vendor_amount': float(item.subtotal),
-                    'created_at': item.order.created_at.isoformat(),
-                    'customer_name': item.order.customer_name
-                }
-                for item in unpaid_items.order_by('-order__created_at')[:20]  # Latest 20
-            ]
+        context = {
+            'vendor': vendor,
+            'date_range': report['date_range'],
+            'summary': report['summary'],
+            'daily_revenue': sorted(report['daily_revenue'].items()),
+            'max_daily_revenue': report['max_daily_revenue'],
+            'payment_methods': report['payment_methods'],
+            'top_items': report['top_items'],
+            'unpaid_orders_detail': report['unpaid_orders_detail']
         }
 
-        # Calculate max daily revenue for chart scaling
-        max_daily_revenue = max(daily_revenue.values()) if daily_revenue else 0
+        return render(request, 'vendors/payment_report.html', context)
 
-        context = {
-            'vendor': vendor,
-            'date_range': {
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+PAID_HISTORY_WINDOWS = (1, 7, 30, 90)
+PAID_HISTORY_PAGE_SIZE = 20
+
+def vendor_paid_orders_in(tables, vendor, start_date, end_date):
+    """Paid orders with this vendor's items prefetched as `vendor_items`, from the hot or archive tables"""
+    vendor_items = tables.item.objects.filter(vendor=vendor).select_related('menu_item')
+    return tables.order.objects.filter(
+        status='paid',
+        id__in=vendor_items.values('order_id'),
+        **business_dates.on_dates(start_date, end_date)
+    ).select_related('table').prefetch_related(
+        Prefetch('items', queryset=vendor_items, to_attr='vendor_items')
+    )
+
+@login_required
+def vendor_paid_orders(request, vendor_id):
+    """Paginated JSON history of this vendor's paid orders, newest first"""
+    try:
+        vendor = get_object_or_404(Vendor, id=vendor_id)
+
+        if vendor.owner != request.user and not request.user.is_staff:
+            return JsonResponse({'error': 'You do not have permission to view this vendor'}, status=403)
+
+        # Date window: ?days=N (one of PAID_HISTORY_WINDOWS) or an explicit start_date/end_date
+        days = int(request.GET.get('days', 1))
+        if days not in PAID_HISTORY_WINDOWS:
+            return JsonResponse({'error': f'days must be one of {list(PAID_HISTORY_WINDOWS)}'}, status=400)
+        start_date, end_date = business_dates.parse_date_range(request.GET, default_days=days)
+
+        # Live and archived orders, merged by the paginator
+        per_page = min(int(request.GET.get('per_page', PAID_HISTORY_PAGE_SIZE)), 50)
+        page = keyset_paginate(
+            vendor_paid_orders_in(archive.tables(), vendor, start_date, end_date),
+            request.GET.get('cursor'),
+            per_page,
+            archived=vendor_paid_orders_in(archive.tables(archived=True), vendor, start_date, end_date),
+        )
+
+        paid_orders = []
+        for order in page:
+            paid_orders.append({
+                'order': {
+                    'id': str(order.id),
+                    'table_number': order.table.number,
+                    'status': order.status,
+                    'total_amount': str(order.total_amount),
+                    'customer_name': order.customer_name,
+                    'created_at': order.created_at.isoformat(),
+                    'paid_at': order.paid_at.isoformat() if order.paid_at else None,
+                    'notes': order.notes
+                },
+                'items': [
+                    {
+                        'id': item.id,
+                        'name': item.menu_item.name,
+                        'quantity': item.quantity,
+                        'subtotal': str(item.subtotal),
+                        'special_instructions': item.special_instructions,
+                    }
+                    for item in order.vendor_items
+                ],
+                'vendor_total': str(sum((item.subtotal for item in order.vendor_items), Decimal('0.00')))
+            })
+
+        return JsonResponse({
+            'orders': paid_orders,
+            'next_cursor': page.next_cursor,
+            'has_next': page.has_next,
+            'window': {
                 'start': start_date.isoformat(),
                 'end': end_date.isoformat()
-            },
-            'summary': report_data['summary'],
-            'daily_revenue': sorted(daily_revenue.items()),
-            'max_daily_revenue': max_daily_revenue,
-            'payment_methods': payment_methods,
-            'top_items': report_data['top_items'],
-            'unpaid_orders_detail': report_data['unpaid_orders_detail']
-        }
+            }
+        })
 
-        return render(request, 'vendors/payment_report.html', context)
+    except ValueError as e:
+        return JsonResponse({'error': f'Invalid parameter: {e}'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@login_required
+@read_from_replica
+def vendor_sales_export(request, vendor_id):
+    """Stream this vendor's order item lines as CSV (or XLSX) for a date range"""
+    try:
+        vendor = get_object_or_404(Vendor, id=vendor_id)
+
+        if vendor.owner != request.user and not request.user.is_staff:
+            return JsonResponse({'error': 'You do not have permission to export this vendor'}, status=403)
+
+        try:
+            start_date, end_date, export_format = exports.parse_export_request(request.GET, default_days=30)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        return exports.export_response('order_items', start_date, end_date, vendor.id, export_format)
 
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -403,7 +357,7 @@ def toggle_menu_item(request, vendor_id):
 
         menu_item = get_object_or_404(MenuItem, id=item_id, category__vendor=vendor)
         menu_item.is_available = not menu_item.is_available
-        menu_item.save()
+        apply_menu_updates(vendor, {menu_item.id: {'is_available': menu_item.is_available}})
 
         return JsonResponse({
             'success': True,
@@ -415,6 +369,33 @@ def toggle_menu_item(request, vendor_id):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+@login_required
+@require_http_methods(["POST"])
+def bulk_update_menu(request, vendor_id):
+    """Change availability, price, prep time or sort order of many items at once"""
+    try:
+        vendor = get_object_or_404(Vendor, id=vendor_id)
+
+        # Check permission
+        if vendor.owner != request.user and not request.user.is_staff:
+            return JsonResponse({'error': 'Permission denied'}, status=403)
+
+        try:
+            changes = parse_updates(json.loads(request.body))
+            delta = apply_menu_updates(vendor, changes)
+        except (MenuUpdateError, json.JSONDecodeError) as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        return JsonResponse({
+            'success': True,
+            'updated': len(delta),
+            'items': delta,
+            'message': f'{len(delta)} menu item{"s" if len(delta) != 1 else ""} updated'
+        })
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
 @login_required
 def debug_dashboard(request, vendor_id):
     """Debug version of vendor dashboard to isolate issues"""
@@ -427,7 +408,7 @@ def debug_dashboard(request, vendor_id):
 
     # Get current orders for this vendor (same logic as main dashboard)
     current_orders = OrderItem.objects.filter(
-        menu_item__category__vendor=vendor,
+        vendor=vendor,
         order__status__in=['pending', 'confirmed', 'preparing', 'ready', 'delivered']
     ).select_related('order', 'menu_item').order_by('-order__created_at')
 
@@ -0,0 +1,492 @@
+#!/usr/bin/env python
+"""
+WebSocket Fan-out Benchmark for River Side Food Court
+
+Spins up N simulated table clients, M vendor tablets and K cashier screens,
+replays an order workload (create orders, then walk them through their status
+lifecycle) and reports connect time, snapshot time and event fan-out latency
+at p50/p95/p99 plus throughput. Results are written as JSON so runs can be
+compared.
+
+Transports:
+    communicator  In-process channels WebsocketCommunicator clients (default)
+    daphne        Real sockets to a running daphne (requires --layer redis so
+                  the workload's signals reach the server process)
+
+Channel layers:
+    memory        InMemoryChannelLayer (communicator transport only)
+    redis         RedisChannelLayer at --redis-url; --spawn-redis starts a
+                  throwaway local redis-server on that port for the run
+
+Examples:
+    python websocket_benchmark.py --tables 50 --vendors 5 --cashiers 2 --orders 200
+    python websocket_benchmark.py --layer redis --spawn-redis --output redis.json
+    python websocket_benchmark.py --transport daphne --layer redis --url ws://127.0.0.1:8000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlparse
+
+BENCHMARK_TAG = '[BENCHMARK]'
+LIFECYCLE = ['confirmed', 'preparing', 'ready', 'delivered', 'paid']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='WebSocket fan-out load test and latency benchmark')
+    parser.add_argument('--tables', type=int, default=20, help='Simulated table clients (N)')
+    parser.add_argument('--vendors', type=int, default=5, help='Simulated vendor tablets (M)')
+    parser.add_argument('--cashiers', type=int, default=2, help='Simulated cashier screens (K)')
+    parser.add_argument('--orders', type=int, default=50, help='Orders to replay')
+    parser.add_argument('--rate', type=float, default=5.0, help='New orders per second')
+    parser.add_argument('--items', type=int, default=3, help='Maximum items per order')
+    parser.add_argument('--step-delay', type=float, default=0.5, help='Seconds between lifecycle transitions')
+    parser.add_argument('--lifecycle', default=','.join(LIFECYCLE), help='Comma-separated statuses each order walks through')
+    parser.add_argument('--settle', type=float, default=2.0, help='Seconds to wait for trailing events')
+    parser.add_argument('--transport', choices=['communicator', 'daphne'], default='communicator')
+    parser.add_argument('--url', default='ws://127.0.0.1:8000', help='Base URL for --transport daphne')
+    parser.add_argument('--layer', choices=['memory', 'redis'], default='memory')
+    parser.add_argument('--redis-url', default='redis://127.0.0.1:6379/0')
+    parser.add_argument('--spawn-redis', action='store_true', help='Start a temporary local redis-server')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--keep-orders', action='store_true', help="Don't delete benchmark orders afterwards")
+    parser.add_argument('--output', default=None, help='Write JSON results to this file')
+    return parser.parse_args()
+
+
+def configure_django(args):
+    """Point Django at the requested channel layer before apps (and signals) load"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    from django.conf import settings
+
+    if args.layer == 'redis':
+        parsed = urlparse(args.redis_url)
+        settings.CHANNEL_LAYERS = {
+            'default': {
+                'BACKEND': 'channels_redis.core.RedisChannelLayer',
+                'CONFIG': {'hosts': [args.redis_url], 'capacity': 1500, 'expiry': 60},
+            }
+        }
+        settings.REDIS_URL = args.redis_url
+        print(f"📡 Channel layer: RedisChannelLayer at {parsed.hostname}:{parsed.port or 6379}")
+    else:
+        settings.CHANNEL_LAYERS = {
+            'default': {
+                'BACKEND': 'channels.layers.InMemoryChannelLayer',
+                'CONFIG': {'capacity': 300, 'expiry': 60},
+            }
+        }
+        print("📡 Channel layer: InMemoryChannelLayer")
+
+    import django
+    django.setup()
+
+
+def spawn_redis(redis_url):
+    binary = shutil.which('redis-server')
+    if not binary:
+        print("❌ --spawn-redis requested but redis-server is not on PATH")
+        sys.exit(1)
+    port = urlparse(redis_url).port or 6379
+    process = subprocess.Popen(
+        [binary, '--port', str(port), '--save', '', '--appendonly', 'no'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    import redis
+    client = redis.Redis.from_url(redis_url)
+    for _ in range(50):
+        try:
+            client.ping()
+            print(f"🚀 Started local redis-server on port {port}")
+            return process
+        except redis.ConnectionError:
+            time.sleep(0.1)
+    process.terminate()
+    print("❌ redis-server did not start")
+    sys.exit(1)
+
+
+def percentiles(values):
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def rank(p):
+        index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+        return round(ordered[index] * 1000, 2)
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 2),
+        'p50_ms': rank(50),
+        'p95_ms': rank(95),
+        'p99_ms': rank(99),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+
+def event_key(message):
+    """Extract (order_id, status) from any order-bearing WebSocket message"""
+    order = message.get('order')
+    if isinstance(order, dict) and isinstance(order.get('order'), dict):
+        order = order['order']  # new_order_for_vendor nests the order
+    if isinstance(order, dict) and order.get('id'):
+        return order['id'], order.get('status')
+    if message.get('order_id'):
+        return message['order_id'], message.get('status')
+    return None
+
+
+class Recorder:
+    """Collects timings shared by all simulated clients"""
+
+    def __init__(self):
+        self.connect_times = {'table': [], 'vendor': [], 'cashier': []}
+        self.snapshot_times = {'table': [], 'vendor': [], 'cashier': []}
+        self.fanout = {'table': [], 'vendor': [], 'cashier': []}
+        self.emitted = {}
+        self.messages = 0
+        self.failed_connects = 0
+
+    def emit(self, order_id, status):
+        self.emitted.setdefault((str(order_id), status), time.perf_counter())
+
+
+class SimulatedClient:
+    def __init__(self, kind, path, recorder):
+        self.kind = kind
+        self.path = path
+        self.recorder = recorder
+        self.seen = set()
+        self.connection = None
+        self.reader = None
+
+    async def run(self, open_connection):
+        started = time.perf_counter()
+        try:
+            self.connection = await open_connection(self.path, self.kind)
+        except Exception as e:
+            print(f"   ❌ {self.kind} client {self.path} failed to connect: {e}")
+            self.recorder.failed_connects += 1
+            return
+        self.recorder.connect_times[self.kind].append(time.perf_counter() - started)
+
+        snapshot = await self.connection.receive()
+        if snapshot.get('type') == 'order_list':
+            self.recorder.snapshot_times[self.kind].append(time.perf_counter() - started)
+        self.reader = asyncio.ensure_future(self.read_forever())
+
+    async def read_forever(self):
+        try:
+            while True:
+                message = await self.connection.receive()
+                received = time.perf_counter()
+                self.recorder.messages += 1
+                key = event_key(message)
+                if key is None or key in self.seen:
+                    continue
+                emitted = self.recorder.emitted.get(key)
+                if emitted is not None:
+                    self.seen.add(key)
+                    self.recorder.fanout[self.kind].append(received - emitted)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            pass
+
+    async def close(self):
+        if self.reader:
+            self.reader.cancel()
+        if self.connection:
+            await self.connection.close()
+
+
+class CommunicatorConnection:
+    def __init__(self, communicator):
+        self.communicator = communicator
+
+    async def receive(self):
+        return await self.communicator.receive_json_from(timeout=3600)
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class SocketConnection:
+    def __init__(self, socket):
+        self.socket = socket
+
+    async def receive(self):
+        return json.loads(await self.socket.recv())
+
+    async def close(self):
+        await self.socket.close()
+
+
+def make_communicator_opener(user):
+    from channels.routing import URLRouter
+    from channels.testing import WebsocketCommunicator
+    from orders.routing import websocket_urlpatterns
+
+    router = URLRouter(websocket_urlpatterns)
+
+    async def application(scope, receive, send):
+        # Bypass session auth: every simulated client acts as the benchmark user
+        return await router(dict(scope, user=user), receive, send)
+
+    async def open_connection(path, kind):
+        communicator = WebsocketCommunicator(application, path)
+        connected, _ = await communicator.connect(timeout=30)
+        if not connected:
+            raise RuntimeError('connection rejected')
+        return CommunicatorConnection(communicator)
+
+    return open_connection
+
+
+def make_socket_opener(base_url, session_key):
+    import websockets
+
+    origin = base_url.replace('ws://', 'http://').replace('wss://', 'https://')
+
+    async def open_connection(path, kind):
+        headers = {'Origin': origin}
+        if kind != 'table':
+            headers['Cookie'] = f'sessionid={session_key}'
+        socket = await websockets.connect(base_url.rstrip('/') + path, additional_headers=headers, max_size=None)
+        return SocketConnection(socket)
+
+    return open_connection
+
+
+def prepare_fixtures(args):
+    """Pick tables, vendors and menu items, and a staff user for vendor/cashier clients"""
+    from django.contrib.auth.models import User
+    from vendors.models import MenuItem, Table, Vendor
+
+    tables = list(Table.objects.filter(is_active=True).order_by('number').values_list('number', flat=True))
+    vendors = list(Vendor.objects.filter(is_active=True).values_list('id', flat=True))
+    menu_items = list(MenuItem.objects.filter(is_available=True).select_related('category'))
+    if not tables or not vendors or not menu_items:
+        print("❌ Database is missing tables, vendors or menu items")
+        print("💡 Run: python manage.py create_sample_data")
+        sys.exit(1)
+
+    user, created = User.objects.get_or_create(
+        username='ws_benchmark',
+        defaults={'is_staff': True, 'is_superuser': True}
+    )
+    if created:
+        user.set_unusable_password()
+        user.save()
+    return tables, vendors, menu_items, user
+
+
+def create_session(user):
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+    from django.contrib.sessions.backends.db import SessionStore
+
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return session.session_key
+
+
+def create_order(order_id, table_number, items):
+    from orders.models import Order, OrderItem
+    from vendors.models import Table
+
+    order = Order.objects.create(
+        id=order_id,
+        table=Table.objects.get(number=table_number),
+        customer_name='Benchmark',
+        notes=BENCHMARK_TAG,
+    )
+    for menu_item in items:
+        OrderItem.objects.create(order=order, menu_item=menu_item, quantity=1, unit_price=menu_item.price)
+
+
+def set_status(order_id, status):
+    from orders.models import Order
+
+    order = Order.objects.get(id=order_id)
+    order.status = status
+    order.save()
+
+
+def cleanup_orders():
+    from orders.models import Order
+    deleted, _ = Order.objects.filter(notes__startswith=BENCHMARK_TAG).delete()
+    return deleted
+
+
+async def replay_workload(args, recorder, table_numbers, menu_items):
+    from channels.db import database_sync_to_async
+
+    rng = random.Random(args.seed)
+    lifecycle = [status for status in args.lifecycle.split(',') if status]
+    interval = 1.0 / args.rate if args.rate > 0 else 0
+    counts = {'orders': 0, 'transitions': 0}
+
+    async def run_order(index):
+        await asyncio.sleep(index * interval)
+        table_number = rng.choice(table_numbers)
+        items = rng.sample(menu_items, k=min(len(menu_items), rng.randint(1, args.items)))
+
+        # Pick the id up front so the emit time is recorded before any message can arrive
+        order_id = uuid.uuid4()
+        recorder.emit(order_id, 'pending')
+        await database_sync_to_async(create_order)(order_id, table_number, items)
+        counts['orders'] += 1
+
+        for status in lifecycle:
+            await asyncio.sleep(args.step_delay)
+            recorder.emit(order_id, status)
+            await database_sync_to_async(set_status)(order_id, status)
+            counts['transitions'] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_order(i) for i in range(args.orders)))
+    return counts, time.perf_counter() - started
+
+
+async def run(args):
+    from channels.db import database_sync_to_async
+
+    tables, vendors, menu_items, user = await database_sync_to_async(prepare_fixtures)(args)
+    recorder = Recorder()
+
+    if args.transport == 'daphne':
+        session_key = await database_sync_to_async(create_session)(user)
+        open_connection = make_socket_opener(args.url, session_key)
+    else:
+        open_connection = make_communicator_opener(user)
+
+    clients = []
+    table_numbers = [tables[i % len(tables)] for i in range(args.tables)]
+    for number in table_numbers:
+        clients.append(SimulatedClient('table', f'/ws/orders/table/{number}/', recorder))
+    for i in range(args.vendors):
+        clients.append(SimulatedClient('vendor', f'/ws/orders/vendor/{vendors[i % len(vendors)]}/', recorder))
+    for _ in range(args.cashiers):
+        clients.append(SimulatedClient('cashier', '/ws/orders/cashier/', recorder))
+
+    print(f"🔗 Connecting {args.tables} table, {args.vendors} vendor and {args.cashiers} cashier clients...")
+    connect_started = time.perf_counter()
+    await asyncio.gather(*(client.run(open_connection) for client in clients))
+    connect_wall = time.perf_counter() - connect_started
+
+    print(f"📦 Replaying {args.orders} orders at {args.rate}/s...")
+    messages_before = recorder.messages
+    counts, workload_wall = await replay_workload(args, recorder, sorted(set(table_numbers)), menu_items)
+    await asyncio.sleep(args.settle)
+    delivered = recorder.messages - messages_before
+
+    await asyncio.gather(*(client.close() for client in clients))
+    if not args.keep_orders:
+        deleted = await database_sync_to_async(cleanup_orders)()
+        print(f"🧹 Removed {deleted} benchmark rows")
+
+    all_fanout = [value for values in recorder.fanout.values() for value in values]
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'config': {
+            'tables': args.tables,
+            'vendors': args.vendors,
+            'cashiers': args.cashiers,
+            'orders': args.orders,
+            'rate': args.rate,
+            'items': args.items,
+            'step_delay': args.step_delay,
+            'lifecycle': args.lifecycle,
+            'transport': args.transport,
+            'layer': args.layer,
+        },
+        'connect': {
+            'wall_seconds': round(connect_wall, 3),
+            'failed': recorder.failed_connects,
+            **{kind: percentiles(values) for kind, values in recorder.connect_times.items()},
+        },
+        'snapshot': {kind: percentiles(values) for kind, values in recorder.snapshot_times.items()},
+        'fanout': {
+            'all': percentiles(all_fanout),
+            **{kind: percentiles(values) for kind, values in recorder.fanout.items()},
+        },
+        'throughput': {
+            'workload_seconds': round(workload_wall, 3),
+            'orders': counts['orders'],
+            'transitions': counts['transitions'],
+            'events_per_second': round((counts['orders'] + counts['transitions']) / workload_wall, 2) if workload_wall else 0,
+            'messages_delivered': delivered,
+            'messages_per_second': round(delivered / (workload_wall + args.settle), 2),
+        },
+    }
+
+
+def print_summary(results):
+    print("\n" + "=" * 60)
+    print("📊 WebSocket Benchmark Results")
+    print("=" * 60)
+
+    def line(label, stats):
+        if not stats.get('count'):
+            print(f"   {label:<22} (no samples)")
+            return
+        print(f"   {label:<22} n={stats['count']:<6} p50={stats['p50_ms']:>8}ms  "
+              f"p95={stats['p95_ms']:>8}ms  p99={stats['p99_ms']:>8}ms")
+
+    print("\n🔗 Connect")
+    for kind in ('table', 'vendor', 'cashier'):
+        line(kind, results['connect'][kind])
+    print("\n📦 Snapshot (connect → order_list)")
+    for kind in ('table', 'vendor', 'cashier'):
+        line(kind, results['snapshot'][kind])
+    print("\n📣 Fan-out (event → client)")
+    for kind in ('all', 'table', 'vendor', 'cashier'):
+        line(kind, results['fanout'][kind])
+    throughput = results['throughput']
+    print("\n⚡ Throughput")
+    print(f"   {throughput['orders']} orders, {throughput['transitions']} transitions in {throughput['workload_seconds']}s "
+          f"({throughput['events_per_second']} events/s)")
+    print(f"   {throughput['messages_delivered']} messages delivered ({throughput['messages_per_second']} msg/s)")
+
+
+def main():
+    args = parse_args()
+    if args.transport == 'daphne' and args.layer != 'redis':
+        print("❌ --transport daphne needs --layer redis so events reach the server process")
+        sys.exit(1)
+
+    redis_process = spawn_redis(args.redis_url) if args.spawn_redis else None
+    try:
+        configure_django(args)
+        results = asyncio.run(run(args))
+    finally:
+        if redis_process:
+            redis_process.terminate()
+
+    print_summary(results)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n🛑 Benchmark interrupted by user")
+        sys.exit(1)